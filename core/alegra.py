@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+from core.http_session import get_session
+from core.json_utils import json_loads
+
+# Paginación de la API de Alegra (30 es el máximo que permite por página)
+ALEGRA_PAGE_SIZE = 30
+ALEGRA_PAGINAS_EN_PARALELO = 8
+
+def normalize_date(valor):
+    """Devolver la fecha ISO de Alegra, o None si viene vacía o no es texto"""
+    if isinstance(valor, str) and valor and not valor.isspace():
+        return valor
+    return None
+
+def safe_get_nested(obj, *keys, default=''):
+    """
+    Obtener un valor anidado de una respuesta de Alegra de forma segura.
+    
+    Se indexa directamente nivel por nivel (claves en dicts, posiciones en
+    listas); si algún nivel falta, es None o no admite la clave, se devuelve
+    el valor por defecto.
+    """
+    try:
+        for key in keys:
+            obj = obj[key]
+    except (KeyError, IndexError, TypeError):
+        return default
+    return obj if obj is not None else default
+
+def get_page(url, headers, params, start):
+    """
+    Obtener una página de un listado de la API de Alegra.
+    
+    Los 429 y 503 los reintenta la sesión compartida respetando Retry-After.
+    
+    Args:
+        url: URL del listado (ej. "https://api.alegra.com/api/v1/payments")
+        headers: Headers con la autenticación de Alegra
+        params: Parámetros de la consulta, sin start ni limit
+        start: Posición del primer registro de la página
+        
+    Returns:
+        Lista de registros de la página
+    """
+    response = get_session().get(
+        url, headers=headers, params={**params, "start": start, "limit": ALEGRA_PAGE_SIZE}
+    )
+    
+    if response.status_code != 200:
+        raise Exception(f"{response.status_code} - {response.text}")
+    
+    return json_loads(response.content)
+
+def iter_pages(url, headers, params=None):
+    """
+    Recorrer las páginas de un listado de la API de Alegra.
+    
+    Se pide la primera página y, si viene completa, las siguientes en bloques de
+    ALEGRA_PAGINAS_EN_PARALELO hasta encontrar una página incompleta. Cada página
+    se entrega apenas llega, en orden, para que el llamador la procese y la descarte.
+    Si una página falla se propaga la excepción.
+    
+    Args:
+        url: URL del listado
+        headers: Headers con la autenticación de Alegra
+        params: Parámetros de la consulta, sin start ni limit
+    """
+    params = params or {}
+    
+    pagina = get_page(url, headers, params, 0)
+    yield pagina
+    if len(pagina) < ALEGRA_PAGE_SIZE:
+        return
+    
+    start = ALEGRA_PAGE_SIZE
+    with ThreadPoolExecutor(max_workers=ALEGRA_PAGINAS_EN_PARALELO) as executor:
+        while True:
+            starts = [start + k * ALEGRA_PAGE_SIZE for k in range(ALEGRA_PAGINAS_EN_PARALELO)]
+            paginas = executor.map(lambda inicio: get_page(url, headers, params, inicio), starts)
+            
+            for pagina in paginas:
+                yield pagina
+                if len(pagina) < ALEGRA_PAGE_SIZE:
+                    return
+            
+            start += ALEGRA_PAGINAS_EN_PARALELO * ALEGRA_PAGE_SIZE
+
+def get_all_pages(url, headers, params=None):
+    """
+    Obtener todos los registros de un listado de la API de Alegra.
+    
+    Args:
+        url: URL del listado
+        headers: Headers con la autenticación de Alegra
+        params: Parámetros de la consulta, sin start ni limit
+        
+    Returns:
+        Lista con los registros de todas las páginas (la excepción de una página
+        fallida se propaga)
+    """
+    registros = []
+    for pagina in iter_pages(url, headers, params):
+        registros.extend(pagina)
+    return registros
@@ -0,0 +1,67 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Número de hilos usados para subidas concurrentes; el pool de conexiones
+# debe ser al menos de este tamaño para que ningún hilo espere un socket libre
+MAX_WORKERS = 16
+
+# Timeout por defecto (conexión, lectura) en segundos para todas las solicitudes
+DEFAULT_TIMEOUT = (5, 30)
+
+_session = None
+_session_lock = threading.Lock()
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter que aplica un timeout por defecto cuando la solicitud no define uno"""
+
+    def __init__(self, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+def create_session(pool_maxsize=MAX_WORKERS):
+    """
+    Crear una sesión HTTP con conexiones persistentes (keep-alive), reintentos
+    y timeout por defecto.
+
+    Los reintentos solo aplican a respuestas 429/503 (throttling), respetando el
+    header Retry-After. No se reintentan errores de lectura para no duplicar
+    POSTs que el servidor ya pudo haber procesado.
+
+    Args:
+        pool_maxsize: Conexiones máximas por host
+
+    Returns:
+        requests.Session configurada
+    """
+    retry = Retry(
+        total=5,
+        connect=3,
+        read=0,
+        status=5,
+        status_forcelist=(429, 503),
+        allowed_methods=None,
+        backoff_factor=0.5,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return session
+
+def get_session():
+    """Obtener la sesión HTTP compartida por todo el proceso"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
@@ -0,0 +1,36 @@
+import json
+
+# orjson es opcional: si está instalado se usa su implementación en C (bastante
+# más rápida para respuestas y payloads grandes); si no, se usa json estándar
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_loads(content):
+    """
+    Decodificar JSON desde bytes o str.
+
+    Args:
+        content: Cuerpo de la respuesta (por ejemplo response.content)
+
+    Returns:
+        Objeto Python decodificado
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def json_dumps(obj):
+    """
+    Codificar un objeto a JSON en bytes, listo para enviar como cuerpo HTTP.
+
+    Args:
+        obj: Objeto serializable (dict, list, ...)
+
+    Returns:
+        bytes con el JSON codificado en UTF-8
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
@@ -0,0 +1,23 @@
+import os
+import logging
+
+def get_log_level(default=logging.INFO):
+    """
+    Leer el nivel de logging configurado en la variable de entorno LOG_LEVEL.
+    
+    Un valor que logging no reconoce no debe impedir que el script arranque,
+    así que se usa el nivel por defecto y se informa para registrarlo en el log.
+    
+    Args:
+        default: Nivel a usar si LOG_LEVEL no está definido o no es válido
+        
+    Returns:
+        Tupla (nivel, valor inválido de LOG_LEVEL o None si es válido)
+    """
+    nivel_configurado = os.getenv("LOG_LEVEL", logging.getLevelName(default)).strip().upper()
+    nivel = logging.getLevelName(nivel_configurado)
+    
+    if not isinstance(nivel, int):
+        return default, nivel_configurado
+    
+    return nivel, None
@@ -1,8 +1,65 @@
-import requests
 import os
+import json
+import time
 import logging
-from urllib.parse import urlparse
+import threading
+from collections import Counter
+from functools import lru_cache
+from types import MappingProxyType
+from urllib.parse import urlparse, quote
 from dotenv import load_dotenv
+from core.http_session import get_session
+from core.json_utils import json_dumps, json_loads
+
+# Caché del token de Azure AD, compartida por todos los conectores del proceso
+# y persistida en disco para reutilizarla entre ejecuciones programadas
+TOKEN_CACHE_FILE = os.getenv(
+    "TOKEN_CACHE_FILE",
+    os.path.join(os.path.expanduser("~"), ".cache", "alegra-sp", "token.json")
+)
+# Segundos antes de la expiración en que el token se considera vencido
+TOKEN_EXPIRY_MARGIN = 60
+
+_token_cache = {}
+_token_lock = threading.Lock()
+
+# IDs de sitios y listas ya resueltos (no cambian durante la ejecución)
+_site_id_cache = {}
+_list_id_cache = {}
+
+# Plantillas de URL de Graph usadas en cada subida
+GRAPH_ITEMS_URL = "https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items"
+GRAPH_BATCH_URL = "https://graph.microsoft.com/v1.0/$batch"
+
+# Máximo de solicitudes por llamada al endpoint $batch de Graph
+GRAPH_BATCH_SIZE = 20
+# Reintentos de las solicitudes de un lote que respondan 429/503
+GRAPH_BATCH_MAX_RETRIES = 3
+# Espera (segundos) si un 429/503 no trae un Retry-After numérico, y tope de espera
+GRAPH_RETRY_AFTER_DEFAULT = 2
+GRAPH_RETRY_AFTER_MAX = 60
+
+@lru_cache(maxsize=4)
+def json_headers(token):
+    """Headers de autorización + JSON para un token (inmutables, compartidos entre hilos)"""
+    return MappingProxyType({
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    })
+
+def retry_after_seconds(value):
+    """
+    Segundos a esperar según un header Retry-After.
+    
+    Solo se usa la forma en segundos; un valor ausente, con formato de fecha HTTP
+    o inválido usa GRAPH_RETRY_AFTER_DEFAULT. El resultado se limita a
+    GRAPH_RETRY_AFTER_MAX.
+    """
+    try:
+        segundos = int(value)
+    except (TypeError, ValueError):
+        segundos = GRAPH_RETRY_AFTER_DEFAULT
+    return min(max(segundos, 0), GRAPH_RETRY_AFTER_MAX)
 
 class SharePointConnector:
     def __init__(self):
@@ -18,24 +75,77 @@ class SharePointConnector:
         # Validar credenciales
         if not all(self.env.values()):
             raise ValueError("Error: Faltan credenciales de Azure AD en .env")
+        
+        # Sesión HTTP compartida (keep-alive + reintentos por throttling)
+        self.session = get_session()
+        
+        # Campos lookup resueltos por lista: {(list_id, variaciones): nombre_campo}
+        self._lookup_fields = {}
+        self._lookup_lock = threading.Lock()
 
     def get_azure_token(self):
-        """Obtener token de acceso usando Azure AD"""
-        url = f"https://login.microsoftonline.com/{self.env['tenant_id']}/oauth2/v2.0/token"
-        data = {
-            "grant_type": "client_credentials",
-            "client_id": self.env['client_id'],
-            "client_secret": self.env['client_secret'],
-            "scope": "https://graph.microsoft.com/.default",
-        }
+        """Obtener token de acceso usando Azure AD (reutiliza el token mientras no expire)"""
+        cache_key = f"{self.env['tenant_id']}:{self.env['client_id']}"
         
+        with _token_lock:
+            cached = _token_cache.get(cache_key) or self._read_token_file(cache_key)
+            if cached and time.time() < cached['exp'] - TOKEN_EXPIRY_MARGIN:
+                _token_cache[cache_key] = cached
+                return cached['access_token']
+            
+            url = f"https://login.microsoftonline.com/{self.env['tenant_id']}/oauth2/v2.0/token"
+            data = {
+                "grant_type": "client_credentials",
+                "client_id": self.env['client_id'],
+                "client_secret": self.env['client_secret'],
+                "scope": "https://graph.microsoft.com/.default",
+            }
+            
+            try:
+                response = self.session.post(url, data=data)
+                response.raise_for_status()
+                token_json = json_loads(response.content)
+            except Exception as e:
+                logging.error(f"Error al obtener token de Azure AD: {e}")
+                raise
+            
+            cached = {
+                'access_token': token_json["access_token"],
+                'exp': time.time() + int(token_json.get("expires_in", 3599)),
+            }
+            _token_cache[cache_key] = cached
+            self._write_token_file(cache_key, cached)
+            return cached['access_token']
+
+    def _read_token_file(self, cache_key):
+        """Leer el token guardado en disco, si existe"""
         try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
-            return response.json()["access_token"]
+            with open(TOKEN_CACHE_FILE, encoding='utf-8') as f:
+                return json.load(f).get(cache_key)
+        except Exception:
+            return None
+
+    def _write_token_file(self, cache_key, cached):
+        """Guardar el token en disco (solo legible por el usuario actual)"""
+        try:
+            os.makedirs(os.path.dirname(TOKEN_CACHE_FILE), exist_ok=True)
+            
+            contenido = {}
+            try:
+                with open(TOKEN_CACHE_FILE, encoding='utf-8') as f:
+                    contenido = json.load(f)
+            except Exception:
+                pass
+            contenido[cache_key] = cached
+            
+            # Escritura atómica: archivo temporal + reemplazo
+            tmp_file = f"{TOKEN_CACHE_FILE}.{os.getpid()}.tmp"
+            fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(contenido, f)
+            os.replace(tmp_file, TOKEN_CACHE_FILE)
         except Exception as e:
-            logging.error(f"Error al obtener token de Azure AD: {e}")
-            raise
+            logging.warning(f"No se pudo guardar el token en caché: {e}")
 
     def parse_site_url(self, site_url):
         """Parsear URL de SharePoint"""
@@ -45,36 +155,411 @@ class SharePointConnector:
         return hostname, path
 
     def get_site_id(self, token, site_url):
-        """Obtener ID del sitio de SharePoint"""
+        """Obtener ID del sitio de SharePoint (consultado una sola vez por sitio)"""
+        if site_url in _site_id_cache:
+            return _site_id_cache[site_url]
+        
         hostname, path = self.parse_site_url(site_url)
         url = f"https://graph.microsoft.com/v1.0/sites/{hostname}:/{path}?$select=id"
         headers = {"Authorization": f"Bearer {token}"}
         
         try:
-            response = requests.get(url, headers=headers)
+            response = self.session.get(url, headers=headers)
             response.raise_for_status()
-            return response.json()["id"]
+            site_id = json_loads(response.content)["id"]
+            _site_id_cache[site_url] = site_id
+            return site_id
         except Exception as e:
             logging.error(f"Error al obtener Site ID: {e}")
             raise
 
     def get_list_id(self, token, site_id, list_name):
-        """Obtener ID de una lista específica"""
+        """Obtener ID de una lista específica (consultado una sola vez por lista)"""
+        cache_key = (site_id, list_name)
+        if cache_key in _list_id_cache:
+            return _list_id_cache[cache_key]
+        
         url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists?$filter=displayName eq '{list_name}'"
         headers = {"Authorization": f"Bearer {token}"}
         
         try:
-            response = requests.get(url, headers=headers)
+            response = self.session.get(url, headers=headers)
             response.raise_for_status()
             
-            data = response.json()
+            data = json_loads(response.content)
             lists = data.get('value', [])
             
             if lists:
+                _list_id_cache[cache_key] = lists[0]['id']
                 return lists[0]['id']
             else:
                 logging.error(f"Lista '{list_name}' no encontrada")
                 return None
         except Exception as e:
             logging.error(f"Error al obtener ID de lista '{list_name}': {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def prefetch_ids(self, token, site_url, list_names):
+        """
+        Resolver en una sola solicitud $batch el ID del sitio y de varias listas.
+        
+        Las listas se direccionan por título a través de la ruta del sitio, así no
+        hace falta esperar el ID del sitio. Los IDs quedan en caché para
+        get_site_id/get_list_id; si algo falla, esos métodos los resuelven como siempre.
+        
+        Args:
+            token: Token de acceso
+            site_url: URL del sitio de SharePoint
+            list_names: Nombres de las listas a resolver
+        """
+        pendientes = [name for name in list_names if name]
+        if site_url in _site_id_cache:
+            site_id = _site_id_cache[site_url]
+            pendientes = [name for name in pendientes if (site_id, name) not in _list_id_cache]
+            if not pendientes:
+                return
+        
+        hostname, path = self.parse_site_url(site_url)
+        site_path = f"/sites/{hostname}:/{path}"
+        requests_batch = [{"id": "site", "method": "GET", "url": f"{site_path}?$select=id"}]
+        for i, name in enumerate(pendientes[:GRAPH_BATCH_SIZE - 1]):
+            requests_batch.append({
+                "id": str(i),
+                "method": "GET",
+                "url": f"{site_path}:/lists/{quote(name)}?$select=id",
+            })
+        
+        try:
+            response = self.session.post(
+                GRAPH_BATCH_URL,
+                headers=json_headers(token),
+                data=json_dumps({"requests": requests_batch}),
+            )
+            response.raise_for_status()
+            respuestas = {r['id']: r for r in json_loads(response.content).get('responses', [])}
+        except Exception as e:
+            logging.warning(f"No se pudieron precargar los IDs de SharePoint: {e}")
+            return
+        
+        site = respuestas.get("site")
+        if not site or site.get('status') != 200:
+            return
+        site_id = site['body']['id']
+        _site_id_cache[site_url] = site_id
+        
+        for i, name in enumerate(pendientes[:GRAPH_BATCH_SIZE - 1]):
+            respuesta = respuestas.get(str(i))
+            if respuesta and respuesta.get('status') == 200:
+                _list_id_cache[(site_id, name)] = respuesta['body']['id']
+
+    def get_lookup_field(self, token, site_id, list_id, lookup_variations):
+        """
+        Resolver qué variación de campo lookup existe en la lista consultando sus columnas.
+        
+        El esquema se consulta una sola vez por lista y el resultado queda en caché,
+        así cada item se sube con un único POST en lugar de probar cada variación.
+        
+        Args:
+            token: Token de acceso
+            site_id: ID del sitio
+            list_id: ID de la lista
+            lookup_variations: Nombres candidatos, en orden de preferencia
+            
+        Returns:
+            Nombre del campo a enviar, o None si no se pudo determinar
+        """
+        cache_key = (list_id, tuple(lookup_variations))
+        if cache_key in self._lookup_fields:
+            return self._lookup_fields[cache_key]
+        
+        with self._lookup_lock:
+            if cache_key in self._lookup_fields:
+                return self._lookup_fields[cache_key]
+            
+            url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/columns?$select=name,lookup"
+            headers = {"Authorization": f"Bearer {token}"}
+            
+            try:
+                response = self.session.get(url, headers=headers)
+                response.raise_for_status()
+                # Solo columnas de tipo lookup (las que traen la faceta 'lookup')
+                columnas = {col.get('name') for col in json_loads(response.content).get('value', []) if col.get('lookup')}
+            except Exception as e:
+                logging.error(f"Error al obtener columnas de la lista '{list_id}': {e}")
+                return None
+            
+            lookup_field = None
+            for variacion in lookup_variations:
+                # Las columnas lookup se escriben como <columna>LookupId
+                columna = variacion[:-len("LookupId")] if variacion.endswith("LookupId") else variacion
+                if columna in columnas:
+                    lookup_field = f"{columna}LookupId"
+                    break
+            
+            if not lookup_field:
+                logging.warning(f"Ninguna variación de campo lookup existe en la lista '{list_id}'")
+            
+            self._lookup_fields[cache_key] = lookup_field
+            return lookup_field
+
+    def remember_lookup_field(self, list_id, lookup_variations, lookup_field):
+        """
+        Registrar la variación de campo lookup con la que ya se creó un item.
+        
+        Se usa cuando get_lookup_field no pudo resolver el campo y hubo que probar
+        las variaciones: las siguientes subidas a la lista usan directamente la que
+        funcionó.
+        """
+        with self._lookup_lock:
+            self._lookup_fields[(list_id, tuple(lookup_variations))] = lookup_field
+
+    def get_field_values(self, token, site_id, list_id, fields, filter_expr=None):
+        """
+        Obtener las combinaciones de valores de varios campos en los items de una
+        lista, con paginación.
+        
+        Args:
+            token: Token de acceso
+            site_id: ID del sitio
+            list_id: ID de la lista
+            fields: Nombres internos de los campos a leer
+            filter_expr: Filtro OData opcional sobre fields (ej. "fields/Fecha eq '2024-01-01'")
+            
+        Returns:
+            Counter con una tupla de valores (como texto, '' si no tiene) por item,
+            o None si la consulta falló
+        """
+        url = GRAPH_ITEMS_URL.format(site_id=site_id, list_id=list_id)
+        url += f"?$expand=fields($select={','.join(fields)})&$top=5000"
+        if filter_expr:
+            url += f"&$filter={quote(filter_expr)}"
+        
+        # Permite filtrar por columnas no indexadas (listas de menos de 5000 items)
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Prefer": "HonorNonIndexedQueriesWarningMayFailRandomly",
+        }
+        
+        valores = Counter()
+        next_url = url
+        try:
+            while next_url:
+                response = self.session.get(next_url, headers=headers)
+                response.raise_for_status()
+                data = json_loads(response.content)
+                
+                for item in data.get('value', []):
+                    item_fields = item.get('fields', {})
+                    valores[tuple(
+                        '' if item_fields.get(field) is None else str(item_fields[field])
+                        for field in fields
+                    )] += 1
+                
+                next_url = data.get('@odata.nextLink')
+        except Exception as e:
+            logging.error(f"Error al leer los campos {', '.join(fields)} de la lista '{list_id}': {e}")
+            return None
+        
+        return valores
+
+    def create_item(self, token, site_id, list_id, item_data):
+        """
+        Crear un item en una lista de SharePoint.
+        
+        Returns:
+            ID del item creado
+            
+        Raises:
+            Exception: si Graph no responde 201
+        """
+        url = GRAPH_ITEMS_URL.format(site_id=site_id, list_id=list_id)
+        response = self.session.post(url, headers=json_headers(token), data=json_dumps(item_data))
+        
+        if response.status_code != 201:
+            raise Exception(f"HTTP {response.status_code} - {response.text}")
+        
+        return self.extract_item_id(json_loads(response.content))
+
+    def send_batch(self, token, requests_data):
+        """
+        Enviar solicitudes al endpoint $batch de Graph.
+        
+        Las solicitudes se envían en lotes de GRAPH_BATCH_SIZE; las que respondan
+        429/503 se reintentan respetando Retry-After.
+        
+        Args:
+            token: Token de acceso
+            requests_data: Lista de solicitudes ({'method', 'url', y opcionalmente
+                'headers' y 'body'}), con URL relativa a /v1.0
+            
+        Returns:
+            Lista con la respuesta de cada solicitud ({'status', 'headers', 'body'}),
+            o None si el lote no se pudo enviar, en el mismo orden
+        """
+        respuestas = [None] * len(requests_data)
+        headers = json_headers(token)
+        
+        for inicio in range(0, len(requests_data), GRAPH_BATCH_SIZE):
+            pendientes = list(range(inicio, min(inicio + GRAPH_BATCH_SIZE, len(requests_data))))
+            
+            for intento in range(GRAPH_BATCH_MAX_RETRIES + 1):
+                body = {"requests": [{"id": str(i), **requests_data[i]} for i in pendientes]}
+                
+                try:
+                    response = self.session.post(GRAPH_BATCH_URL, headers=headers, data=json_dumps(body))
+                    response.raise_for_status()
+                    respuestas_lote = json_loads(response.content).get('responses', [])
+                except Exception as e:
+                    logging.error(f"Error en solicitud $batch: {e}")
+                    break
+                
+                reintentar = []
+                espera = 0
+                for respuesta in respuestas_lote:
+                    i = int(respuesta['id'])
+                    respuestas[i] = respuesta
+                    
+                    if respuesta.get('status') in (429, 503):
+                        reintentar.append(i)
+                        resp_headers = {k.lower(): v for k, v in (respuesta.get('headers') or {}).items()}
+                        espera = max(espera, retry_after_seconds(resp_headers.get('retry-after')))
+                
+                if not reintentar:
+                    break
+                if intento == GRAPH_BATCH_MAX_RETRIES:
+                    logging.error(f"{len(reintentar)} solicitudes fallaron por throttling tras {GRAPH_BATCH_MAX_RETRIES} reintentos")
+                    break
+                
+                time.sleep(espera)
+                pendientes = sorted(reintentar)
+        
+        return respuestas
+
+    def batch_create_items(self, token, site_id, list_id, items_data):
+        """
+        Crear varios items en una lista usando el endpoint $batch de Graph.
+        
+        Args:
+            token: Token de acceso
+            site_id: ID del sitio
+            list_id: ID de la lista
+            items_data: Lista de payloads ({'fields': {...}}) a crear
+            
+        Returns:
+            Lista con el ID de cada item creado (None si falló), en el mismo orden
+        """
+        items_url = f"/sites/{site_id}/lists/{list_id}/items"
+        respuestas = self.send_batch(token, [
+            {
+                "method": "POST",
+                "url": items_url,
+                "headers": {"Content-Type": "application/json"},
+                "body": item_data,
+            }
+            for item_data in items_data
+        ])
+        
+        resultados = []
+        for respuesta in respuestas:
+            if respuesta and respuesta.get('status') == 201:
+                resultados.append(self.extract_item_id(respuesta.get('body') or {}))
+            else:
+                if respuesta and respuesta.get('status') not in (429, 503):
+                    logging.error(f"Error creando item en lote: {respuesta.get('status')} - {respuesta.get('body')}")
+                resultados.append(None)
+        
+        return resultados
+
+    def batch_create_with_lookup(self, token, site_id, list_id, rows, build, lookup_variations):
+        """
+        Crear en $batch items que apuntan a otra lista mediante un campo lookup.
+        
+        Si get_lookup_field no resuelve el campo desde el esquema de la lista, se
+        prueba cada variación con los registros que sigan pendientes y se recuerda
+        la primera que logre crear items.
+        
+        Args:
+            token: Token de acceso
+            site_id: ID del sitio
+            list_id: ID de la lista
+            rows: Registros a crear
+            build: Función (registro, lookup_field) que arma el payload ({'fields': {...}})
+            lookup_variations: Posibles nombres internos del campo lookup
+            
+        Returns:
+            Lista con el ID de cada item creado (None si falló), en el mismo orden
+        """
+        campo_resuelto = self.get_lookup_field(token, site_id, list_id, lookup_variations)
+        variaciones = [campo_resuelto] if campo_resuelto else list(lookup_variations)
+        
+        resultados = [None] * len(rows)
+        pendientes = list(range(len(rows)))
+        
+        for lookup_field in variaciones:
+            # Un registro con datos inválidos no debe tumbar el resto del lote:
+            # queda como fallido y no se vuelve a intentar con otra variación
+            enviados = []
+            payloads = []
+            for i in pendientes:
+                try:
+                    payloads.append(build(rows[i], lookup_field))
+                    enviados.append(i)
+                except Exception as e:
+                    logging.error(f"Error armando el item {i + 1} del lote: {str(e)}")
+            
+            if not payloads:
+                break
+            
+            creados = self.batch_create_items(token, site_id, list_id, payloads)
+            
+            for i, item_id in zip(enviados, creados):
+                resultados[i] = item_id
+            
+            # Si la variación creó algún item, los fallos restantes no son del lookup
+            if any(creados):
+                if not campo_resuelto:
+                    self.remember_lookup_field(list_id, lookup_variations, lookup_field)
+                break
+            
+            pendientes = [i for i in enviados if resultados[i] is None]
+        
+        return resultados
+
+    def batch_delete_items(self, token, site_id, list_id, item_ids):
+        """
+        Eliminar varios items de una lista usando el endpoint $batch de Graph.
+        
+        Args:
+            token: Token de acceso
+            site_id: ID del sitio
+            list_id: ID de la lista
+            item_ids: IDs de los items a eliminar
+            
+        Returns:
+            Lista de booleanos (True si el item se eliminó), en el mismo orden
+        """
+        items_url = f"/sites/{site_id}/lists/{list_id}/items"
+        respuestas = self.send_batch(token, [
+            {"method": "DELETE", "url": f"{items_url}/{item_id}"}
+            for item_id in item_ids
+        ])
+        
+        resultados = []
+        for item_id, respuesta in zip(item_ids, respuestas):
+            eliminado = bool(respuesta) and respuesta.get('status') == 204
+            if respuesta and not eliminado and respuesta.get('status') not in (429, 503):
+                logging.error(f"Error eliminando item {item_id} en lote: {respuesta.get('status')} - {respuesta.get('body')}")
+            resultados.append(eliminado)
+        
+        return resultados
+
+    @staticmethod
+    def extract_item_id(created_item):
+        """Obtener el ID de un item recién creado en SharePoint"""
+        if 'id' in created_item:
+            return created_item['id']
+        elif 'fields' in created_item and 'id' in created_item['fields']:
+            return created_item['fields']['id']
+        elif 'fields' in created_item and 'ID' in created_item['fields']:
+            return created_item['fields']['ID']
+        return None
@@ -0,0 +1,54 @@
+# Tablas de columnas compartidas entre los scripts que escriben en las mismas
+# listas de SharePoint: (columna SharePoint, clave del registro, valor por defecto)
+
+# Columnas comunes a todos los registros de la lista de pagos
+CAMPOS_PAGO = (
+    ("Fecha", "Fecha", ""),
+    ("Numero_x0020_Pago", "Numero_Pago", ""),
+    ("Numero_x0020_Interno", "Numero_Interno", ""),
+    ("Monto_x0020_Total", "Monto_Total", 0),
+    ("Tipo_x0020_Pago", "Tipo_Pago", ""),
+    ("Metodo_x0020_Pago", "Metodo_Pago", ""),
+    ("Estado_x0020_Pago", "Estado_Pago", ""),
+    ("Cuenta_x0020_Nombre", "Cuenta_Nombre", ""),
+    ("ID_x0020_Cuenta", "Cuenta_ID", ""),
+    ("Cuenta_x0020_Tipo", "Cuenta_Tipo", ""),
+    ("ID_x0020_Cliente", "Cliente_ID", ""),
+    ("Nombre_x0020_Cliente", "Cliente_Nombre", ""),
+    ("Identificacion_x0020_Cliente", "Cliente_Identificacion", ""),
+)
+
+# Campos específicos de los registros PAGO_CON_ANTICIPO
+CAMPOS_ANTICIPO = (
+    ("ID_x0020_Anticipo", "Anticipo_ID", ""),
+    ("Anticipo_x0020_Numero", "Anticipo_Numero", ""),
+    ("Anticipo_x0020_Total_x0020_Factu", "Anticipo_Total_Factura", 0),
+    ("Anticipo_x0020_Total_x0020_Pagad", "Anticipo_Total_Pagado_Factura", 0),
+    ("Anticipo_x0020_Saldo_x0020_Factu", "Anticipo_Saldo_Factura", 0),
+    ("Anticipo_x0020_Monto_x0020_Aplic", "Anticipo_Monto_Aplicado", 0),
+)
+
+# Campos de factura y categoría para el resto de registros
+CAMPOS_FACTURA_CATEGORIA = (
+    ("ID_x0020_Factura", "Factura_ID", ""),
+    ("Numero_x0020_Factura", "Factura_Numero", ""),
+    ("Factura_x0020_Monto_x0020_Pagado", "Factura_Monto_Pagado", 0),
+    ("Total_x0020_Factura", "Factura_Total", 0),
+    ("Saldo_x0020_Factura", "Factura_Saldo", 0),
+    ("Nombre_x0020_Categoria", "Categoria_Nombre", ""),
+    ("Precio_x0020_Categoria", "Categoria_Precio", 0),
+    ("Cantidad_x0020_Categoria", "Categoria_Cantidad", 0),
+    ("Total_x0020_Categoria", "Categoria_Total", 0),
+    ("Observaciones_x0020_Categoria", "Categoria_Observaciones", ""),
+)
+
+# Registros de pago sin anticipo (pago simple, con factura o con categoría)
+CAMPOS_PAGO_COMPLETO = CAMPOS_PAGO + CAMPOS_FACTURA_CATEGORIA
+
+# Posibles nombres internos del campo lookup hacia la lista de facturas
+FACTURA_LOOKUP_VARIATIONS = (
+    "Factura_x0020_de_x0020_VentaLookupId",
+    "Factura_x0020_de_x0020_Venta",
+    "FacturadeVentaLookupId",
+    "FacturadeVenta",
+)
@@ -3,6 +3,7 @@ import base64
 import os
 import sys
 import logging
+from collections import Counter
 from datetime import datetime
 from dotenv import load_dotenv
 
@@ -60,14 +61,11 @@ def obtener_cuentas_contables_alegra(encoded_credentials, logger):
 def analizar_estructura_cuentas(cuentas, logger):
     """Analizar la estructura de las cuentas contables"""
     try:
-        tipos = {}
+        tipos = Counter(cuenta.get('type', 'unknown') for cuenta in cuentas)
         cuentas_raiz = 0
         max_nivel = 0
         
         for cuenta in cuentas:
-            tipo = cuenta.get('type', 'unknown')
-            tipos[tipo] = tipos.get(tipo, 0) + 1
-            
             if not cuenta.get('idParent'):
                 cuentas_raiz += 1
             
@@ -255,7 +253,7 @@ def send_cuenta_contable_sharepoint(sp_connector, cuenta_data, parent_sp_id, sit
             "ID_PadreLookupId",
         ]
         
-        logger.debug(f"    Intentando asignar padre SharePoint ID: {parent_sp_id}")
+        logger.debug("    Intentando asignar padre SharePoint ID: %s", parent_sp_id)
         
         for lookup_field in lookup_variations:
             # Crear una copia de los datos
@@ -265,7 +263,7 @@ def send_cuenta_contable_sharepoint(sp_connector, cuenta_data, parent_sp_id, sit
             # Agregar el campo lookup con esta variación
             data_with_lookup['fields'][lookup_field] = str(parent_sp_id)
             
-            logger.debug(f"    Probando campo: {lookup_field}")
+            logger.debug("    Probando campo: %s", lookup_field)
             
             response = requests.post(url, headers=headers, json=data_with_lookup)
             
@@ -275,7 +273,7 @@ def send_cuenta_contable_sharepoint(sp_connector, cuenta_data, parent_sp_id, sit
                 logger.info(f"    Padre asignado exitosamente usando campo: {lookup_field}")
                 return item_id
             else:
-                logger.debug(f"    Falló con {lookup_field}: {response.status_code}")
+                logger.debug("    Falló con %s: %s", lookup_field, response.status_code)
                 continue
         
         # Si ninguna variación funcionó, loggear el último error
@@ -10,6 +10,7 @@ from dotenv import load_dotenv
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.sharepoint_connector import SharePointConnector
+from core.alegra import safe_get_nested
 
 def setup_logging():
     """Configurar el sistema de logging"""
@@ -89,7 +90,7 @@ def obtener_ultimo_id_sharepoint(sp_connector, site_url, list_name, logger):
                 # Verificar si hay más páginas
                 next_link = data.get('@odata.nextLink', None)
                 
-                logger.debug(f"Obtenidos {len(items)} items, total acumulado: {len(all_items)}")
+                logger.debug("Obtenidos %d items, total acumulado: %d", len(items), len(all_items))
             else:
                 logger.error(f"Error al consultar SharePoint: {response.status_code} - {response.text}")
                 break
@@ -381,15 +382,6 @@ def main():
         print(f"ERROR: {str(e)}. Ver detalles en: {log_file}")
         return False
 
-def safe_get_nested(obj, *keys, default=''):
-    """Función helper para obtener valores anidados de forma segura"""
-    for key in keys:
-        if isinstance(obj, dict) and key in obj and obj[key] is not None:
-            obj = obj[key]
-        else:
-            return default
-    return obj if obj is not None else default
-
 def procesar_impuestos_categoria(impuestos):
     """Procesar información de impuestos de una categoría"""
     total_impuestos = 0
@@ -627,7 +619,7 @@ def send_categoria_compra_sharepoint(sp_connector, datos_categoria, factura_look
 def send_retencion_compra_sharepoint(sp_connector, datos_retencion, factura_lookup_id, site_url, list_name, logger):
     """Subir retención de factura de compra a lista de SharePoint"""
     try:
-        logger.debug(f"Subiendo retención: {datos_retencion.get('ID_Retencion', 'N/A')}")
+        logger.debug("Subiendo retención: %s", datos_retencion.get('ID_Retencion', 'N/A'))
         
         token = sp_connector.get_azure_token()
         site_id = sp_connector.get_site_id(token, site_url)
@@ -671,7 +663,7 @@ def send_retencion_compra_sharepoint(sp_connector, datos_retencion, factura_look
             "Content-Type": "application/json"
         }
         
-        logger.debug(f"Enviando datos: {item_data}")
+        logger.debug("Enviando datos: %s", item_data)
         response = requests.post(url, headers=headers, json=item_data)
         
         if response.status_code == 201:
@@ -10,6 +10,7 @@ from dotenv import load_dotenv
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.sharepoint_connector import SharePointConnector
+from core.alegra import safe_get_nested
 
 # Configurar logging
 def setup_logging():
@@ -75,7 +76,7 @@ def obtener_facturas_compra_por_fecha(encoded_credentials, fecha_str, logger):
         
         if response.status_code == 200:
             data = response.json()
-            logger.debug(f"Fecha {fecha_str}: {len(data)} facturas de compra obtenidas")
+            logger.debug("Fecha %s: %d facturas de compra obtenidas", fecha_str, len(data))
             return data
         elif response.status_code == 429:
             logger.warning(f"Rate limit alcanzado para fecha {fecha_str}, esperando...")
@@ -350,15 +351,6 @@ def procesar_facturas_compra_fecha(facturas_fecha, fecha, logger):
     
     return facturas_procesadas, categorias_procesadas, retenciones_procesadas
 
-def safe_get_nested(obj, *keys, default=''):
-    """Función helper para obtener valores anidados de forma segura"""
-    for key in keys:
-        if isinstance(obj, dict) and key in obj and obj[key] is not None:
-            obj = obj[key]
-        else:
-            return default
-    return obj if obj is not None else default
-
 def procesar_impuestos_categoria(impuestos):
     """Procesar información de impuestos de una categoría"""
     total_impuestos = 0
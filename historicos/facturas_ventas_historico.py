@@ -11,6 +11,7 @@ from dotenv import load_dotenv
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.sharepoint_connector import SharePointConnector
+from core.alegra import safe_get_nested
 
 # Configurar logging
 def setup_logging():
@@ -76,7 +77,7 @@ def obtener_facturas_por_fecha(encoded_credentials, fecha_str, logger):
         
         if response.status_code == 200:
             data = response.json()
-            logger.debug(f"Fecha {fecha_str}: {len(data)} facturas obtenidas")
+            logger.debug("Fecha %s: %d facturas obtenidas", fecha_str, len(data))
             return data
         elif response.status_code == 429:
             logger.warning(f"Rate limit alcanzado para fecha {fecha_str}, esperando...")
@@ -217,23 +218,27 @@ def main():
         
         # Crear DataFrames
         logger.info("Creando DataFrames finales...")
-        df_invoices = pd.DataFrame(todas_las_facturas)
-        df_items = pd.DataFrame(todos_los_items)
-        df_retenciones = pd.DataFrame(todas_las_retenciones) if todas_las_retenciones else pd.DataFrame()
-        df_retenciones_sug = pd.DataFrame(todas_las_retenciones_sug) if todas_las_retenciones_sug else pd.DataFrame()
+        df_invoices = crear_dataframe(todas_las_facturas)
+        df_items = crear_dataframe(todos_los_items)
+        df_retenciones = crear_dataframe(todas_las_retenciones)
+        df_retenciones_sug = crear_dataframe(todas_las_retenciones_sug)
         
         logger.info(f"DataFrames creados - Facturas: {len(df_invoices)}, Items: {len(df_items)}, Retenciones: {len(df_retenciones)}, Ret. Sugeridas: {len(df_retenciones_sug)}")
         
         # NUEVO: Mostrar resumen de centros de costos procesados
+        # Máscara de facturas con centro de costos (se calcula una sola vez y se reutiliza)
+        mask_centro = (df_invoices['Centro_Costo_ID'] != '').to_numpy() if len(df_invoices) > 0 else None
+        n_centros = int(mask_centro.sum()) if mask_centro is not None else 0
+        
         if len(df_invoices) > 0:
-            facturas_con_centro = df_invoices[df_invoices['Centro_Costo_ID'] != '']
-            if len(facturas_con_centro) > 0:
-                logger.info(f"Facturas con centro de costos: {len(facturas_con_centro)}")
+            if n_centros > 0:
+                facturas_con_centro = df_invoices.loc[mask_centro]
+                logger.info(f"Facturas con centro de costos: {n_centros}")
+                conteo_por_centro = facturas_con_centro['Centro_Costo_ID'].value_counts()
                 centros_unicos = facturas_con_centro[['Centro_Costo_ID', 'Centro_Costo_Nombre']].drop_duplicates()
                 logger.info("Centros de costos encontrados:")
-                for _, centro in centros_unicos.iterrows():
-                    facturas_centro = len(facturas_con_centro[facturas_con_centro['Centro_Costo_ID'] == centro['Centro_Costo_ID']])
-                    logger.info(f"  - ID: {centro['Centro_Costo_ID']}, Nombre: '{centro['Centro_Costo_Nombre']}' ({facturas_centro} facturas)")
+                for centro_id, centro_nombre in centros_unicos.itertuples(index=False, name=None):
+                    logger.info(f"  - ID: {centro_id}, Nombre: '{centro_nombre}' ({conteo_por_centro[centro_id]} facturas)")
             else:
                 logger.info("Ninguna factura histórica tiene centro de costos asignado")
         
@@ -278,7 +283,7 @@ def main():
         logger.info(f"Items procesados: {len(df_items)}")
         logger.info(f"Retenciones procesadas: {len(df_retenciones)}")
         logger.info(f"Retenciones sugeridas procesadas: {len(df_retenciones_sug)}")
-        logger.info(f"Facturas con centro de costos: {len(df_invoices[df_invoices['Centro_Costo_ID'] != '']) if len(df_invoices) > 0 else 0}")
+        logger.info(f"Facturas con centro de costos: {n_centros}")
         logger.info(f"Datos subidos a listas: {'SI' if success_listas else 'NO'}")
         logger.info(f"Archivo de log: {log_file}")
         
@@ -287,7 +292,7 @@ def main():
         print(f"  Período: {fecha_inicio} a {fechas[-1]}")
         print(f"  Facturas: {len(df_invoices)}, Items: {len(df_items)}")
         print(f"  Retenciones: {len(df_retenciones)}, Ret. Sugeridas: {len(df_retenciones_sug)}")
-        print(f"  Facturas con centro de costos: {len(df_invoices[df_invoices['Centro_Costo_ID'] != '']) if len(df_invoices) > 0 else 0}")
+        print(f"  Facturas con centro de costos: {n_centros}")
         print(f"  Log: {log_file}")
         
         return success_listas
@@ -436,14 +441,16 @@ def procesar_facturas_fecha(facturas_fecha, fecha, logger):
     
     return facturas_procesadas, items_procesados, retenciones_procesadas, retenciones_sug_procesadas
 
-def safe_get_nested(obj, *keys, default=''):
-    """Función helper para obtener valores anidados de forma segura"""
-    for key in keys:
-        if isinstance(obj, dict) and key in obj and obj[key] is not None:
-            obj = obj[key]
-        else:
-            return default
-    return obj if obj is not None else default
+def crear_dataframe(registros):
+    """
+    Crear un DataFrame a partir de una lista de dicts con las mismas claves.
+    
+    Se pasan las columnas explícitas (las del primer registro) para que pandas
+    no tenga que inferirlas recorriendo cada dict.
+    """
+    if not registros:
+        return pd.DataFrame()
+    return pd.DataFrame.from_records(registros, columns=list(registros[0]))
 
 def subir_facturas_en_lotes(df_invoices, df_items, df_retenciones, df_retenciones_sug, site_url, list_name_facturas, list_name_items, list_name_retenciones, list_name_retenciones_sug, logger, lote_size=50):
     """Subir facturas a SharePoint en lotes para evitar timeouts con retenciones y centro de costos mejoradas"""
@@ -630,6 +637,11 @@ def send_item_factura_sharepoint(sp_connector, datos_item, factura_lookup_id, si
             "Factura"
         ]
         
+        # Usar el campo lookup según el esquema de la lista si se pudo resolver
+        campo_resuelto = sp_connector.get_lookup_field(token, site_id, list_id, lookup_field_variations)
+        if campo_resuelto:
+            lookup_field_variations = [campo_resuelto]
+        
         for lookup_field in lookup_field_variations:
             try:
                 item_data = {
@@ -655,14 +667,17 @@ def send_item_factura_sharepoint(sp_connector, datos_item, factura_lookup_id, si
                 response = requests.post(url, headers=headers, json=item_data)
                 
                 if response.status_code == 201:
+                    if not campo_resuelto:
+                        # Las siguientes subidas a esta lista usan directamente este campo
+                        sp_connector.remember_lookup_field(list_id, lookup_field_variations, lookup_field)
                     created_item = response.json()
                     return created_item.get('id')
                 else:
-                    logger.debug(f"Error con campo {lookup_field}: {response.status_code} - {response.text}")
+                    logger.debug("Error con campo %s: %s - %s", lookup_field, response.status_code, response.text)
                     continue
                     
             except Exception as e:
-                logger.debug(f"Error probando campo {lookup_field}: {str(e)}")
+                logger.debug("Error probando campo %s: %s", lookup_field, e)
                 continue
         
         logger.warning(f"No se pudo subir item con ningún campo lookup probado")
@@ -692,6 +707,11 @@ def send_retencion_factura_sharepoint(sp_connector, datos_retencion, factura_loo
             "Factura"
         ]
         
+        # Usar el campo lookup según el esquema de la lista si se pudo resolver
+        campo_resuelto = sp_connector.get_lookup_field(token, site_id, list_id, lookup_field_variations)
+        if campo_resuelto:
+            lookup_field_variations = [campo_resuelto]
+        
         for lookup_field in lookup_field_variations:
             try:
                 item_data = {
@@ -715,14 +735,17 @@ def send_retencion_factura_sharepoint(sp_connector, datos_retencion, factura_loo
                 response = requests.post(url, headers=headers, json=item_data)
                 
                 if response.status_code == 201:
+                    if not campo_resuelto:
+                        # Las siguientes subidas a esta lista usan directamente este campo
+                        sp_connector.remember_lookup_field(list_id, lookup_field_variations, lookup_field)
                     created_item = response.json()
                     return created_item.get('id')
                 else:
-                    logger.debug(f"Error con campo {lookup_field}: {response.status_code} - {response.text}")
+                    logger.debug("Error con campo %s: %s - %s", lookup_field, response.status_code, response.text)
                     continue
                     
             except Exception as e:
-                logger.debug(f"Error probando campo {lookup_field}: {str(e)}")
+                logger.debug("Error probando campo %s: %s", lookup_field, e)
                 continue
         
         logger.warning(f"No se pudo subir retención con ningún campo lookup probado")
@@ -752,6 +775,11 @@ def send_retencion_sugerida_factura_sharepoint(sp_connector, datos_retencion_sug
             "Factura"
         ]
         
+        # Usar el campo lookup según el esquema de la lista si se pudo resolver
+        campo_resuelto = sp_connector.get_lookup_field(token, site_id, list_id, lookup_field_variations)
+        if campo_resuelto:
+            lookup_field_variations = [campo_resuelto]
+        
         for lookup_field in lookup_field_variations:
             try:
                 item_data = {
@@ -775,14 +803,17 @@ def send_retencion_sugerida_factura_sharepoint(sp_connector, datos_retencion_sug
                 response = requests.post(url, headers=headers, json=item_data)
                 
                 if response.status_code == 201:
+                    if not campo_resuelto:
+                        # Las siguientes subidas a esta lista usan directamente este campo
+                        sp_connector.remember_lookup_field(list_id, lookup_field_variations, lookup_field)
                     created_item = response.json()
                     return created_item.get('id')
                 else:
-                    logger.debug(f"Error con campo {lookup_field}: {response.status_code} - {response.text}")
+                    logger.debug("Error con campo %s: %s - %s", lookup_field, response.status_code, response.text)
                     continue
                     
             except Exception as e:
-                logger.debug(f"Error probando campo {lookup_field}: {str(e)}")
+                logger.debug("Error probando campo %s: %s", lookup_field, e)
                 continue
         
         logger.warning(f"No se pudo subir retención sugerida con ningún campo lookup probado")
@@ -1,15 +1,17 @@
-import requests
 import base64
 import os
 import sys
-import pandas as pd
 import logging
 from datetime import datetime, date, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.sharepoint_connector import SharePointConnector
+from core.sharepoint_connector import SharePointConnector, GRAPH_BATCH_SIZE
+from core.http_session import MAX_WORKERS
+from core.alegra import get_all_pages, normalize_date
+from core.sharepoint_fields import CAMPOS_PAGO_COMPLETO
 
 # Configurar logging
 def setup_logging():
@@ -58,34 +60,32 @@ def generar_rango_fechas(fecha_inicio="2024-01-01", fecha_fin=None):
     return fechas
 
 def obtener_pagos_por_fecha(encoded_credentials, fecha_str, logger):
-    """Obtener pagos de una fecha específica desde Alegra"""
+    """
+    Obtener todos los pagos de una fecha específica desde Alegra.
+    
+    Returns:
+        Lista de pagos, o None si hubo error
+    """
     try:
-        url = f"https://api.alegra.com/api/v1/payments?order_direction=DESC&metadata=false&includeUnconciliated=false&date={fecha_str}"
-        
         headers = {
             "accept": "application/json",
             "authorization": f"Basic {encoded_credentials}"
         }
+        params = {
+            "order_direction": "DESC",
+            "metadata": "false",
+            "includeUnconciliated": "false",
+            "date": fecha_str,
+        }
         
-        response = requests.get(url, headers=headers)
+        pagos = get_all_pages("https://api.alegra.com/api/v1/payments", headers, params)
         
-        if response.status_code == 200:
-            data = response.json()
-            logger.debug(f"Fecha {fecha_str}: {len(data)} pagos obtenidos")
-            return data
-        elif response.status_code == 429:
-            logger.warning(f"Rate limit alcanzado para fecha {fecha_str}, esperando...")
-            # Esperar un poco antes de continuar
-            import time
-            time.sleep(2)
-            return obtener_pagos_por_fecha(encoded_credentials, fecha_str, logger)
-        else:
-            logger.error(f"Error consultando fecha {fecha_str}: {response.status_code} - {response.text}")
-            return []
+        logger.debug("Fecha %s: %d pagos obtenidos", fecha_str, len(pagos))
+        return pagos
             
     except Exception as e:
         logger.error(f"Error consultando fecha {fecha_str}: {str(e)}")
-        return []
+        return None
 
 def main():
     log_file = setup_logging()
@@ -153,6 +153,12 @@ def main():
                 # Obtener pagos de esta fecha
                 pagos_fecha = obtener_pagos_por_fecha(encoded_credentials, fecha, logger)
                 
+                if pagos_fecha is None:
+                    # No se reporta como "sin pagos": la fecha queda pendiente
+                    fechas_con_error += 1
+                    logger.error(f"  → No se pudieron obtener los pagos de {fecha}; la fecha queda sin procesar")
+                    continue
+                
                 if pagos_fecha:
                     logger.info(f"  → {len(pagos_fecha)} pagos encontrados")
                     
@@ -231,12 +237,18 @@ def procesar_pagos_fecha(pagos_fecha, fecha, logger):
             continue
         
         try:
+            # Objetos anidados del pago (se leen una sola vez)
+            number_template = payment.get('numberTemplate') or {}
+            bank_account = payment.get('bankAccount') or {}
+            client = payment.get('client') or {}
+            cost_center = payment.get('costCenter') or {}
+            
             # Registro base del pago
             pago_base = {
                 # Datos principales del pago
                 'Pago_ID': payment.get('id'),
                 'Fecha': payment.get('date'),
-                'Numero_Pago': safe_get_nested(payment, 'numberTemplate', 'fullNumber', default=''),
+                'Numero_Pago': number_template.get('fullNumber') or '',
                 'Numero_Interno': payment.get('number'),
                 'Monto_Total': payment.get('amount', 0),
                 'Tipo_Pago': payment.get('type'),
@@ -246,20 +258,20 @@ def procesar_pagos_fecha(pagos_fecha, fecha, logger):
                 'Anotaciones_Pago': payment.get('anotation', ''),
                 
                 # Cuenta bancaria
-                'Cuenta_ID': safe_get_nested(payment, 'bankAccount', 'id', default=''),
-                'Cuenta_Nombre': safe_get_nested(payment, 'bankAccount', 'name', default=''),
-                'Cuenta_Tipo': safe_get_nested(payment, 'bankAccount', 'type', default=''),
+                'Cuenta_ID': bank_account.get('id') or '',
+                'Cuenta_Nombre': bank_account.get('name') or '',
+                'Cuenta_Tipo': bank_account.get('type') or '',
                 
                 # Cliente
-                'Cliente_ID': safe_get_nested(payment, 'client', 'id', default=''),
-                'Cliente_Nombre': safe_get_nested(payment, 'client', 'name', default=''),
-                'Cliente_Telefono': safe_get_nested(payment, 'client', 'phone', default=''),
-                'Cliente_Identificacion': safe_get_nested(payment, 'client', 'identification', default=''),
+                'Cliente_ID': client.get('id') or '',
+                'Cliente_Nombre': client.get('name') or '',
+                'Cliente_Telefono': client.get('phone') or '',
+                'Cliente_Identificacion': client.get('identification') or '',
                 
                 # Centro de costo
-                'Centro_Costo_ID': safe_get_nested(payment, 'costCenter', 'id', default=''),
-                'Centro_Costo_Codigo': safe_get_nested(payment, 'costCenter', 'code', default=''),
-                'Centro_Costo_Nombre': safe_get_nested(payment, 'costCenter', 'name', default=''),
+                'Centro_Costo_ID': cost_center.get('id') or '',
+                'Centro_Costo_Codigo': cost_center.get('code') or '',
+                'Centro_Costo_Nombre': cost_center.get('name') or '',
                 
                 # Campos para facturas (vacíos por defecto)
                 'Factura_ID': '',
@@ -295,24 +307,24 @@ def procesar_pagos_fecha(pagos_fecha, fecha, logger):
                 if invoices:
                     for invoice in invoices:
                         if invoice is not None:
-                            pago_con_factura = pago_base.copy()
-                            pago_con_factura.update({
+                            pago_con_factura = {
+                                **pago_base,
                                 'Factura_ID': invoice.get('id'),
                                 'Factura_Numero': invoice.get('number'),
-                                'Factura_Fecha': invoice.get('date'),
+                                'Factura_Fecha': normalize_date(invoice.get('date')),
                                 'Factura_Monto_Pagado': invoice.get('amount', 0),
                                 'Factura_Total': invoice.get('total', 0),
                                 'Factura_Saldo': invoice.get('balance', 0),
                                 'Tipo_Registro': 'PAGO_CON_FACTURA'
-                            })
+                            }
                             pagos_unificados.append(pago_con_factura)
                 
                 # Si tiene categorías
                 if categories:
                     for category in categories:
                         if category is not None:
-                            pago_con_categoria = pago_base.copy()
-                            pago_con_categoria.update({
+                            pago_con_categoria = {
+                                **pago_base,
                                 'Categoria_ID': category.get('id'),
                                 'Categoria_Nombre': category.get('name'),
                                 'Categoria_Precio': category.get('price', 0),
@@ -321,7 +333,7 @@ def procesar_pagos_fecha(pagos_fecha, fecha, logger):
                                 'Categoria_Observaciones': category.get('observations', ''),
                                 'Categoria_Comportamiento': category.get('behavior', ''),
                                 'Tipo_Registro': 'PAGO_CON_CATEGORIA'
-                            })
+                            }
                             pagos_unificados.append(pago_con_categoria)
             
         except Exception as e:
@@ -330,57 +342,55 @@ def procesar_pagos_fecha(pagos_fecha, fecha, logger):
     
     return pagos_unificados
 
-def safe_get_nested(obj, *keys, default=''):
-    """Función helper para obtener valores anidados de forma segura"""
-    for key in keys:
-        if isinstance(obj, dict) and key in obj and obj[key] is not None:
-            obj = obj[key]
-        else:
-            return default
-    return obj if obj is not None else default
-
-def subir_pagos_en_lotes(todos_los_pagos, site_url, list_name, logger, lote_size=50):
-    """Subir pagos a SharePoint en lotes para evitar timeouts"""
+def subir_pagos_en_lotes(todos_los_pagos, site_url, list_name, logger):
+    """Subir pagos a SharePoint en lotes $batch de GRAPH_BATCH_SIZE registros"""
     try:
-        logger.info(f"Iniciando subida en lotes a SharePoint (tamaño lote: {lote_size})...")
+        logger.info("Iniciando subida en lotes a SharePoint...")
         
         sp_connector = SharePointConnector()
         
+        # Sitio y lista se resuelven una sola vez para toda la subida
+        token = sp_connector.get_azure_token()
+        site_id = sp_connector.get_site_id(token, site_url)
+        list_id = sp_connector.get_list_id(token, site_id, list_name)
+        
+        if not list_id:
+            logger.error(f"No se pudo obtener ID de la lista {list_name}")
+            return False
+        
         total_registros = len(todos_los_pagos)
         registros_exitosos = 0
         registros_error = 0
         
-        # Procesar en lotes
-        for inicio in range(0, total_registros, lote_size):
-            fin = min(inicio + lote_size, total_registros)
-            lote_actual = inicio // lote_size + 1
-            total_lotes = (total_registros + lote_size - 1) // lote_size
-            
-            logger.info(f"Procesando lote {lote_actual}/{total_lotes}: registros {inicio+1} a {fin}")
-            
-            lote_pagos = todos_los_pagos[inicio:fin]
+        # Todos los grupos van al mismo pool, con varios $batch en vuelo a la vez; el
+        # throttling lo manejan la sesión compartida y send_batch (Retry-After)
+        grupos = [todos_los_pagos[k:k + GRAPH_BATCH_SIZE] for k in range(0, total_registros, GRAPH_BATCH_SIZE)]
+        logger.info(f"Subiendo {total_registros} registros en {len(grupos)} lotes")
+        
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            subidas = {
+                executor.submit(subir_grupo_pagos, sp_connector, grupo, site_id, list_id): (numero_grupo, grupo)
+                for numero_grupo, grupo in enumerate(grupos, 1)
+            }
             
-            for pago_data in lote_pagos:
+            for completados, future in enumerate(as_completed(subidas), 1):
+                numero_grupo, grupo = subidas[future]
                 try:
-                    numero_pago = pago_data.get('Numero_Pago', f"ID-{pago_data.get('Pago_ID')}")
-                    
-                    result = send_pago_unificado_sharepoint(sp_connector, pago_data, site_url, list_name, logger)
-                    
-                    if result:
-                        registros_exitosos += 1
-                    else:
-                        registros_error += 1
-                        
+                    resultados = future.result()
                 except Exception as e:
-                    registros_error += 1
-                    logger.error(f"Error procesando registro en lote: {str(e)}")
-                    continue
-            
-            # Pausa entre lotes
-            if lote_actual < total_lotes:
-                logger.info(f"Pausa entre lotes... ({registros_exitosos} exitosos hasta ahora)")
-                import time
-                time.sleep(2)
+                    registros_error += len(grupo)
+                    logger.error(f"Error procesando lote {numero_grupo}/{len(grupos)}: {str(e)}")
+                else:
+                    for pago_data, result in zip(grupo, resultados):
+                        if result:
+                            registros_exitosos += 1
+                        else:
+                            registros_error += 1
+                            numero_pago = pago_data.get('Numero_Pago', f"ID-{pago_data.get('Pago_ID')}")
+                            logger.error(f"Error subiendo pago {numero_pago}")
+                
+                if completados % 10 == 0:
+                    logger.info(f"Progreso: {completados}/{len(grupos)} lotes ({registros_exitosos} exitosos hasta ahora)")
         
         logger.info("RESUMEN DE SUBIDA EN LOTES:")
         logger.info(f"Registros exitosos: {registros_exitosos}")
@@ -392,80 +402,25 @@ def subir_pagos_en_lotes(todos_los_pagos, site_url, list_name, logger, lote_size
         logger.error(f"Error en subida en lotes: {str(e)}")
         return False
 
-def send_pago_unificado_sharepoint(sp_connector, pago_data, site_url, list_name, logger):
-    """Subir un registro unificado de pago a SharePoint"""
-    try:
-        token = sp_connector.get_azure_token()
-        site_id = sp_connector.get_site_id(token, site_url)
-        list_id = sp_connector.get_list_id(token, site_id, list_name)
-        
-        if not list_id:
-            logger.error(f"No se pudo obtener ID de la lista {list_name}")
-            return None
-        
-        item_data = {
-            'fields': {
-                "Title": str(pago_data.get("Pago_ID", "")),
-                "Fecha": pago_data.get("Fecha", ""),
-                "Numero_x0020_Pago": pago_data.get("Numero_Pago", ""),
-                "Numero_x0020_Interno": pago_data.get("Numero_Interno", ""),
-                "Monto_x0020_Total": pago_data.get("Monto_Total", 0),
-                "Tipo_x0020_Pago": pago_data.get("Tipo_Pago", ""),
-                "Metodo_x0020_Pago": pago_data.get("Metodo_Pago", ""),
-                "Estado_x0020_Pago": pago_data.get("Estado_Pago", ""),
-                "Observaciones": pago_data.get("Observaciones_Pago", "") or "",
-                "Cuenta_x0020_Nombre": pago_data.get("Cuenta_Nombre", ""),
-                "ID_x0020_Cuenta": pago_data.get("Cuenta_ID", ""),
-                "Cuenta_x0020_Tipo": pago_data.get("Cuenta_Tipo", ""),
-                "ID_x0020_Cliente": pago_data.get("Cliente_ID", ""),
-                "Nombre_x0020_Cliente": pago_data.get("Cliente_Nombre", ""),
-                "Identificacion_x0020_Cliente": pago_data.get("Cliente_Identificacion", ""),
-                "ID_x0020_Factura": pago_data.get("Factura_ID", ""),
-                "Numero_x0020_Factura": pago_data.get("Factura_Numero", ""),
-                "Factura_x0020_Monto_x0020_Pagado": pago_data.get("Factura_Monto_Pagado", 0),
-                "Total_x0020_Factura": pago_data.get("Factura_Total", 0),
-                "Saldo_x0020_Factura": pago_data.get("Factura_Saldo", 0),
-                "Nombre_x0020_Categoria": pago_data.get("Categoria_Nombre", ""),
-                "Precio_x0020_Categoria": pago_data.get("Categoria_Precio", 0),
-                "Cantidad_x0020_Categoria": pago_data.get("Categoria_Cantidad", 0),
-                "Total_x0020_Categoria": pago_data.get("Categoria_Total", 0),
-                "Observaciones_x0020_Categoria": pago_data.get("Categoria_Observaciones", ""),
-            }
-        }
-        
-        # Solo agregar fecha de factura si tiene valor válido
-        fecha_factura = pago_data.get("Factura_Fecha")
-        if fecha_factura and fecha_factura.strip():
-            item_data['fields']["Fecha_x0020_Factura"] = fecha_factura
-        
-        url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(url, headers=headers, json=item_data)
-        
-        if response.status_code == 201:
-            created_item = response.json()
-            
-            # Obtener ID del item creado
-            item_id = None
-            if 'id' in created_item:
-                item_id = created_item['id']
-            elif 'fields' in created_item and 'id' in created_item['fields']:
-                item_id = created_item['fields']['id']
-            elif 'fields' in created_item and 'ID' in created_item['fields']:
-                item_id = created_item['fields']['ID']
-            
-            return item_id
-        else:
-            logger.error(f"Error HTTP subiendo pago: {response.status_code} - {response.text}")
-            return None
-        
-    except Exception as e:
-        logger.error(f"Error subiendo pago unificado: {str(e)}")
-        return None
+def subir_grupo_pagos(sp_connector, grupo, site_id, list_id):
+    """Subir un grupo de registros de pago con una solicitud $batch"""
+    items_data = [construir_item_pago(pago_data) for pago_data in grupo]
+    # El token sale de caché y se renueva solo si está por vencer
+    token = sp_connector.get_azure_token()
+    return sp_connector.batch_create_items(token, site_id, list_id, items_data)
+
+def construir_item_pago(pago_data):
+    """Construir el payload de SharePoint para un registro unificado de pago"""
+    fields = {"Title": str(pago_data.get("Pago_ID", ""))}
+    fields.update({columna: pago_data.get(clave, defecto) for columna, clave, defecto in CAMPOS_PAGO_COMPLETO})
+    fields["Observaciones"] = pago_data.get("Observaciones_Pago", "") or ""
+    
+    # Solo agregar fecha de factura si tiene valor (ya normalizada al procesar)
+    fecha_factura = pago_data.get("Factura_Fecha")
+    if fecha_factura:
+        fields["Fecha_x0020_Factura"] = fecha_factura
+    
+    return {'fields': fields}
 
 if __name__ == "__main__":
     success = main()
@@ -1,32 +1,41 @@
-import requests
 import base64
 import os
 import sys
-import pandas as pd
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
+from functools import lru_cache
 from dotenv import load_dotenv
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
 
-from core.sharepoint_connector import SharePointConnector
+from core.sharepoint_connector import SharePointConnector, GRAPH_BATCH_SIZE
+from core.http_session import MAX_WORKERS
+from core.alegra import get_all_pages
+from core.logging_utils import get_log_level
+from core.sharepoint_fields import FACTURA_LOOKUP_VARIATIONS
 
 def setup_logging():
     """Configurar el sistema de logging"""
     
-    # Calcular fecha (ayer)
-    ayer_str = datetime.now().strftime('%Y-%m-%d')
+    # Fecha de ejecución
+    fecha_str = datetime.now().strftime('%Y-%m-%d')
     
     # Crear carpeta de logs si no existe
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
+    os.makedirs('logs', exist_ok=True)
     
     # Nombre del archivo de log con timestamp
-    log_filename = f"logs/facturas_venta_{ayer_str}.log"
+    log_filename = f"logs/facturas_venta_{fecha_str}.log"
+    
+    # Nivel de logging (LOG_LEVEL=DEBUG para ver el detalle por factura)
+    nivel, nivel_invalido = get_log_level()
     
     # Configurar el logging
     logging.basicConfig(
-        level=logging.INFO,
+        level=nivel,
         format='%(asctime)s - %(levelname)s - %(message)s',
         handlers=[
             logging.FileHandler(log_filename, encoding='utf-8'),
@@ -38,9 +47,40 @@ def setup_logging():
     console_handler = logging.getLogger().handlers[1]
     console_handler.setLevel(logging.ERROR)
     
+    if nivel_invalido:
+        logging.warning(f"LOG_LEVEL inválido: {nivel_invalido}, se usa INFO")
+    
     return log_filename
 
+@lru_cache(maxsize=None)
+def codificar_credenciales(username, password):
+    """Codificar credenciales de Alegra para autenticación Basic"""
+    credentials = f"{username}:{password}"
+    return base64.b64encode(credentials.encode()).decode()
+
+def obtener_facturas_alegra(encoded_credentials, fecha_str, logger):
+    """
+    Obtener todas las facturas de una fecha desde la API de Alegra.
+    
+    Returns:
+        Lista de facturas, o None si hubo error
+    """
+    try:
+        headers = {
+            "accept": "application/json",
+            "authorization": f"Basic {encoded_credentials}"
+        }
+        
+        return get_all_pages("https://api.alegra.com/api/v1/invoices", headers, {"date": fecha_str})
+    
+    except Exception as e:
+        logger.error(f"Error consultando API Alegra: {str(e)}")
+        return None
+
 def main():
+    # Cargar variables de entorno antes del logging (LOG_LEVEL puede venir del .env)
+    load_dotenv()
+    
     # Configurar logging
     log_file = setup_logging()
     logger = logging.getLogger(__name__)
@@ -50,10 +90,6 @@ def main():
     logger.info("="*60)
     
     try:
-        # Cargar variables de entorno
-        load_dotenv()
-        logger.info("Variables de entorno cargadas")
-        
         # Credenciales Alegra
         username = os.getenv("email")
         password = os.getenv("password")
@@ -80,8 +116,7 @@ def main():
             logger.error("URL de SharePoint no encontrada en variables de entorno")
             return False
         
-        credentials = f"{username}:{password}"
-        encoded_credentials = base64.b64encode(credentials.encode()).decode()
+        encoded_credentials = codificar_credenciales(username, password)
         
         # Calcular fecha (ayer)
         ayer = date.today() - timedelta(days=1)
@@ -90,20 +125,11 @@ def main():
         
         # Obtener datos de Alegra
         logger.info("Iniciando consulta a API de Alegra...")
-        url = f"https://api.alegra.com/api/v1/invoices?date={ayer_str}"
-        
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Basic {encoded_credentials}"
-        }
-        
-        response = requests.get(url, headers=headers)
+        data = obtener_facturas_alegra(encoded_credentials, ayer_str, logger)
         
-        if response.status_code != 200:
-            logger.error(f"Error consultando API Alegra: {response.status_code} - {response.text}")
+        if data is None:
             return False
-            
-        data = response.json()
+        
         logger.info(f"Obtenidas {len(data)} facturas de Alegra")
         
         if len(data) == 0:
@@ -127,133 +153,12 @@ def main():
                     facturas_con_error += 1
                     continue
                 
-                # Datos básicos de la factura
-                invoice_data = {
-                    'ID': invoice.get('id'),
-                    'Fecha': invoice.get('date'),
-                    'Fecha_Vencimiento': invoice.get('dueDate'),
-                    'Numero_Factura': safe_get_nested(invoice, 'numberTemplate', 'fullNumber', default=''),
-                    'Estado': invoice.get('status'),
-                    'Subtotal': invoice.get('subtotal', 0),
-                    'Descuento': invoice.get('discount', 0),
-                    'Impuestos': invoice.get('tax', 0),
-                    'Total': invoice.get('total', 0),
-                    'Total_Pagado': invoice.get('totalPaid', 0),
-                    'Saldo': invoice.get('balance', 0),
-                    'Termino_Pago': invoice.get('term', ''),
-                    'Forma_Pago': invoice.get('paymentForm', ''),
-                    
-                    # Datos del cliente
-                    'Cliente_ID': safe_get_nested(invoice, 'client', 'id', default=''),
-                    'Cliente_Nombre': safe_get_nested(invoice, 'client', 'name', default=''),
-                    'Cliente_Identificacion': safe_get_nested(invoice, 'client', 'identification', default=''),
-                    'Cliente_Email': safe_get_nested(invoice, 'client', 'email', default=''),
-                    'Cliente_Telefono': safe_get_nested(invoice, 'client', 'phonePrimary', default=''),
-                    'Cliente_Ciudad': safe_get_nested(invoice, 'client', 'address', 'city', default=''),
-                    'Cliente_Departamento': safe_get_nested(invoice, 'client', 'address', 'department', default=''),
-                    'Cliente_Direccion': safe_get_nested(invoice, 'client', 'address', 'address', default=''),
-                    
-                    # Datos del vendedor
-                    'Vendedor_Nombre': safe_get_nested(invoice, 'seller', 'name', default=''),
-                    'Vendedor_ID': safe_get_nested(invoice, 'seller', 'identification', default=''),
-                    
-                    # NUEVO: Datos del centro de costos
-                    'Centro_Costo_ID': safe_get_nested(invoice, 'costCenter', 'id', default=''),
-                    'Centro_Costo_Nombre': safe_get_nested(invoice, 'costCenter', 'name', default=''),
-                    'Centro_Costo_Codigo': safe_get_nested(invoice, 'costCenter', 'code', default=''),
-                    'Centro_Costo_Descripcion': safe_get_nested(invoice, 'costCenter', 'description', default=''),
-                    
-                    # Datos adicionales
-                    'Observaciones': invoice.get('observations', ''),
-                    'Anotacion': invoice.get('anotation', ''),
-                    'Almacen': safe_get_nested(invoice, 'warehouse', 'name', default=''),
-                    
-                    # CUFE
-                    'CUFE': safe_get_nested(invoice, 'stamp', 'cufe', default=''),
-                    'Estado_DIAN': safe_get_nested(invoice, 'stamp', 'legalStatus', default=''),
-                    
-                    # Contadores
-                    'Cantidad_Items': len(invoice.get('items', [])) if invoice.get('items') else 0,
-                    'Cantidad_Retenciones': len(invoice.get('retentions', [])) if invoice.get('retentions') else 0,
-                    'Cantidad_Retenciones_Sugeridas': len(invoice.get('retentionsSuggested', [])) if invoice.get('retentionsSuggested') else 0,
-                }
-                
-                invoices_list.append(invoice_data)
-                
-                # Log información del centro de costos si existe
-                if invoice_data['Centro_Costo_ID']:
-                    logger.info(f"Factura {invoice_data['Numero_Factura']}: Centro de Costo ID={invoice_data['Centro_Costo_ID']}, Nombre='{invoice_data['Centro_Costo_Nombre']}'")
+                factura, items_factura, retenciones_factura, retenciones_sug_factura = procesar_factura(invoice, logger)
                 
-                # Datos comunes para referencia
-                invoice_id = invoice.get('id')
-                invoice_number = safe_get_nested(invoice, 'numberTemplate', 'fullNumber', default='')
-                
-                # Procesar items de la factura
-                items = invoice.get('items', [])
-                if items:
-                    logger.info(f"Procesando {len(items)} items para factura {invoice_number}")
-                    for item in items:
-                        if item is not None:
-                            # Procesar impuestos del item
-                            tax_amount = 0
-                            tax_info = item.get('tax', [])
-                            if tax_info:
-                                for tax in tax_info:
-                                    if tax is not None:
-                                        tax_amount += tax.get('amount', 0)
-                            
-                            item_data = {
-                                'Factura_ID': invoice_id,
-                                'Numero_Factura': invoice_number,
-                                'Item_Nombre': item.get('name', ''),
-                                'Item_Descripcion': item.get('description', ''),
-                                'Item_Precio': item.get('price', 0),
-                                'Item_Cantidad': item.get('quantity', 0),
-                                'Item_Descuento': item.get('discount', 0),
-                                'Item_Total': item.get('total', 0),
-                                'Item_Referencia': item.get('reference', ''),
-                                'Item_Unidad': item.get('unit', ''),
-                                'Item_Tax_Amount': tax_amount,  # NUEVO: Monto total de impuestos
-                            }
-                            items_list.append(item_data)
-                
-                # Procesar retenciones aplicadas
-                retenciones = invoice.get('retentions', [])
-                if retenciones:
-                    logger.info(f"Procesando {len(retenciones)} retenciones aplicadas para factura {invoice_number}")
-                    for retencion in retenciones:
-                        if retencion is not None:
-                            retencion_data = {
-                                'Factura_ID': invoice_id,
-                                'Numero_Factura': invoice_number,
-                                'Retencion_ID': retencion.get('id'),
-                                'Nombre': retencion.get('name', ''),
-                                'Porcentaje': retencion.get('percentage', 0),
-                                'Valor': retencion.get('amount', 0),
-                                'Clave_Referencia': retencion.get('referenceKey', ''),
-                                'Base': retencion.get('base', 0),
-                                'Tipo': 'APLICADA'
-                            }
-                            retenciones_list.append(retencion_data)
-                
-                # Procesar retenciones sugeridas
-                retenciones_sugeridas = invoice.get('retentionsSuggested', [])
-                if retenciones_sugeridas:
-                    logger.info(f"Procesando {len(retenciones_sugeridas)} retenciones sugeridas para factura {invoice_number}")
-                    for retencion_sug in retenciones_sugeridas:
-                        if retencion_sug is not None:
-                            retencion_sugerida_data = {
-                                'Factura_ID': invoice_id,
-                                'Numero_Factura': invoice_number,
-                                'Retencion_ID': retencion_sug.get('id'),
-                                'Nombre': retencion_sug.get('name', ''),
-                                'Porcentaje': retencion_sug.get('percentage', 0),
-                                'Valor_Sugerido': float(retencion_sug.get('amount', 0)) if retencion_sug.get('amount') else 0,
-                                'Clave_Referencia': retencion_sug.get('referenceKey', ''),
-                                'Base': retencion_sug.get('base', 0) if retencion_sug.get('base') else 0,
-                                'Tipo': 'SUGERIDA'
-                            }
-                            retenciones_sugeridas_list.append(retencion_sugerida_data)
+                invoices_list.append(factura)
+                items_list.extend(items_factura)
+                retenciones_list.extend(retenciones_factura)
+                retenciones_sugeridas_list.extend(retenciones_sug_factura)
                 
                 facturas_procesadas += 1
                 
@@ -264,48 +169,44 @@ def main():
         
         logger.info(f"Procesamiento completado: {facturas_procesadas} exitosas, {facturas_con_error} con errores")
         
-        # Crear DataFrames
-        df_invoices = pd.DataFrame(invoices_list)
-        df_items = pd.DataFrame(items_list)
-        df_retenciones = pd.DataFrame(retenciones_list)
-        df_retenciones_sugeridas = pd.DataFrame(retenciones_sugeridas_list)
+        logger.info(f"Registros generados:")
+        logger.info(f"  - Facturas: {len(invoices_list)}")
+        logger.info(f"  - Items: {len(items_list)}")
+        logger.info(f"  - Retenciones aplicadas: {len(retenciones_list)}")
+        logger.info(f"  - Retenciones sugeridas: {len(retenciones_sugeridas_list)}")
         
-        logger.info(f"DataFrames creados:")
-        logger.info(f"  - Facturas: {len(df_invoices)}")
-        logger.info(f"  - Items: {len(df_items)}")
-        logger.info(f"  - Retenciones aplicadas: {len(df_retenciones)}")
-        logger.info(f"  - Retenciones sugeridas: {len(df_retenciones_sugeridas)}")
+        # Facturas con centro de costos (se calcula una sola vez para logs y resumen)
+        facturas_con_centro = [f for f in invoices_list if f['Centro_Costo_ID']]
         
         # Mostrar resumen de centros de costos procesados
-        if len(df_invoices) > 0:
-            facturas_con_centro = df_invoices[df_invoices['Centro_Costo_ID'] != '']
-            if len(facturas_con_centro) > 0:
+        if invoices_list:
+            if facturas_con_centro:
                 logger.info(f"Facturas con centro de costos: {len(facturas_con_centro)}")
-                centros_unicos = facturas_con_centro[['Centro_Costo_ID', 'Centro_Costo_Nombre']].drop_duplicates()
+                centros_unicos = dict.fromkeys((f['Centro_Costo_ID'], f['Centro_Costo_Nombre']) for f in facturas_con_centro)
                 logger.info("Centros de costos encontrados:")
-                for _, centro in centros_unicos.iterrows():
-                    logger.info(f"  - ID: {centro['Centro_Costo_ID']}, Nombre: '{centro['Centro_Costo_Nombre']}'")
+                for centro_id, centro_nombre in centros_unicos:
+                    logger.info(f"  - ID: {centro_id}, Nombre: '{centro_nombre}'")
             else:
                 logger.info("Ninguna factura tiene centro de costos asignado")
         
         # Mostrar resumen de retenciones procesadas
-        if len(df_retenciones) > 0:
+        if retenciones_list and logger.isEnabledFor(logging.INFO):
             logger.info("Retenciones aplicadas encontradas:")
-            for _, ret in df_retenciones.iterrows():
-                logger.info(f"  - {ret['Nombre']}: {ret['Porcentaje']}% = ${ret['Valor']}")
+            for retencion in retenciones_list:
+                logger.info(f"  - {retencion['Nombre']}: {retencion['Porcentaje']}% = ${retencion['Valor']}")
         
-        if len(df_retenciones_sugeridas) > 0:
+        if retenciones_sugeridas_list and logger.isEnabledFor(logging.INFO):
             logger.info("Retenciones sugeridas encontradas:")
-            for _, ret in df_retenciones_sugeridas.iterrows():
-                logger.info(f"  - {ret['Nombre']}: {ret['Porcentaje']}% = ${ret['Valor_Sugerido']}")
+            for retencion_sug in retenciones_sugeridas_list:
+                logger.info(f"  - {retencion_sug['Nombre']}: {retencion_sug['Porcentaje']}% = ${retencion_sug['Valor_Sugerido']}")
         
         # Subir a listas de SharePoint
         logger.info("INICIANDO SUBIDA A LISTAS DE SHAREPOINT")
         success_listas = subir_facturas_completas_sharepoint(
-            df_invoices, 
-            df_items, 
-            df_retenciones, 
-            df_retenciones_sugeridas, 
+            invoices_list, 
+            items_list, 
+            retenciones_list, 
+            retenciones_sugeridas_list, 
             site_url, 
             list_name_facturas, 
             list_name_items, 
@@ -318,21 +219,21 @@ def main():
         logger.info("="*60)
         logger.info("RESUMEN FINAL DEL PROCESO CON RETENCIONES Y CENTRO DE COSTOS")
         logger.info("="*60)
-        logger.info(f"Facturas procesadas desde Alegra: {len(df_invoices)}")
-        logger.info(f"Items procesados: {len(df_items)}")
-        logger.info(f"Retenciones aplicadas procesadas: {len(df_retenciones)}")
-        logger.info(f"Retenciones sugeridas procesadas: {len(df_retenciones_sugeridas)}")
-        logger.info(f"Facturas con centro de costos: {len(df_invoices[df_invoices['Centro_Costo_ID'] != ''])}")
+        logger.info(f"Facturas procesadas desde Alegra: {len(invoices_list)}")
+        logger.info(f"Items procesados: {len(items_list)}")
+        logger.info(f"Retenciones aplicadas procesadas: {len(retenciones_list)}")
+        logger.info(f"Retenciones sugeridas procesadas: {len(retenciones_sugeridas_list)}")
+        logger.info(f"Facturas con centro de costos: {len(facturas_con_centro)}")
         logger.info(f"Datos subidos a listas: {'SI' if success_listas else 'NO'}")
         logger.info(f"Archivo de log: {log_file}")
         
         # Solo mostrar en consola el resumen final
         print(f"Proceso completado:")
-        print(f"  Facturas: {len(df_invoices)}")
-        print(f"  Items: {len(df_items)}")
-        print(f"  Retenciones aplicadas: {len(df_retenciones)}")
-        print(f"  Retenciones sugeridas: {len(df_retenciones_sugeridas)}")
-        print(f"  Facturas con centro de costos: {len(df_invoices[df_invoices['Centro_Costo_ID'] != ''])}")
+        print(f"  Facturas: {len(invoices_list)}")
+        print(f"  Items: {len(items_list)}")
+        print(f"  Retenciones aplicadas: {len(retenciones_list)}")
+        print(f"  Retenciones sugeridas: {len(retenciones_sugeridas_list)}")
+        print(f"  Facturas con centro de costos: {len(facturas_con_centro)}")
         print(f"Log guardado en: {log_file}")
         
         return success_listas
@@ -343,16 +244,163 @@ def main():
         print(f"ERROR: {str(e)}. Ver detalles en: {log_file}")
         return False
 
-def safe_get_nested(obj, *keys, default=''):
-    """Función helper para obtener valores anidados de forma segura"""
-    for key in keys:
-        if isinstance(obj, dict) and key in obj and obj[key] is not None:
-            obj = obj[key]
-        else:
-            return default
-    return obj if obj is not None else default
+def procesar_factura(invoice, logger):
+    """
+    Transformar una factura de Alegra en los registros a subir.
+    
+    Returns:
+        Tupla (factura, items, retenciones aplicadas, retenciones sugeridas)
+    """
+    # Objetos anidados de la factura (se leen una sola vez)
+    number_template = invoice.get('numberTemplate') or {}
+    client = invoice.get('client') or {}
+    client_address = client.get('address') or {}
+    seller = invoice.get('seller') or {}
+    cost_center = invoice.get('costCenter') or {}
+    warehouse = invoice.get('warehouse') or {}
+    stamp = invoice.get('stamp') or {}
+    
+    # Listas anidadas de la factura (se leen una sola vez)
+    items = invoice.get('items') or []
+    retenciones = invoice.get('retentions') or []
+    retenciones_sugeridas = invoice.get('retentionsSuggested') or []
+    
+    # Datos básicos de la factura
+    invoice_data = {
+        'ID': invoice.get('id'),
+        'Fecha': invoice.get('date'),
+        'Fecha_Vencimiento': invoice.get('dueDate'),
+        'Numero_Factura': number_template.get('fullNumber') or '',
+        'Estado': invoice.get('status'),
+        'Subtotal': invoice.get('subtotal', 0),
+        'Descuento': invoice.get('discount', 0),
+        'Impuestos': invoice.get('tax', 0),
+        'Total': invoice.get('total', 0),
+        'Total_Pagado': invoice.get('totalPaid', 0),
+        'Saldo': invoice.get('balance', 0),
+        'Termino_Pago': invoice.get('term', ''),
+        'Forma_Pago': invoice.get('paymentForm', ''),
+        
+        # Datos del cliente
+        'Cliente_ID': client.get('id') or '',
+        'Cliente_Nombre': client.get('name') or '',
+        'Cliente_Identificacion': client.get('identification') or '',
+        'Cliente_Email': client.get('email') or '',
+        'Cliente_Telefono': client.get('phonePrimary') or '',
+        'Cliente_Ciudad': client_address.get('city') or '',
+        'Cliente_Departamento': client_address.get('department') or '',
+        'Cliente_Direccion': client_address.get('address') or '',
+        
+        # Datos del vendedor
+        'Vendedor_Nombre': seller.get('name') or '',
+        'Vendedor_ID': seller.get('identification') or '',
+        
+        # NUEVO: Datos del centro de costos
+        'Centro_Costo_ID': cost_center.get('id') or '',
+        'Centro_Costo_Nombre': cost_center.get('name') or '',
+        'Centro_Costo_Codigo': cost_center.get('code') or '',
+        'Centro_Costo_Descripcion': cost_center.get('description') or '',
+        
+        # Datos adicionales
+        'Observaciones': invoice.get('observations', ''),
+        'Anotacion': invoice.get('anotation', ''),
+        'Almacen': warehouse.get('name') or '',
+        
+        # CUFE
+        'CUFE': stamp.get('cufe') or '',
+        'Estado_DIAN': stamp.get('legalStatus') or '',
+        
+        # Contadores
+        'Cantidad_Items': len(items),
+        'Cantidad_Retenciones': len(retenciones),
+        'Cantidad_Retenciones_Sugeridas': len(retenciones_sugeridas),
+    }
+    
+    # Log información del centro de costos si existe
+    if invoice_data['Centro_Costo_ID']:
+        logger.debug("Factura %s: Centro de Costo ID=%s, Nombre='%s'", invoice_data['Numero_Factura'], invoice_data['Centro_Costo_ID'], invoice_data['Centro_Costo_Nombre'])
+    
+    # Datos comunes para referencia
+    items_rows = []
+    retenciones_rows = []
+    retenciones_sug_rows = []
+    invoice_id = invoice_data['ID']
+    invoice_number = invoice_data['Numero_Factura']
+    
+    # Procesar items de la factura
+    if items:
+        logger.debug("Procesando %d items para factura %s", len(items), invoice_number)
+        for item in items:
+            if item is not None:
+                # Procesar impuestos del item
+                tax_amount = 0
+                tax_info = item.get('tax', [])
+                if tax_info:
+                    for tax in tax_info:
+                        if tax is not None:
+                            tax_amount += tax.get('amount', 0)
+                
+                item_data = {
+                    'Factura_ID': invoice_id,
+                    'Numero_Factura': invoice_number,
+                    'Item_Nombre': item.get('name', ''),
+                    'Item_Descripcion': item.get('description', ''),
+                    'Item_Precio': item.get('price', 0),
+                    'Item_Cantidad': item.get('quantity', 0),
+                    'Item_Descuento': item.get('discount', 0),
+                    'Item_Total': item.get('total', 0),
+                    'Item_Referencia': item.get('reference', ''),
+                    'Item_Unidad': item.get('unit', ''),
+                    'Item_Tax_Amount': tax_amount,  # NUEVO: Monto total de impuestos
+                }
+                items_rows.append(item_data)
+    
+    # Procesar retenciones aplicadas
+    if retenciones:
+        logger.debug("Procesando %d retenciones aplicadas para factura %s", len(retenciones), invoice_number)
+        for retencion in retenciones:
+            if retencion is not None:
+                retencion_data = {
+                    'Factura_ID': invoice_id,
+                    'Numero_Factura': invoice_number,
+                    'Retencion_ID': retencion.get('id'),
+                    'Nombre': retencion.get('name', ''),
+                    'Porcentaje': retencion.get('percentage', 0),
+                    'Valor': retencion.get('amount', 0),
+                    'Clave_Referencia': retencion.get('referenceKey', ''),
+                    'Base': retencion.get('base', 0),
+                    'Tipo': 'APLICADA'
+                }
+                retenciones_rows.append(retencion_data)
+    
+    # Procesar retenciones sugeridas
+    if retenciones_sugeridas:
+        logger.debug("Procesando %d retenciones sugeridas para factura %s", len(retenciones_sugeridas), invoice_number)
+        for retencion_sug in retenciones_sugeridas:
+            if retencion_sug is not None:
+                retencion_sugerida_data = {
+                    'Factura_ID': invoice_id,
+                    'Numero_Factura': invoice_number,
+                    'Retencion_ID': retencion_sug.get('id'),
+                    'Nombre': retencion_sug.get('name', ''),
+                    'Porcentaje': retencion_sug.get('percentage', 0),
+                    'Valor_Sugerido': float(retencion_sug.get('amount', 0)) if retencion_sug.get('amount') else 0,
+                    'Clave_Referencia': retencion_sug.get('referenceKey', ''),
+                    'Base': retencion_sug.get('base', 0) if retencion_sug.get('base') else 0,
+                    'Tipo': 'SUGERIDA'
+                }
+                retenciones_sug_rows.append(retencion_sugerida_data)
+    
+    return invoice_data, items_rows, retenciones_rows, retenciones_sug_rows
+
+def agrupar_por_factura(registros):
+    """Agrupar una lista de registros por Factura_ID en un dict {factura_id: [registros]}"""
+    agrupados = defaultdict(list)
+    for registro in registros:
+        agrupados[registro['Factura_ID']].append(registro)
+    return agrupados
 
-def subir_facturas_completas_sharepoint(df_invoices, df_items, df_retenciones, df_retenciones_sugeridas, 
+def subir_facturas_completas_sharepoint(invoices_list, items_list, retenciones_list, retenciones_sugeridas_list, 
                                        site_url, list_name_facturas, list_name_items, list_name_retenciones,
                                        list_name_retenciones_sugeridas, logger):
     """Subir facturas completas con items y retenciones a SharePoint"""
@@ -361,6 +409,12 @@ def subir_facturas_completas_sharepoint(df_invoices, df_items, df_retenciones, d
         
         sp_connector = SharePointConnector()
         
+        # Resolver sitio y listas destino en una sola solicitud
+        sp_connector.prefetch_ids(
+            sp_connector.get_azure_token(), site_url,
+            [list_name_facturas, list_name_items, list_name_retenciones, list_name_retenciones_sugeridas]
+        )
+        
         # Contadores
         success_count = 0
         error_count = 0
@@ -371,96 +425,119 @@ def subir_facturas_completas_sharepoint(df_invoices, df_items, df_retenciones, d
         retenciones_sug_success_total = 0
         retenciones_sug_error_total = 0
         
-        # Procesar cada factura individual
-        for index, factura_row in df_invoices.iterrows():
-            try:
-                # Obtener datos de la factura actual
-                factura_alegra_id = factura_row['ID']  # ID de Alegra
-                numero_factura = factura_row['Numero_Factura']
-                
-                logger.info(f"Procesando factura {index + 1}/{len(df_invoices)}: {numero_factura}")
-                
-                # 1. SUBIR FACTURA A SHAREPOINT
-                datos_factura = factura_row.to_dict()
-                factura_sharepoint_id = send_factura_sharepoint(sp_connector, datos_factura, site_url, list_name_facturas, logger)
-                
-                if factura_sharepoint_id:
-                    success_count += 1
-                    logger.info(f"Factura {numero_factura} subida con ID: {factura_sharepoint_id}")
+        # Agrupar items y retenciones por factura una sola vez
+        items_por_factura = agrupar_por_factura(items_list)
+        retenciones_por_factura = agrupar_por_factura(retenciones_list)
+        retenciones_sug_por_factura = agrupar_por_factura(retenciones_sugeridas_list)
+        
+        # Destino de cada tipo de registro hijo: (lista, constructor del payload)
+        destinos = {
+            'item': (list_name_items, construir_item_factura),
+            'retencion': (list_name_retenciones, construir_retencion_factura),
+            'retencion_sugerida': (list_name_retenciones_sugeridas, construir_retencion_sugerida_factura),
+        }
+        
+        # Registros hijos acumulados por tipo hasta completar un lote: [(datos, factura_sharepoint_id)]
+        pendientes = {tipo: [] for tipo in destinos}
+        
+        # Lotes de items y retenciones enviados: (tipo, lote, future)
+        subidas_hijas = []
+        
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            # Encolar todas las facturas; los items de cada una se encolan
+            # apenas se conoce su ID en SharePoint
+            subidas_facturas = [
+                executor.submit(send_factura_sharepoint, sp_connector, datos_factura, site_url, list_name_facturas, logger)
+                for datos_factura in invoices_list
+            ]
+            
+            # Procesar cada factura individual
+            for index, (datos_factura, future_factura) in enumerate(zip(invoices_list, subidas_facturas)):
+                try:
+                    # Obtener datos de la factura actual
+                    factura_alegra_id = datos_factura['ID']  # ID de Alegra
+                    numero_factura = datos_factura['Numero_Factura']
                     
-                    # 2. PROCESAR ITEMS DE ESTA FACTURA
-                    if not df_items.empty and 'Factura_ID' in df_items.columns:
-                        items_de_esta_factura = df_items[df_items['Factura_ID'] == factura_alegra_id]
-                        
-                        if not items_de_esta_factura.empty:
-                            logger.info(f"Procesando {len(items_de_esta_factura)} items de la factura {numero_factura}")
-                            
-                            for _, item_row in items_de_esta_factura.iterrows():
-                                try:
-                                    item_dict = item_row.to_dict()
-                                    item_id = send_item_factura_sharepoint(
-                                        sp_connector, item_dict, factura_sharepoint_id, site_url, list_name_items, logger
-                                    )
-                                    if item_id:
-                                        items_success_total += 1
-                                    else:
-                                        items_error_total += 1
-                                except Exception as e:
-                                    items_error_total += 1
-                                    logger.error(f"Error procesando item: {str(e)}")
+                    logger.debug("Procesando factura %d/%d: %s", index + 1, len(invoices_list), numero_factura)
                     
-                    # 3. PROCESAR RETENCIONES APLICADAS DE ESTA FACTURA
-                    if not df_retenciones.empty and 'Factura_ID' in df_retenciones.columns:
-                        retenciones_de_esta_factura = df_retenciones[df_retenciones['Factura_ID'] == factura_alegra_id]
-                        
-                        if not retenciones_de_esta_factura.empty:
-                            logger.info(f"Procesando {len(retenciones_de_esta_factura)} retenciones aplicadas de la factura {numero_factura}")
-                            
-                            for _, retencion_row in retenciones_de_esta_factura.iterrows():
-                                try:
-                                    retencion_dict = retencion_row.to_dict()
-                                    retencion_id = send_retencion_factura_sharepoint(
-                                        sp_connector, retencion_dict, factura_sharepoint_id, site_url, list_name_retenciones, logger
-                                    )
-                                    if retencion_id:
-                                        retenciones_success_total += 1
-                                        logger.info(f"Retención aplicada '{retencion_dict.get('Nombre')}' subida con ID: {retencion_id}")
-                                    else:
-                                        retenciones_error_total += 1
-                                except Exception as e:
-                                    retenciones_error_total += 1
-                                    logger.error(f"Error procesando retención aplicada: {str(e)}")
+                    # 1. ESPERAR LA SUBIDA DE LA FACTURA A SHAREPOINT
+                    factura_sharepoint_id = future_factura.result()
                     
-                    # 4. PROCESAR RETENCIONES SUGERIDAS DE ESTA FACTURA
-                    if not df_retenciones_sugeridas.empty and 'Factura_ID' in df_retenciones_sugeridas.columns:
-                        retenciones_sug_de_esta_factura = df_retenciones_sugeridas[df_retenciones_sugeridas['Factura_ID'] == factura_alegra_id]
+                    if factura_sharepoint_id:
+                        success_count += 1
+                        logger.debug("Factura %s subida con ID: %s", numero_factura, factura_sharepoint_id)
+                        
+                        # 2. ACUMULAR ITEMS Y RETENCIONES DE ESTA FACTURA (se envían en lotes $batch)
+                        hijos = (
+                            ('item', items_por_factura.get(factura_alegra_id)),
+                            ('retencion', retenciones_por_factura.get(factura_alegra_id)),
+                            ('retencion_sugerida', retenciones_sug_por_factura.get(factura_alegra_id)),
+                        )
                         
-                        if not retenciones_sug_de_esta_factura.empty:
-                            logger.info(f"Procesando {len(retenciones_sug_de_esta_factura)} retenciones sugeridas de la factura {numero_factura}")
+                        for tipo, registros in hijos:
+                            if not registros:
+                                continue
+                            
+                            logger.debug("Procesando %d registros '%s' de la factura %s", len(registros), tipo, numero_factura)
                             
-                            for _, retencion_sug_row in retenciones_sug_de_esta_factura.iterrows():
-                                try:
-                                    retencion_sug_dict = retencion_sug_row.to_dict()
-                                    retencion_sug_id = send_retencion_sugerida_factura_sharepoint(
-                                        sp_connector, retencion_sug_dict, factura_sharepoint_id, site_url, list_name_retenciones_sugeridas, logger
+                            for registro in registros:
+                                pendientes[tipo].append((registro, factura_sharepoint_id))
+                                
+                                if len(pendientes[tipo]) == GRAPH_BATCH_SIZE:
+                                    lote = pendientes[tipo]
+                                    pendientes[tipo] = []
+                                    list_name, construir_item = destinos[tipo]
+                                    future = executor.submit(
+                                        subir_lote_hijos,
+                                        sp_connector, lote, construir_item, site_url, list_name, logger
                                     )
-                                    if retencion_sug_id:
-                                        retenciones_sug_success_total += 1
-                                        logger.info(f"Retención sugerida '{retencion_sug_dict.get('Nombre')}' subida con ID: {retencion_sug_id}")
-                                    else:
-                                        retenciones_sug_error_total += 1
-                                except Exception as e:
-                                    retenciones_sug_error_total += 1
-                                    logger.error(f"Error procesando retención sugerida: {str(e)}")
-                    
-                else:
+                                    subidas_hijas.append((tipo, lote, future))
+                        
+                    else:
+                        error_count += 1
+                        logger.error(f"Error subiendo factura {numero_factura}")
+                        
+                except Exception as e:
                     error_count += 1
-                    logger.error(f"Error subiendo factura {numero_factura}")
-                    
-            except Exception as e:
-                error_count += 1
-                logger.error(f"Error procesando factura {index + 1}: {str(e)}")
-                continue
+                    logger.error(f"Error procesando factura {index + 1}: {str(e)}")
+                    continue
+            
+            # Enviar los lotes incompletos que quedaron pendientes
+            for tipo, lote in pendientes.items():
+                if lote:
+                    list_name, construir_item = destinos[tipo]
+                    future = executor.submit(
+                        subir_lote_hijos,
+                        sp_connector, lote, construir_item, site_url, list_name, logger
+                    )
+                    subidas_hijas.append((tipo, lote, future))
+            
+            # Recoger resultados de items y retenciones subidos en paralelo
+            for tipo, lote, future in subidas_hijas:
+                try:
+                    resultados = future.result()
+                except Exception as e:
+                    resultados = [None] * len(lote)
+                    logger.error(f"Error procesando lote de {tipo}: {str(e)}")
+                
+                for (datos, _), resultado_id in zip(lote, resultados):
+                    if tipo == 'item':
+                        if resultado_id:
+                            items_success_total += 1
+                        else:
+                            items_error_total += 1
+                    elif tipo == 'retencion':
+                        if resultado_id:
+                            retenciones_success_total += 1
+                            logger.debug("Retención aplicada '%s' subida con ID: %s", datos.get('Nombre'), resultado_id)
+                        else:
+                            retenciones_error_total += 1
+                    else:
+                        if resultado_id:
+                            retenciones_sug_success_total += 1
+                            logger.debug("Retención sugerida '%s' subida con ID: %s", datos.get('Nombre'), resultado_id)
+                        else:
+                            retenciones_sug_error_total += 1
         
         # RESUMEN FINAL
         logger.info("RESUMEN DE SUBIDA COMPLETA A LISTAS:")
@@ -509,93 +586,28 @@ def send_factura_sharepoint(sp_connector, datos_factura, site_url, list_name, lo
             }
         }
         
-        url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(url, headers=headers, json=item_data)
-        
-        if response.status_code == 201:
-            created_item = response.json()
-            
-            item_id = None
-            if 'id' in created_item:
-                item_id = created_item['id']
-            elif 'fields' in created_item and 'id' in created_item['fields']:
-                item_id = created_item['fields']['id']
-            elif 'fields' in created_item and 'ID' in created_item['fields']:
-                item_id = created_item['fields']['ID']
-            
-            return item_id
-        else:
-            logger.error(f"Error HTTP subiendo factura: {response.status_code} - {response.text}")
-            return None
+        return sp_connector.create_item(token, site_id, list_id, item_data)
         
     except Exception as e:
         logger.error(f"Error subiendo factura: {str(e)}")
         return None
 
-def send_item_factura_sharepoint(sp_connector, datos_item, factura_lookup_id, site_url, list_name, logger):
-    """Subir item de factura a lista de SharePoint"""
-    try:
-        token = sp_connector.get_azure_token()
-        site_id = sp_connector.get_site_id(token, site_url)
-        list_id = sp_connector.get_list_id(token, site_id, list_name)
-        
-        if not list_id:
-            return None
-        
-        lookup_variations = [
-            "Factura_x0020_de_x0020_VentaLookupId",
-            "Factura_x0020_de_x0020_Venta",
-            "FacturadeVentaLookupId", 
-            "FacturadeVenta"
-        ]
-        
-        for lookup_field in lookup_variations:
-            try:
-                item_data = {
-                    'fields': {
-                        lookup_field: int(factura_lookup_id),
-                        "Title": datos_item.get("Numero_Factura", ""),
-                        "Nombre": datos_item.get("Item_Nombre", ""),
-                        "Precio": datos_item.get("Item_Precio", 0),
-                        "Cantidad": datos_item.get("Item_Cantidad", 0),
-                        "Descuento": datos_item.get("Item_Descuento", 0),
-                        "Total": datos_item.get("Item_Total", 0),
-                        "ID_x0020_Factura": datos_item.get("Factura_ID", ""),  # NUEVO: ID de la factura
-                        "Impuestos": datos_item.get("Item_Tax_Amount", 0),     # NUEVO: Monto de impuestos
-                    }
-                }
-                
-                url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items"
-                headers = {
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json"
-                }
-                
-                response = requests.post(url, headers=headers, json=item_data)
-                
-                if response.status_code == 201:
-                    created_item = response.json()
-                    return created_item.get('id')
-                else:
-                    continue
-                    
-            except Exception as e:
-                continue
-        
-        logger.warning(f"No se pudo subir item con ningún campo lookup")
-        return None
-        
-    except Exception as e:
-        logger.error(f"Error subiendo item: {str(e)}")
-        return None
-
-def send_retencion_factura_sharepoint(sp_connector, datos_retencion, factura_lookup_id, site_url, list_name, logger):
-    """Subir retención aplicada de factura a lista de SharePoint"""
+def subir_lote_hijos(sp_connector, lote, construir_item, site_url, list_name, logger):
+    """
+    Subir un lote de items o retenciones de facturas con una solicitud $batch.
+    
+    Si no se pudo resolver el campo lookup desde el esquema de la lista, se prueba
+    cada variación con los registros que sigan pendientes.
+    
+    Args:
+        lote: Lista de tuplas (datos, factura_lookup_id)
+        construir_item: Función (datos, factura_lookup_id, lookup_field) que arma el payload
+        
+    Returns:
+        Lista con el ID creado (o None) de cada registro, en el mismo orden del lote
+    """
+    resultados = [None] * len(lote)
+    
     try:
         token = sp_connector.get_azure_token()
         site_id = sp_connector.get_site_id(token, site_url)
@@ -603,110 +615,66 @@ def send_retencion_factura_sharepoint(sp_connector, datos_retencion, factura_loo
         
         if not list_id:
             logger.error(f"No se pudo obtener el ID de la lista {list_name}")
-            return None
-        
-        # Intentar diferentes variaciones de campo lookup
-        lookup_variations = [
-            "Factura_x0020_de_x0020_VentaLookupId",
-            "Factura_x0020_de_x0020_Venta",
-            "FacturadeVentaLookupId", 
-            "FacturadeVenta"
-        ]
+            return resultados
         
-        for lookup_field in lookup_variations:
-            try:
-                item_data = {
-                    'fields': {
-                        lookup_field: int(factura_lookup_id),
-                        "Title": str(datos_retencion.get("Retencion_ID", "")),
-                        "Nombre": datos_retencion.get("Nombre", ""),
-                        "Porcentaje": float(datos_retencion.get("Porcentaje", 0)),
-                        "Monto": datos_retencion.get("Valor", 0),
-                        "Clave_x0020_Referencia": datos_retencion.get("Clave_Referencia", ""),
-                        "Base": datos_retencion.get("Base", 0),
-                    }
-                }
-                
-                url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items"
-                headers = {
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json"
-                }
-                
-                response = requests.post(url, headers=headers, json=item_data)
-                
-                if response.status_code == 201:
-                    created_item = response.json()
-                    return created_item.get('id')
-                else:
-                    continue
-                    
-            except Exception as e:
-                continue
+        resultados = sp_connector.batch_create_with_lookup(
+            token, site_id, list_id, lote,
+            lambda registro, lookup_field: construir_item(registro[0], registro[1], lookup_field),
+            FACTURA_LOOKUP_VARIATIONS,
+        )
         
-        logger.error(f"No se pudo subir retención con ningún campo lookup")
-        return None
+        pendientes = resultados.count(None)
+        if pendientes:
+            logger.error(f"No se pudieron subir {pendientes} registros a {list_name} con ningún campo lookup")
         
     except Exception as e:
-        logger.error(f"Error subiendo retención: {str(e)}")
-        return None
+        logger.error(f"Error subiendo lote a {list_name}: {str(e)}")
+    
+    return resultados
 
-def send_retencion_sugerida_factura_sharepoint(sp_connector, datos_retencion_sugerida, factura_lookup_id, site_url, list_name, logger):
-    """Subir retención sugerida de factura a lista de SharePoint"""
-    try:
-        token = sp_connector.get_azure_token()
-        site_id = sp_connector.get_site_id(token, site_url)
-        list_id = sp_connector.get_list_id(token, site_id, list_name)
-        
-        if not list_id:
-            logger.error(f"No se pudo obtener el ID de la lista {list_name}")
-            return None
-        
-        # Intentar diferentes variaciones de campo lookup
-        lookup_variations = [
-            "Factura_x0020_de_x0020_VentaLookupId",
-            "Factura_x0020_de_x0020_Venta",
-            "FacturadeVentaLookupId", 
-            "FacturadeVenta"
-        ]
-        
-        for lookup_field in lookup_variations:
-            try:
-                item_data = {
-                    'fields': {
-                        lookup_field: int(factura_lookup_id),
-                        "Title": str(datos_retencion_sugerida.get("Retencion_ID", "")),
-                        "Nombre": datos_retencion_sugerida.get("Nombre", ""),
-                        "Porcentaje": float(datos_retencion_sugerida.get("Porcentaje", 0)),
-                        "Monto": datos_retencion_sugerida.get("Valor_Sugerido", 0),
-                        "Clave_x0020_Referencia": datos_retencion_sugerida.get("Clave_Referencia", ""),
-                        "Base": datos_retencion_sugerida.get("Base", 0),
-                    }
-                }
-                
-                url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items"
-                headers = {
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json"
-                }
-                
-                response = requests.post(url, headers=headers, json=item_data)
-                
-                if response.status_code == 201:
-                    created_item = response.json()
-                    return created_item.get('id')
-                else:
-                    continue
-                    
-            except Exception as e:
-                continue
-        
-        logger.error(f"No se pudo subir retención sugerida con ningún campo lookup")
-        return None
-        
-    except Exception as e:
-        logger.error(f"Error subiendo retención sugerida: {str(e)}")
-        return None
+def construir_item_factura(datos_item, factura_lookup_id, lookup_field):
+    """Construir el payload de SharePoint para un item de factura"""
+    return {
+        'fields': {
+            lookup_field: int(factura_lookup_id),
+            "Title": datos_item.get("Numero_Factura", ""),
+            "Nombre": datos_item.get("Item_Nombre", ""),
+            "Precio": datos_item.get("Item_Precio", 0),
+            "Cantidad": datos_item.get("Item_Cantidad", 0),
+            "Descuento": datos_item.get("Item_Descuento", 0),
+            "Total": datos_item.get("Item_Total", 0),
+            "ID_x0020_Factura": datos_item.get("Factura_ID", ""),  # NUEVO: ID de la factura
+            "Impuestos": datos_item.get("Item_Tax_Amount", 0),     # NUEVO: Monto de impuestos
+        }
+    }
+
+def construir_retencion_factura(datos_retencion, factura_lookup_id, lookup_field):
+    """Construir el payload de SharePoint para una retención aplicada de factura"""
+    return {
+        'fields': {
+            lookup_field: int(factura_lookup_id),
+            "Title": str(datos_retencion.get("Retencion_ID", "")),
+            "Nombre": datos_retencion.get("Nombre", ""),
+            "Porcentaje": float(datos_retencion.get("Porcentaje", 0)),
+            "Monto": datos_retencion.get("Valor", 0),
+            "Clave_x0020_Referencia": datos_retencion.get("Clave_Referencia", ""),
+            "Base": datos_retencion.get("Base", 0),
+        }
+    }
+
+def construir_retencion_sugerida_factura(datos_retencion_sugerida, factura_lookup_id, lookup_field):
+    """Construir el payload de SharePoint para una retención sugerida de factura"""
+    return {
+        'fields': {
+            lookup_field: int(factura_lookup_id),
+            "Title": str(datos_retencion_sugerida.get("Retencion_ID", "")),
+            "Nombre": datos_retencion_sugerida.get("Nombre", ""),
+            "Porcentaje": float(datos_retencion_sugerida.get("Porcentaje", 0)),
+            "Monto": datos_retencion_sugerida.get("Valor_Sugerido", 0),
+            "Clave_x0020_Referencia": datos_retencion_sugerida.get("Clave_Referencia", ""),
+            "Base": datos_retencion_sugerida.get("Base", 0),
+        }
+    }
 
 if __name__ == "__main__":
     success = main()
@@ -1,27 +1,74 @@
-import requests
 import base64
 import os
 import sys
-import pandas as pd
 import logging
-from datetime import datetime, date, timedelta
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
 from dotenv import load_dotenv
 
-# Agregar el directorio padre al path para importaciones
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Agregar el directorio padre al path para importaciones (una sola vez, aunque
+# el módulo se importe desde otro script)
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
 
-from core.sharepoint_connector import SharePointConnector
+from core.sharepoint_connector import SharePointConnector, GRAPH_BATCH_SIZE
+from core.http_session import MAX_WORKERS
+from core.alegra import get_all_pages, normalize_date
+from core.logging_utils import get_log_level
+from core.sharepoint_fields import CAMPOS_PAGO, CAMPOS_ANTICIPO, CAMPOS_FACTURA_CATEGORIA
+
+# Campos de relaciones (factura, categoría, anticipo) vacíos por defecto; cada
+# registro unificado parte de estos valores y sobrescribe solo los de su tipo
+REGISTRO_PAGO_VACIO = {
+    # Campos para facturas
+    'Factura_ID': '',
+    'Factura_Numero': '',
+    'Factura_Fecha': None,
+    'Factura_Monto_Pagado': 0,
+    'Factura_Total': 0,
+    'Factura_Saldo': 0,
+    
+    # Campos para categorías
+    'Categoria_ID': '',
+    'Categoria_Nombre': '',
+    'Categoria_Precio': 0,
+    'Categoria_Cantidad': 0,
+    'Categoria_Total': 0,
+    'Categoria_Observaciones': '',
+    'Categoria_Comportamiento': '',
+    
+    # Campos para anticipos aplicados
+    'Anticipo_ID': '',
+    'Anticipo_Numero': '',
+    'Anticipo_Fecha': None,
+    'Anticipo_Fecha_Vencimiento': None,
+    'Anticipo_Monto_Aplicado': 0,
+    'Anticipo_Total_Factura': 0,
+    'Anticipo_Total_Pagado_Factura': 0,
+    'Anticipo_Saldo_Factura': 0,
+    
+    # Tipo de registro
+    'Tipo_Registro': 'PAGO_SIMPLE'
+}
+
+# Columnas que identifican un registro unificado en la lista de pagos (el pago,
+# más la factura, el anticipo o la categoría a la que corresponde)
+COLUMNAS_IDENTIDAD_PAGO = ("Title", "ID_x0020_Factura", "ID_x0020_Anticipo", "Nombre_x0020_Categoria")
 
 # Configurar logging
 def setup_logging():
     """Configurar el sistema de logging"""
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
+    os.makedirs('logs', exist_ok=True)
     
-    log_filename = f"logs/pagos_alegra_{datetime.now().strftime('%Y-%m-%d')}.log"
+    log_filename = f"logs/pagos_alegra_{date.today().isoformat()}.log"
+    
+    # LOG_LEVEL=DEBUG para ver el detalle por pago
+    nivel, nivel_invalido = get_log_level()
     
     logging.basicConfig(
-        level=logging.INFO,
+        level=nivel,
         format='%(asctime)s - %(levelname)s - %(message)s',
         handlers=[
             logging.FileHandler(log_filename, encoding='utf-8'),
@@ -33,9 +80,15 @@ def setup_logging():
     console_handler = logging.getLogger().handlers[1]
     console_handler.setLevel(logging.ERROR)
     
+    if nivel_invalido:
+        logging.warning(f"LOG_LEVEL inválido: {nivel_invalido}, se usa INFO")
+    
     return log_filename
 
 def main():
+    # Cargar configuración antes del logging (LOG_LEVEL puede venir del .env)
+    load_dotenv()
+    
     log_file = setup_logging()
     logger = logging.getLogger(__name__)
     
@@ -44,10 +97,6 @@ def main():
     logger.info("="*60)
     
     try:
-        # Cargar configuración
-        load_dotenv()
-        logger.info("Variables de entorno cargadas")
-        
         # Credenciales Alegra
         username = os.getenv("email")
         password = os.getenv("password")
@@ -72,8 +121,7 @@ def main():
         encoded_credentials = base64.b64encode(credentials.encode()).decode()
         
         # Fecha de consulta (ayer)
-        ayer = date.today() - timedelta(days=1)
-        ayer_str = ayer.strftime('%Y-%m-%d')
+        ayer_str = (date.today() - timedelta(days=1)).isoformat()
         logger.info(f"Procesando pagos del día: {ayer_str}")
         
         # Obtener datos de Alegra
@@ -101,7 +149,7 @@ def main():
         # Si hay pagos para procesar, subirlos a SharePoint
         if len(pagos_unificados) > 0:
             logger.info("Iniciando subida a SharePoint...")
-            success = subir_pagos_sharepoint(pagos_unificados, site_url, list_name_pagos, logger)
+            success = subir_pagos_sharepoint(pagos_unificados, ayer_str, site_url, list_name_pagos, logger)
         else:
             logger.warning("Se encontraron pagos pero todos tuvieron errores de procesamiento")
             success = False
@@ -133,34 +181,29 @@ def main():
         print(f"ERROR: {str(e)}. Ver detalles en: {log_file}")
         return False
 
-def safe_get_nested(obj, *keys, default=''):
-    """Función helper para obtener valores anidados de forma segura"""
-    for key in keys:
-        if isinstance(obj, dict) and key in obj and obj[key] is not None:
-            obj = obj[key]
-        else:
-            return default
-    return obj if obj is not None else default
-
 def obtener_pagos_alegra(encoded_credentials, fecha_str, logger):
-    """Obtener pagos desde la API de Alegra"""
+    """
+    Obtener todos los pagos de una fecha desde la API de Alegra.
+    
+    Returns:
+        Lista de pagos, o None si hubo error
+    """
     try:
-        url = f"https://api.alegra.com/api/v1/payments?order_direction=DESC&metadata=false&includeUnconciliated=false&date={fecha_str}"
-        
         headers = {
             "accept": "application/json",
             "authorization": f"Basic {encoded_credentials}"
         }
+        params = {
+            "order_direction": "DESC",
+            "metadata": "false",
+            "includeUnconciliated": "false",
+            "date": fecha_str,
+        }
         
-        response = requests.get(url, headers=headers)
+        pagos = get_all_pages("https://api.alegra.com/api/v1/payments", headers, params)
         
-        if response.status_code == 200:
-            data = response.json()
-            logger.info(f"API respondió exitosamente con {len(data)} pagos")
-            return data
-        else:
-            logger.error(f"Error en API Alegra: {response.status_code} - {response.text}")
-            return None
+        logger.info(f"API respondió exitosamente con {len(pagos)} pagos")
+        return pagos
     
     except Exception as e:
         logger.error(f"Error consultando API Alegra: {str(e)}")
@@ -181,12 +224,18 @@ def procesar_pagos_unificado_con_anticipos(data, logger):
             continue
         
         try:
-            # Registro base del pago
-            pago_base = {
+            # Objetos anidados del pago (se leen una sola vez)
+            number_template = payment.get('numberTemplate') or {}
+            bank_account = payment.get('bankAccount') or {}
+            client = payment.get('client') or {}
+            cost_center = payment.get('costCenter') or {}
+            
+            # Datos propios del pago, comunes a todos sus registros
+            pago_core = {
                 # Datos principales del pago
                 'Pago_ID': payment.get('id'),
                 'Fecha': payment.get('date'),
-                'Numero_Pago': safe_get_nested(payment, 'numberTemplate', 'fullNumber', default=''),
+                'Numero_Pago': number_template.get('fullNumber') or '',
                 'Numero_Interno': payment.get('number'),
                 'Monto_Total': payment.get('amount', 0),
                 'Tipo_Pago': payment.get('type'),
@@ -196,121 +245,91 @@ def procesar_pagos_unificado_con_anticipos(data, logger):
                 'Anotaciones_Pago': payment.get('anotation', ''),
                 
                 # Cuenta bancaria
-                'Cuenta_ID': safe_get_nested(payment, 'bankAccount', 'id', default=''),
-                'Cuenta_Nombre': safe_get_nested(payment, 'bankAccount', 'name', default=''),
-                'Cuenta_Tipo': safe_get_nested(payment, 'bankAccount', 'type', default=''),
+                'Cuenta_ID': bank_account.get('id') or '',
+                'Cuenta_Nombre': bank_account.get('name') or '',
+                'Cuenta_Tipo': bank_account.get('type') or '',
                 
                 # Cliente
-                'Cliente_ID': safe_get_nested(payment, 'client', 'id', default=''),
-                'Cliente_Nombre': safe_get_nested(payment, 'client', 'name', default=''),
-                'Cliente_Telefono': safe_get_nested(payment, 'client', 'phone', default=''),
-                'Cliente_Identificacion': safe_get_nested(payment, 'client', 'identification', default=''),
+                'Cliente_ID': client.get('id') or '',
+                'Cliente_Nombre': client.get('name') or '',
+                'Cliente_Telefono': client.get('phone') or '',
+                'Cliente_Identificacion': client.get('identification') or '',
                 
                 # Centro de costo
-                'Centro_Costo_ID': safe_get_nested(payment, 'costCenter', 'id', default=''),
-                'Centro_Costo_Codigo': safe_get_nested(payment, 'costCenter', 'code', default=''),
-                'Centro_Costo_Nombre': safe_get_nested(payment, 'costCenter', 'name', default=''),
-                
-                # Campos para facturas (vacíos por defecto)
-                'Factura_ID': '',
-                'Factura_Numero': '',
-                'Factura_Fecha': None,
-                'Factura_Monto_Pagado': 0,
-                'Factura_Total': 0,
-                'Factura_Saldo': 0,
-                
-                # Campos para categorías (vacíos por defecto)
-                'Categoria_ID': '',
-                'Categoria_Nombre': '',
-                'Categoria_Precio': 0,
-                'Categoria_Cantidad': 0,
-                'Categoria_Total': 0,
-                'Categoria_Observaciones': '',
-                'Categoria_Comportamiento': '',
-                
-                # NUEVO: Campos para anticipos aplicados (vacíos por defecto)
-                'Anticipo_ID': '',
-                'Anticipo_Numero': '',
-                'Anticipo_Fecha': None,
-                'Anticipo_Fecha_Vencimiento': None,
-                'Anticipo_Monto_Aplicado': 0,
-                'Anticipo_Total_Factura': 0,
-                'Anticipo_Total_Pagado_Factura': 0,
-                'Anticipo_Saldo_Factura': 0,
-                
-                # Tipo de registro
-                'Tipo_Registro': 'PAGO_SIMPLE'
+                'Centro_Costo_ID': cost_center.get('id') or '',
+                'Centro_Costo_Codigo': cost_center.get('code') or '',
+                'Centro_Costo_Nombre': cost_center.get('name') or '',
             }
             
+            # Registro base: datos del pago con las relaciones vacías
+            pago_base = {**pago_core, **REGISTRO_PAGO_VACIO}
+            
             # Verificar facturas, categorías y anticipos
-            invoices = payment.get('invoices', [])
-            categories = payment.get('categories', [])
-            applied_advances = payment.get('appliedAdvances', [])  # NUEVO: Anticipos aplicados
+            invoices = payment.get('invoices') or ()
+            categories = payment.get('categories') or ()
+            applied_advances = payment.get('appliedAdvances') or ()  # NUEVO: Anticipos aplicados
             
             # Contar anticipos encontrados para estadísticas
             if applied_advances:
                 anticipos_encontrados += len(applied_advances)
-                logger.debug(f"Pago {pago_base['Numero_Pago']}: Encontrados {len(applied_advances)} anticipos aplicados")
+                logger.debug("Pago %s: Encontrados %d anticipos aplicados", pago_base['Numero_Pago'], len(applied_advances))
             
             if not invoices and not categories and not applied_advances:
                 # Pago simple sin relaciones
                 pagos_unificados.append(pago_base)
-                logger.debug(f"Pago simple procesado: {pago_base['Numero_Pago']}")
+                logger.debug("Pago simple procesado: %s", pago_base['Numero_Pago'])
                 
             else:
                 # Si tiene facturas
-                if invoices:
-                    for invoice in invoices:
-                        if invoice is not None:
-                            pago_con_factura = pago_base.copy()
-                            pago_con_factura.update({
-                                'Factura_ID': invoice.get('id'),
-                                'Factura_Numero': invoice.get('number'),
-                                'Factura_Fecha': invoice.get('date'),
-                                'Factura_Monto_Pagado': invoice.get('amount', 0),
-                                'Factura_Total': invoice.get('total', 0),
-                                'Factura_Saldo': invoice.get('balance', 0),
-                                'Tipo_Registro': 'PAGO_CON_FACTURA'
-                            })
-                            pagos_unificados.append(pago_con_factura)
-                            logger.debug(f"Pago con factura procesado: {pago_base['Numero_Pago']} -> {invoice.get('number')}")
+                for invoice in invoices:
+                    if invoice is not None:
+                        pago_con_factura = {
+                            **pago_base,
+                            'Factura_ID': invoice.get('id'),
+                            'Factura_Numero': invoice.get('number'),
+                            'Factura_Fecha': normalize_date(invoice.get('date')),
+                            'Factura_Monto_Pagado': invoice.get('amount', 0),
+                            'Factura_Total': invoice.get('total', 0),
+                            'Factura_Saldo': invoice.get('balance', 0),
+                            'Tipo_Registro': 'PAGO_CON_FACTURA'
+                        }
+                        pagos_unificados.append(pago_con_factura)
+                        logger.debug("Pago con factura procesado: %s -> %s", pago_base['Numero_Pago'], invoice.get('number'))
                 
                 # Si tiene categorías
-                if categories:
-                    for category in categories:
-                        if category is not None:
-                            pago_con_categoria = pago_base.copy()
-                            pago_con_categoria.update({
-                                'Categoria_ID': category.get('id'),
-                                'Categoria_Nombre': category.get('name'),
-                                'Categoria_Precio': category.get('price', 0),
-                                'Categoria_Cantidad': category.get('quantity', 0),
-                                'Categoria_Total': category.get('total', 0),
-                                'Categoria_Observaciones': category.get('observations', ''),
-                                'Categoria_Comportamiento': category.get('behavior', ''),
-                                'Tipo_Registro': 'PAGO_CON_CATEGORIA'
-                            })
-                            pagos_unificados.append(pago_con_categoria)
-                            logger.debug(f"Pago con categoría procesado: {pago_base['Numero_Pago']} -> {category.get('name')}")
+                for category in categories:
+                    if category is not None:
+                        pago_con_categoria = {
+                            **pago_base,
+                            'Categoria_ID': category.get('id'),
+                            'Categoria_Nombre': category.get('name'),
+                            'Categoria_Precio': category.get('price', 0),
+                            'Categoria_Cantidad': category.get('quantity', 0),
+                            'Categoria_Total': category.get('total', 0),
+                            'Categoria_Observaciones': category.get('observations', ''),
+                            'Categoria_Comportamiento': category.get('behavior', ''),
+                            'Tipo_Registro': 'PAGO_CON_CATEGORIA'
+                        }
+                        pagos_unificados.append(pago_con_categoria)
+                        logger.debug("Pago con categoría procesado: %s -> %s", pago_base['Numero_Pago'], category.get('name'))
                 
                 # NUEVO: Si tiene anticipos aplicados
-                if applied_advances:
-                    for advance in applied_advances:
-                        if advance is not None:
-                            pago_con_anticipo = pago_base.copy()
-                            pago_con_anticipo.update({
-                                'Anticipo_ID': advance.get('id'),
-                                'Anticipo_Numero': advance.get('number'),
-                                'Anticipo_Fecha': advance.get('date'),
-                                'Anticipo_Fecha_Vencimiento': advance.get('dueDate'),
-                                'Anticipo_Monto_Aplicado': advance.get('amount', 0),
-                                'Anticipo_Total_Factura': advance.get('total', 0),
-                                'Anticipo_Total_Pagado_Factura': advance.get('totalPaid', 0),
-                                'Anticipo_Saldo_Factura': advance.get('balance', 0),
-                                'Tipo_Registro': 'PAGO_CON_ANTICIPO'  # NUEVO tipo de registro
-                            })
-                            pagos_unificados.append(pago_con_anticipo)
-                            logger.debug(f"Pago con anticipo procesado: {pago_base['Numero_Pago']} -> {advance.get('number')} (${advance.get('amount', 0)})")
+                for advance in applied_advances:
+                    if advance is not None:
+                        pago_con_anticipo = {
+                            **pago_base,
+                            'Anticipo_ID': advance.get('id'),
+                            'Anticipo_Numero': advance.get('number'),
+                            'Anticipo_Fecha': normalize_date(advance.get('date')),
+                            'Anticipo_Fecha_Vencimiento': normalize_date(advance.get('dueDate')),
+                            'Anticipo_Monto_Aplicado': advance.get('amount', 0),
+                            'Anticipo_Total_Factura': advance.get('total', 0),
+                            'Anticipo_Total_Pagado_Factura': advance.get('totalPaid', 0),
+                            'Anticipo_Saldo_Factura': advance.get('balance', 0),
+                            'Tipo_Registro': 'PAGO_CON_ANTICIPO'  # NUEVO tipo de registro
+                        }
+                        pagos_unificados.append(pago_con_anticipo)
+                        logger.debug("Pago con anticipo procesado: %s -> %s ($%s)", pago_base['Numero_Pago'], advance.get('number'), advance.get('amount', 0))
             
             pagos_procesados += 1
             
@@ -324,10 +343,7 @@ def procesar_pagos_unificado_con_anticipos(data, logger):
     logger.info(f"Total anticipos aplicados encontrados: {anticipos_encontrados}")
     
     # Mostrar estadísticas de tipos de registro
-    tipos_registro = {}
-    for pago in pagos_unificados:
-        tipo = pago.get('Tipo_Registro', 'DESCONOCIDO')
-        tipos_registro[tipo] = tipos_registro.get(tipo, 0) + 1
+    tipos_registro = Counter(pago['Tipo_Registro'] for pago in pagos_unificados)
     
     logger.info("Estadísticas de tipos de registro:")
     for tipo, cantidad in tipos_registro.items():
@@ -335,34 +351,62 @@ def procesar_pagos_unificado_con_anticipos(data, logger):
     
     return pagos_unificados
 
-def subir_pagos_sharepoint(pagos_unificados, site_url, list_name, logger):
+def subir_pagos_sharepoint(pagos_unificados, fecha_str, site_url, list_name, logger):
     """Subir pagos unificados a SharePoint"""
     try:
         logger.info("Inicializando conexión a SharePoint...")
         sp_connector = SharePointConnector()
         
+        token = sp_connector.get_azure_token()
+        sp_connector.prefetch_ids(token, site_url, [list_name])
+        site_id = sp_connector.get_site_id(token, site_url)
+        list_id = sp_connector.get_list_id(token, site_id, list_name)
+        
+        if not list_id:
+            logger.error(f"No se pudo obtener ID de la lista {list_name}")
+            return False
+        
+        # Omitir registros de pagos que ya están en la lista (re-ejecuciones del día)
+        pagos_unificados = filtrar_pagos_existentes(sp_connector, token, site_id, list_id, pagos_unificados, fecha_str, logger)
+        if not pagos_unificados:
+            logger.info("Todos los pagos ya existen en SharePoint, no hay nada que subir")
+            return True
+        
         success_count = 0
         error_count = 0
+        total = len(pagos_unificados)
         
-        for i, pago_data in enumerate(pagos_unificados):
-            try:
-                numero_pago = pago_data.get('Numero_Pago', f"ID-{pago_data.get('Pago_ID')}")
-                tipo_registro = pago_data.get('Tipo_Registro', 'DESCONOCIDO')
-                logger.info(f"Subiendo registro {i + 1}/{len(pagos_unificados)}: {numero_pago} ({tipo_registro})")
-                
-                result = send_pago_unificado_sharepoint(sp_connector, pago_data, site_url, list_name, logger)
+        # Subir en lotes de GRAPH_BATCH_SIZE registros por solicitud $batch,
+        # con varios lotes en vuelo a la vez
+        lotes = [pagos_unificados[inicio:inicio + GRAPH_BATCH_SIZE] for inicio in range(0, total, GRAPH_BATCH_SIZE)]
+        logger.info(f"Subiendo {total} registros en {len(lotes)} lotes")
+        
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            subidas = {
+                executor.submit(subir_lote_pagos, sp_connector, lote, site_id, list_id): (numero_lote, lote)
+                for numero_lote, lote in enumerate(lotes, 1)
+            }
+            
+            # Contabilizar cada lote apenas termina, sin esperar a los anteriores
+            for future in as_completed(subidas):
+                numero_lote, lote = subidas[future]
+                try:
+                    resultados = future.result()
+                except Exception as e:
+                    error_count += len(lote)
+                    logger.error(f"Error procesando lote {numero_lote}/{len(lotes)}: {str(e)}")
+                    continue
                 
-                if result:
-                    success_count += 1
-                    logger.debug(f"Registro {numero_pago} subido con ID: {result}")
-                else:
-                    error_count += 1
-                    logger.error(f"Error subiendo registro {numero_pago}")
+                for pago_data, result in zip(lote, resultados):
+                    numero_pago = pago_data.get('Numero_Pago', f"ID-{pago_data.get('Pago_ID')}")
+                    tipo_registro = pago_data.get('Tipo_Registro', 'DESCONOCIDO')
                     
-            except Exception as e:
-                error_count += 1
-                logger.error(f"Error procesando registro {i + 1}: {str(e)}")
-                continue
+                    if result:
+                        success_count += 1
+                        logger.debug("Registro %s (%s) subido con ID: %s", numero_pago, tipo_registro, result)
+                    else:
+                        error_count += 1
+                        logger.error(f"Error subiendo registro {numero_pago} ({tipo_registro})")
         
         logger.info(f"Subida completada: {success_count} exitosos, {error_count} errores")
         return success_count > 0
@@ -371,125 +415,85 @@ def subir_pagos_sharepoint(pagos_unificados, site_url, list_name, logger):
         logger.error(f"Error durante subida a SharePoint: {str(e)}")
         return False
 
-def send_pago_unificado_sharepoint(sp_connector, pago_data, site_url, list_name, logger):
-    """Subir un registro unificado de pago a SharePoint - VERSIÓN CORREGIDA CON LÓGICA CONDICIONAL"""
-    try:
-        token = sp_connector.get_azure_token()
-        site_id = sp_connector.get_site_id(token, site_url)
-        list_id = sp_connector.get_list_id(token, site_id, list_name)
-        
-        if not list_id:
-            logger.error(f"No se pudo obtener ID de la lista {list_name}")
-            return None
-        
-        # VERIFICAR EL TIPO DE REGISTRO PRIMERO
-        tipo_registro = pago_data.get("Tipo_Registro", "")
-        
-        if tipo_registro == "PAGO_CON_ANTICIPO":
-            # SOLO campos para anticipos
-            item_data = {
-                'fields': {
-                    "Title": str(pago_data.get("Pago_ID", "")),
-                    "Fecha": pago_data.get("Fecha", ""),
-                    "Numero_x0020_Pago": pago_data.get("Numero_Pago", ""),
-                    "Numero_x0020_Interno": pago_data.get("Numero_Interno", ""),
-                    "Monto_x0020_Total": pago_data.get("Monto_Total", 0),
-                    "Tipo_x0020_Pago": pago_data.get("Tipo_Pago", ""),
-                    "Metodo_x0020_Pago": pago_data.get("Metodo_Pago", ""),
-                    "Estado_x0020_Pago": pago_data.get("Estado_Pago", ""),
-                    "Observaciones": pago_data.get("Observaciones_Pago", "") or "",
-                    "Cuenta_x0020_Nombre": pago_data.get("Cuenta_Nombre", ""),
-                    "ID_x0020_Cuenta": pago_data.get("Cuenta_ID", ""),
-                    "Cuenta_x0020_Tipo": pago_data.get("Cuenta_Tipo", ""),
-                    "ID_x0020_Cliente": pago_data.get("Cliente_ID", ""),
-                    "Nombre_x0020_Cliente": pago_data.get("Cliente_Nombre", ""),
-                    "Identificacion_x0020_Cliente": pago_data.get("Cliente_Identificacion", ""),
-                    "Nombre_x0020_Categoria": "Avances y anticipos recibidos",
-                    # Campos específicos de anticipo
-                    "ID_x0020_Anticipo": pago_data.get("Anticipo_ID", ""),
-                    "Anticipo_x0020_Numero": pago_data.get("Anticipo_Numero", ""),
-                    "Anticipo_x0020_Total_x0020_Factu": pago_data.get("Anticipo_Total_Factura", 0),
-                    "Anticipo_x0020_Total_x0020_Pagad": pago_data.get("Anticipo_Total_Pagado_Factura", 0),
-                    "Anticipo_x0020_Saldo_x0020_Factu": pago_data.get("Anticipo_Saldo_Factura", 0),
-                    "Anticipo_x0020_Monto_x0020_Aplic": pago_data.get("Anticipo_Monto_Aplicado", 0),
-                    "Anticipo": True  # Campo Sí/No - siempre True para anticipos
-                }
-            }
-            
-            # Solo agregar fechas de anticipo si tienen valor válido
-            fecha_anticipo = pago_data.get("Anticipo_Fecha")
-            if fecha_anticipo and str(fecha_anticipo).strip():
-                item_data['fields']["Anticipo_x0020_Fecha"] = fecha_anticipo
-                
-            fecha_venc_anticipo = pago_data.get("Anticipo_Fecha_Vencimiento")
-            if fecha_venc_anticipo and str(fecha_venc_anticipo).strip():
-                item_data['fields']["Anticipo_x0020_Fecha_x0020_Venci"] = fecha_venc_anticipo
-        
+def filtrar_pagos_existentes(sp_connector, token, site_id, list_id, pagos_unificados, fecha_str, logger):
+    """
+    Quitar los registros unificados que ya existen en la lista de SharePoint.
+    
+    Un pago de Alegra genera varios registros (uno por factura, categoría o
+    anticipo), así que se compara la identidad completa de cada registro
+    (COLUMNAS_IDENTIDAD_PAGO) contra los items con Fecha igual a fecha_str. Se
+    cuentan las repeticiones, de modo que si una ejecución anterior subió solo
+    parte de los registros de un pago, los que faltan se vuelven a subir. Si la
+    consulta falla se suben todos los registros.
+    """
+    existentes = sp_connector.get_field_values(
+        token, site_id, list_id, COLUMNAS_IDENTIDAD_PAGO, f"fields/Fecha eq '{fecha_str}'"
+    )
+    if existentes is None:
+        logger.error("No se pudieron consultar los pagos existentes; se suben todos los registros sin deduplicar")
+        return pagos_unificados
+    if not existentes:
+        return pagos_unificados
+    
+    pendientes = []
+    for pago in pagos_unificados:
+        identidad = identidad_registro_pago(pago)
+        if existentes[identidad]:
+            existentes[identidad] -= 1
         else:
-            item_data = {
-                'fields': {
-                    "Title": str(pago_data.get("Pago_ID", "")),
-                    "Fecha": pago_data.get("Fecha", ""),
-                    "Numero_x0020_Pago": pago_data.get("Numero_Pago", ""),
-                    "Numero_x0020_Interno": pago_data.get("Numero_Interno", ""),
-                    "Monto_x0020_Total": pago_data.get("Monto_Total", 0),
-                    "Tipo_x0020_Pago": pago_data.get("Tipo_Pago", ""),
-                    "Metodo_x0020_Pago": pago_data.get("Metodo_Pago", ""),
-                    "Estado_x0020_Pago": pago_data.get("Estado_Pago", ""),
-                    "Observaciones": pago_data.get("Observaciones_Pago", "") or "",
-                    "Cuenta_x0020_Nombre": pago_data.get("Cuenta_Nombre", ""),
-                    "ID_x0020_Cuenta": pago_data.get("Cuenta_ID", ""),
-                    "Cuenta_x0020_Tipo": pago_data.get("Cuenta_Tipo", ""),
-                    "ID_x0020_Cliente": pago_data.get("Cliente_ID", ""),
-                    "Nombre_x0020_Cliente": pago_data.get("Cliente_Nombre", ""),
-                    "Identificacion_x0020_Cliente": pago_data.get("Cliente_Identificacion", ""),
-                    "ID_x0020_Factura": pago_data.get("Factura_ID", ""),
-                    "Numero_x0020_Factura": pago_data.get("Factura_Numero", ""),
-                    "Factura_x0020_Monto_x0020_Pagado": pago_data.get("Factura_Monto_Pagado", 0),
-                    "Total_x0020_Factura": pago_data.get("Factura_Total", 0),
-                    "Saldo_x0020_Factura": pago_data.get("Factura_Saldo", 0),
-                    "Nombre_x0020_Categoria": pago_data.get("Categoria_Nombre", ""),
-                    "Precio_x0020_Categoria": pago_data.get("Categoria_Precio", 0),
-                    "Cantidad_x0020_Categoria": pago_data.get("Categoria_Cantidad", 0),
-                    "Total_x0020_Categoria": pago_data.get("Categoria_Total", 0),
-                    "Observaciones_x0020_Categoria": pago_data.get("Categoria_Observaciones", ""),
-                    "Anticipo": False  # Campo Sí/No - siempre False para no-anticipos
-                }
-            }
-            
-            # Solo agregar fecha de factura si tiene valor válido (para pagos con facturas normales)
-            fecha_factura = pago_data.get("Factura_Fecha")
-            if fecha_factura and str(fecha_factura).strip():
-                item_data['fields']["Fecha_x0020_Factura"] = fecha_factura
-        
-        url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(url, headers=headers, json=item_data)
-        
-        if response.status_code == 201:
-            created_item = response.json()
-            
-            # Obtener ID del item creado
-            item_id = None
-            if 'id' in created_item:
-                item_id = created_item['id']
-            elif 'fields' in created_item and 'id' in created_item['fields']:
-                item_id = created_item['fields']['id']
-            elif 'fields' in created_item and 'ID' in created_item['fields']:
-                item_id = created_item['fields']['ID']
+            pendientes.append(pago)
+    
+    omitidos = len(pagos_unificados) - len(pendientes)
+    if omitidos:
+        logger.info(f"Omitidos {omitidos} registros de pagos que ya existen en SharePoint")
+    
+    return pendientes
+
+def identidad_registro_pago(pago_data):
+    """Valores de COLUMNAS_IDENTIDAD_PAGO que tendrá el registro en SharePoint"""
+    fields = construir_item_pago(pago_data)['fields']
+    return tuple('' if fields.get(columna) is None else str(fields[columna]) for columna in COLUMNAS_IDENTIDAD_PAGO)
+
+def subir_lote_pagos(sp_connector, lote, site_id, list_id):
+    """Subir un lote de registros de pago con una solicitud $batch"""
+    items_data = [construir_item_pago(pago_data) for pago_data in lote]
+    token = sp_connector.get_azure_token()
+    return sp_connector.batch_create_items(token, site_id, list_id, items_data)
+
+def construir_item_pago(pago_data):
+    """Construir el payload de SharePoint para un registro unificado de pago"""
+    fields = {"Title": str(pago_data.get("Pago_ID", ""))}
+    fields.update({columna: pago_data.get(clave, defecto) for columna, clave, defecto in CAMPOS_PAGO})
+    fields["Observaciones"] = pago_data.get("Observaciones_Pago", "") or ""
+    
+    # VERIFICAR EL TIPO DE REGISTRO PRIMERO
+    tipo_registro = pago_data.get("Tipo_Registro", "")
+    
+    if tipo_registro == "PAGO_CON_ANTICIPO":
+        # SOLO campos para anticipos
+        fields.update({columna: pago_data.get(clave, defecto) for columna, clave, defecto in CAMPOS_ANTICIPO})
+        fields["Nombre_x0020_Categoria"] = "Avances y anticipos recibidos"
+        fields["Anticipo"] = True  # Campo Sí/No - siempre True para anticipos
+        
+        # Solo agregar fechas de anticipo si tienen valor (ya normalizadas al procesar)
+        fecha_anticipo = pago_data.get("Anticipo_Fecha")
+        if fecha_anticipo:
+            fields["Anticipo_x0020_Fecha"] = fecha_anticipo
             
-            return item_id
-        else:
-            logger.error(f"Error HTTP subiendo pago: {response.status_code} - {response.text}")
-            return None
-        
-    except Exception as e:
-        logger.error(f"Error subiendo pago unificado: {str(e)}")
-        return None
+        fecha_venc_anticipo = pago_data.get("Anticipo_Fecha_Vencimiento")
+        if fecha_venc_anticipo:
+            fields["Anticipo_x0020_Fecha_x0020_Venci"] = fecha_venc_anticipo
+    
+    else:
+        fields.update({columna: pago_data.get(clave, defecto) for columna, clave, defecto in CAMPOS_FACTURA_CATEGORIA})
+        fields["Anticipo"] = False  # Campo Sí/No - siempre False para no-anticipos
+        
+        # Solo agregar fecha de factura si tiene valor (ya normalizada al procesar)
+        fecha_factura = pago_data.get("Factura_Fecha")
+        if fecha_factura:
+            fields["Fecha_x0020_Factura"] = fecha_factura
+    
+    return {'fields': fields}
 
 if __name__ == "__main__":
     success = main()
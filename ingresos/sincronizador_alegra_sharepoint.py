@@ -1,21 +1,68 @@
-import requests
 import base64
 import os
 import sys
-import json
 import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from urllib.parse import quote
 from dotenv import load_dotenv
 
 # Agregar el directorio padre al path para importaciones
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.sharepoint_connector import SharePointConnector
+from core.sharepoint_connector import SharePointConnector, GRAPH_BATCH_SIZE, GRAPH_ITEMS_URL, json_headers
+from core.http_session import get_session
+from core.json_utils import json_dumps, json_loads
+from core.alegra import normalize_date, safe_get_nested
+from core.sharepoint_fields import CAMPOS_PAGO_COMPLETO, FACTURA_LOOKUP_VARIATIONS
+
+# Pagos sin cliente procesados en paralelo (cada uno hace varias llamadas a Alegra y Graph)
+PAGOS_EN_PARALELO = 4
+# Facturas de un mismo pago recreadas en paralelo
+FACTURAS_EN_PARALELO = 4
+# Solicitudes $batch de eliminación enviadas en paralelo
+ELIMINACIONES_EN_PARALELO = 4
+# Intentos para eliminar todas las instancias de una factura
+MAX_INTENTOS_ELIMINACION = 3
+
+# Segundos que se reutiliza una respuesta de Alegra (pagos que comparten factura)
+ALEGRA_CACHE_TTL = 300
+
+# Campos de SharePoint que lee el sincronizador en cada lista
+CAMPOS_SELECT_PAGOS = "Title,Numero_x0020_Pago,ID_x0020_Cliente,Nombre_x0020_Cliente,ID_x0020_Factura,Numero_x0020_Factura,Monto_x0020_Total"
+CAMPOS_SELECT_FACTURAS = "Title,Cliente_x0020_Nombre,Total,Estado"
+CAMPOS_SELECT_ITEMS = "Title,Nombre"
+
+# Columnas de SharePoint (columna, clave del registro, valor por defecto)
+CAMPOS_FACTURA = (
+    ("Fecha", "Fecha", ""),
+    ("Fecha_x0020_Vencimiento", "Fecha_Vencimiento", ""),
+    ("Numero_x0020_Factura", "Numero_Factura", ""),
+    ("Subtotal", "Subtotal", 0),
+    ("Descuento", "Descuento", 0),
+    ("Impuestos", "Impuestos", 0),
+    ("Total", "Total", 0),
+    ("Total_x0020_Pagado", "Total_Pagado", 0),
+    ("Saldo", "Saldo", 0),
+    ("Cliente_x0020_Nombre", "Cliente_Nombre", ""),
+    ("Estado", "Estado", ""),
+)
+
+CAMPOS_ITEM = (
+    ("Title", "Numero_Factura", ""),
+    ("Nombre", "Item_Nombre", ""),
+    ("Precio", "Item_Precio", 0),
+    ("Cantidad", "Item_Cantidad", 0),
+    ("Descuento", "Item_Descuento", 0),
+    ("Total", "Item_Total", 0),
+)
 
 def setup_logging():
     """Configurar el sistema de logging"""
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
+    os.makedirs('logs', exist_ok=True)
     
     timestamp = datetime.now().strftime('%Y-%m-%d')
     log_filename = f"logs/sincronizacion_alegra_{timestamp}.log"
@@ -50,6 +97,29 @@ class SincronizadorAlegra:
         # Inicializar conector SharePoint
         self.sp_connector = SharePointConnector()
         
+        # Sesión HTTP compartida (keep-alive) para Alegra y Graph
+        self.session = get_session()
+        
+        # Caché por ejecución de los items de cada lista, indexados por Title
+        self._items_por_titulo = {}
+        self._titulo_por_item = {}
+        self._listas_completas = set()
+        self._cache_lock = threading.RLock()
+        
+        # Respuestas de Alegra por (recurso, id): {clave: (expiración, datos)}
+        self._alegra_cache = {}
+        
+        # Locks por pago/factura y de estadísticas (los pagos se procesan en paralelo)
+        self._registros_locks = defaultdict(threading.Lock)
+        self._stats_lock = threading.Lock()
+        
+        # Campos expandidos por lista ($select); solo los que lee el sincronizador
+        self._campos_lista = {
+            self.list_name_pagos: CAMPOS_SELECT_PAGOS,
+            self.list_name_facturas: CAMPOS_SELECT_FACTURAS,
+            self.list_name_items: CAMPOS_SELECT_ITEMS,
+        }
+        
         # Contadores para estadísticas
         self.stats = {
             'pagos_revisados': 0,
@@ -71,6 +141,12 @@ class SincronizadorAlegra:
         self.logger.info("="*60)
         
         try:
+            # Resolver sitio y listas en una sola solicitud (quedan en caché del conector)
+            self.sp_connector.prefetch_ids(
+                self.sp_connector.get_azure_token(), self.site_url,
+                [self.list_name_pagos, self.list_name_facturas, self.list_name_items]
+            )
+            
             # Paso 1: Obtener pagos sin cliente de SharePoint
             pagos_sin_cliente = self.obtener_pagos_sin_cliente()
             
@@ -80,14 +156,19 @@ class SincronizadorAlegra:
             
             self.logger.info(f"Encontrados {len(pagos_sin_cliente)} pagos sin cliente para revisar")
             
-            # Paso 2: Procesar cada pago
-            for pago_sp in pagos_sin_cliente:
-                try:
-                    self.procesar_pago_sin_cliente_delete_create(pago_sp)
-                except Exception as e:
-                    self.logger.error(f"Error procesando pago {pago_sp.get('Title', 'N/A')}: {str(e)}")
-                    self.stats['pagos_error'] += 1
-                    continue
+            # Paso 2: Procesar los pagos en paralelo (son independientes entre sí)
+            with ThreadPoolExecutor(max_workers=PAGOS_EN_PARALELO) as executor:
+                futures = {
+                    executor.submit(self.procesar_pago_con_lock, pago_sp): pago_sp
+                    for pago_sp in pagos_sin_cliente
+                }
+                
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        self.logger.error(f"Error procesando pago {futures[future].get('Title', 'N/A')}: {str(e)}")
+                        self.sumar_stat('pagos_error')
             
             # Resumen final
             self.mostrar_resumen_final()
@@ -97,43 +178,185 @@ class SincronizadorAlegra:
             self.logger.error(f"Error crítico en sincronización: {str(e)}")
             return False
 
-    def obtener_pagos_sin_cliente(self):
-        """Obtener pagos de SharePoint que no tienen cliente asignado"""
-        try:
-            self.logger.info(" Obteniendo pagos sin cliente de SharePoint...")
-            
-            token = self.sp_connector.get_azure_token()
-            site_id = self.sp_connector.get_site_id(token, self.site_url)
-            list_id = self.sp_connector.get_list_id(token, site_id, self.list_name_pagos)
+    def sumar_stat(self, clave, cantidad=1):
+        """Incrementar un contador de estadísticas (seguro entre hilos)"""
+        with self._stats_lock:
+            self.stats[clave] += cantidad
+
+    def obtener_lock(self, tipo, registro_id):
+        """Obtener el lock que serializa la recreación de un pago o factura"""
+        with self._cache_lock:
+            return self._registros_locks[(tipo, str(registro_id))]
+
+    def procesar_pago_con_lock(self, pago_sp):
+        """Procesar un pago sin cliente sin solaparse con otro registro del mismo pago"""
+        # Un pago con varias facturas aparece en varios registros de la lista
+        with self.obtener_lock('pago', pago_sp['Pago_ID']):
+            self.procesar_pago_sin_cliente_delete_create(pago_sp)
+
+    def recrear_factura_con_lock(self, factura_id):
+        """Recrear una factura sin solaparse con otro pago que comparta la misma factura"""
+        with self.obtener_lock('factura', factura_id):
+            self.recrear_factura_completa(factura_id)
+
+    def obtener_lista_sharepoint(self, list_name):
+        """
+        Obtener token, site_id y list_id de una lista de SharePoint.
+        
+        El conector guarda en caché el token (hasta su expiración) y los IDs, así
+        que solo la primera llamada de la ejecución consulta Graph.
+        """
+        token = self.sp_connector.get_azure_token()
+        site_id = self.sp_connector.get_site_id(token, self.site_url)
+        list_id = self.sp_connector.get_list_id(token, site_id, list_name)
+        return token, site_id, list_id
+
+    def url_items_lista(self, site_id, list_id, list_name):
+        """URL de items de una lista, expandiendo solo los campos que lee el sincronizador"""
+        # Del item solo se usa el id; el resto de metadatos (eTag, webUrl, createdBy...) sobra
+        url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items?$select=id"
+        campos = self._campos_lista.get(list_name)
+        if campos:
+            return f"{url}&$expand=fields($select={campos})"
+        return f"{url}&$expand=fields"
+
+    def indexar_items(self, list_name, titulo, items):
+        """Guardar en caché los items de un Title"""
+        with self._cache_lock:
+            self._items_por_titulo.setdefault(list_name, defaultdict(list))[titulo] = items
+            titulo_por_item = self._titulo_por_item.setdefault(list_name, {})
+            for item in items:
+                titulo_por_item[item.get('id')] = titulo
+
+    def obtener_items_por_titulo(self, list_name):
+        """
+        Obtener todos los items de una lista agrupados por Title.
+        
+        La lista se descarga una sola vez por ejecución; las eliminaciones y
+        creaciones del sincronizador mantienen el índice al día.
+        """
+        if list_name in self._listas_completas:
+            return self._items_por_titulo[list_name]
+        
+        token, site_id, list_id = self.obtener_lista_sharepoint(list_name)
+        
+        if not list_id:
+            self.logger.error(f"No se pudo obtener ID de la lista {list_name}")
+            return {}
+        
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json"
+        }
+        
+        items_por_titulo = defaultdict(list)
+        next_url = self.url_items_lista(site_id, list_id, list_name)
+        
+        # Manejar paginación
+        while next_url:
+            response = self.session.get(next_url, headers=headers)
+            
+            if response.status_code != 200:
+                # No se guarda en caché una lista incompleta
+                self.logger.error(f"Error obteniendo items de {list_name}: {response.status_code} - {response.text}")
+                return items_por_titulo
+            
+            data = json_loads(response.content)
+            for item in data.get('value', []):
+                items_por_titulo[str(item.get('fields', {}).get('Title', ''))].append(item)
+            next_url = data.get('@odata.nextLink')
+        
+        # La lista completa reemplaza lo consultado antes por Title
+        with self._cache_lock:
+            self._items_por_titulo[list_name] = defaultdict(list)
+            self._titulo_por_item[list_name] = {}
+            for titulo, items in items_por_titulo.items():
+                self.indexar_items(list_name, titulo, items)
+            self._listas_completas.add(list_name)
+            return self._items_por_titulo[list_name]
+
+    def filtrar_items_por_titulo(self, list_name, titulo):
+        """
+        Consultar en SharePoint solo los items cuyo Title coincide ($filter).
+        
+        Returns:
+            Lista de items, o None si Graph rechaza el filtro
+        """
+        token, site_id, list_id = self.obtener_lista_sharepoint(list_name)
+        
+        if not list_id:
+            self.logger.error(f"No se pudo obtener ID de la lista {list_name}")
+            return []
+        
+        filtro = "fields/Title eq '{}'".format(titulo.replace("'", "''"))
+        next_url = f"{self.url_items_lista(site_id, list_id, list_name)}&$filter={quote(filtro)}&$top=999"
+        
+        # Permite filtrar por columnas no indexadas
+        headers = {
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/json",
+            "Prefer": "HonorNonIndexedQueriesWarningMayFailRandomly"
+        }
+        
+        items = []
+        while next_url:
+            response = self.session.get(next_url, headers=headers)
             
-            if not list_id:
-                self.logger.error(f"No se pudo obtener ID de la lista {self.list_name_pagos}")
-                return []
+            if response.status_code != 200:
+                self.logger.warning(f"Filtro por Title no disponible en {list_name}: {response.status_code} - {response.text}")
+                return None
             
-            # Obtener todos los pagos y filtrar en Python
-            url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items?$expand=fields"
+            data = json_loads(response.content)
+            items.extend(data.get('value', []))
+            next_url = data.get('@odata.nextLink')
+        
+        return items
 
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/json"
-            }
+    def obtener_registros_por_titulo(self, list_name, titulo):
+        """Obtener (copia de) los items de una lista cuyo Title coincide"""
+        titulo = str(titulo)
+        with self._cache_lock:
+            indice = self._items_por_titulo.get(list_name)
+            if list_name in self._listas_completas or (indice is not None and titulo in indice):
+                return list(indice.get(titulo, []))
+        
+        items = self.filtrar_items_por_titulo(list_name, titulo)
+        if items is None:
+            # Sin filtro en el servidor: descargar la lista completa
+            return list(self.obtener_items_por_titulo(list_name).get(titulo, []))
+        
+        self.indexar_items(list_name, titulo, items)
+        return list(items)
 
-            all_pagos = []
-            next_url = url
+    def descartar_item_cache(self, list_name, item_id):
+        """Quitar del índice en caché un item eliminado de SharePoint"""
+        with self._cache_lock:
+            titulo = self._titulo_por_item.get(list_name, {}).pop(item_id, None)
+            if titulo is None:
+                return
+            items = self._items_por_titulo[list_name].get(titulo, [])
+            self._items_por_titulo[list_name][titulo] = [item for item in items if item.get('id') != item_id]
 
-            # Manejar paginación
-            while next_url:
-                response = requests.get(next_url, headers=headers)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    all_pagos.extend(data.get('value', []))
-                    next_url = data.get('@odata.nextLink')
-                    if next_url:
-                        self.logger.info(f" Obteniendo siguiente página de pagos...")
-                else:
-                    self.logger.error(f"Error obteniendo pagos: {response.status_code} - {response.text}")
-                    break
+    def agregar_item_cache(self, list_name, item):
+        """Agregar al índice en caché un item recién creado en SharePoint"""
+        titulo = str(item.get('fields', {}).get('Title', ''))
+        with self._cache_lock:
+            indice = self._items_por_titulo.get(list_name)
+            
+            # Si el Title no está en caché, la próxima consulta lo traerá del servidor
+            if indice is None or (list_name not in self._listas_completas and titulo not in indice):
+                return
+            indice[titulo].append(item)
+            self._titulo_por_item[list_name][item.get('id')] = titulo
+
+    def obtener_pagos_sin_cliente(self):
+        """Obtener pagos de SharePoint que no tienen cliente asignado"""
+        try:
+            self.logger.info(" Obteniendo pagos sin cliente de SharePoint...")
+            
+            # Lista completa de pagos (queda en caché para el resto de la ejecución)
+            pagos_por_titulo = self.obtener_items_por_titulo(self.list_name_pagos)
+            all_pagos = [item for items in pagos_por_titulo.values() for item in items]
 
             self.logger.info(f" Total de pagos obtenidos de SharePoint: {len(all_pagos)}")
 
@@ -142,19 +365,19 @@ class SincronizadorAlegra:
                 
                 for item in all_pagos:
                     fields = item.get('fields', {})
+                    cliente_id = fields.get('ID_x0020_Cliente') or ''
+                    cliente_nombre = fields.get('Nombre_x0020_Cliente') or ''
+                    
                     # Solo incluir si realmente no tiene cliente
-                    if (not fields.get('ID_x0020_Cliente') or 
-                        not fields.get('Nombre_x0020_Cliente') or
-                        fields.get('ID_x0020_Cliente', '').strip() == '' or
-                        fields.get('Nombre_x0020_Cliente', '').strip() == ''):
-                        
+                    if not cliente_id.strip() or not cliente_nombre.strip():
+                        titulo = fields.get('Title', '')
                         pago_data = {
                             'SharePoint_ID': item.get('id'),
-                            'Title': fields.get('Title', ''),
-                            'Pago_ID': fields.get('Title', ''),
+                            'Title': titulo,
+                            'Pago_ID': titulo,
                             'Numero_Pago': fields.get('Numero_x0020_Pago', ''),
-                            'ID_Cliente_Actual': fields.get('ID_x0020_Cliente', ''),
-                            'Nombre_Cliente_Actual': fields.get('Nombre_x0020_Cliente', ''),
+                            'ID_Cliente_Actual': cliente_id,
+                            'Nombre_Cliente_Actual': cliente_nombre,
                             'ID_Factura': fields.get('ID_x0020_Factura', ''),
                             'Numero_Factura': fields.get('Numero_x0020_Factura', ''),
                             'fields': fields
@@ -171,63 +394,40 @@ class SincronizadorAlegra:
             return []
 
     def diagnosticar_pago(self, pago_id):
-        """Diagnosticar todos los registros de un pago específico ANTES de eliminar"""
+        """
+        Diagnosticar todos los registros de un pago específico.
+        
+        Los registros salen del índice en caché (sin consultas a Graph); el resumen
+        se registra en INFO y el detalle por registro solo en DEBUG.
+        """
         try:
-            self.logger.info(f" DIAGNÓSTICO COMPLETO DEL PAGO {pago_id}")
-            self.logger.info("="*50)
-            
-            token = self.sp_connector.get_azure_token()
-            site_id = self.sp_connector.get_site_id(token, self.site_url)
-            list_id = self.sp_connector.get_list_id(token, site_id, self.list_name_pagos)
-            
-            if not list_id:
-                self.logger.error("No se pudo obtener ID de lista de pagos")
-                return
-            
-            # Obtener TODOS los registros
-            url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items?$expand=fields"
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/json"
-            }
-            
-            all_items = []
-            next_url = url
-            
-            while next_url:
-                response = requests.get(next_url, headers=headers)
-                if response.status_code == 200:
-                    data = response.json()
-                    all_items.extend(data.get('value', []))
-                    next_url = data.get('@odata.nextLink')
-                else:
-                    break
+            # Registros de este pago (índice por Title de la lista en caché)
+            registros_pago = self.obtener_registros_por_titulo(self.list_name_pagos, pago_id)
             
-            # Filtrar registros de este pago
-            registros_pago = []
-            for item in all_items:
-                fields = item.get('fields', {})
-                title = fields.get('Title', '')
-                if str(title) == str(pago_id):
-                    registros_pago.append(item)
+            if not self.logger.isEnabledFor(logging.INFO):
+                return registros_pago
             
-            self.logger.info(f" ENCONTRADOS {len(registros_pago)} REGISTROS PARA EL PAGO {pago_id}:")
+            self.logger.info(" DIAGNÓSTICO COMPLETO DEL PAGO %s", pago_id)
+            self.logger.info("="*50)
+            self.logger.info(" ENCONTRADOS %s REGISTROS PARA EL PAGO %s:", len(registros_pago), pago_id)
             
-            for i, item in enumerate(registros_pago, 1):
-                fields = item.get('fields', {})
-                sharepoint_id = item.get('id')
-                numero_pago = fields.get('Numero_x0020_Pago', 'N/A')
-                cliente_id = fields.get('ID_x0020_Cliente', '')
-                cliente_nombre = fields.get('Nombre_x0020_Cliente', '')
-                factura_id = fields.get('ID_x0020_Factura', '')
-                monto = fields.get('Monto_x0020_Total', 0)
+            # Detalle por registro solo en DEBUG
+            if self.logger.isEnabledFor(logging.DEBUG):
+                for i, item in enumerate(registros_pago, 1):
+                    fields = item.get('fields', {})
+                    sharepoint_id = item.get('id')
+                    numero_pago = fields.get('Numero_x0020_Pago', 'N/A')
+                    cliente_id = fields.get('ID_x0020_Cliente', '')
+                    cliente_nombre = fields.get('Nombre_x0020_Cliente', '')
+                    factura_id = fields.get('ID_x0020_Factura', '')
+                    monto = fields.get('Monto_x0020_Total', 0)
                 
-                self.logger.info(f"  {i}. ID SharePoint: {sharepoint_id}")
-                self.logger.info(f"     Número Pago: {numero_pago}")
-                self.logger.info(f"     Cliente ID: '{cliente_id}' | Nombre: '{cliente_nombre}'")
-                self.logger.info(f"     Factura ID: '{factura_id}' | Monto: ${monto}")
-                self.logger.info(f"     Estado Cliente: {'CON CLIENTE' if cliente_id and cliente_id.strip() else 'SIN CLIENTE'}")
-                self.logger.info(f"     ---")
+                    self.logger.debug("  %s. ID SharePoint: %s", i, sharepoint_id)
+                    self.logger.debug("     Número Pago: %s", numero_pago)
+                    self.logger.debug("     Cliente ID: '%s' | Nombre: '%s'", cliente_id, cliente_nombre)
+                    self.logger.debug("     Factura ID: '%s' | Monto: $%s", factura_id, monto)
+                    self.logger.debug("     Estado Cliente: %s", 'CON CLIENTE' if cliente_id and cliente_id.strip() else 'SIN CLIENTE')
+                    self.logger.debug("     ---")
             
             return registros_pago
             
@@ -242,7 +442,7 @@ class SincronizadorAlegra:
         sharepoint_id = pago_sp['SharePoint_ID']
         
         self.logger.info(f" Procesando pago {numero_pago} (ID: {pago_id})")
-        self.stats['pagos_revisados'] += 1
+        self.sumar_stat('pagos_revisados')
         
         # DIAGNÓSTICO INICIAL
         self.diagnosticar_pago(pago_id)
@@ -252,18 +452,19 @@ class SincronizadorAlegra:
         
         if not pago_alegra:
             self.logger.warning(f" No se pudo obtener pago {pago_id} desde Alegra")
-            self.stats['pagos_error'] += 1
+            self.sumar_stat('pagos_error')
             return
         
         # PASO 2: Verificar si ahora tiene cliente
-        cliente_alegra = self.safe_get_nested(pago_alegra, 'client', 'id', default='')
+        cliente = pago_alegra.get('client') or {}
+        cliente_alegra = cliente.get('id') or ''
         
         if not cliente_alegra:
             self.logger.info(f" Pago {numero_pago} sigue sin cliente en Alegra")
-            self.stats['pagos_sin_cambios'] += 1
+            self.sumar_stat('pagos_sin_cambios')
             return
         
-        self.logger.info(f" Pago {numero_pago} ahora tiene cliente: {self.safe_get_nested(pago_alegra, 'client', 'name', default='N/A')}")
+        self.logger.info(f" Pago {numero_pago} ahora tiene cliente: {cliente.get('name') or 'N/A'}")
         
         # PASO 3: Recopilar facturas que se verán afectadas
         facturas_a_recrear = set()
@@ -284,7 +485,7 @@ class SincronizadorAlegra:
         # PASO 4: ELIMINAR registros viejos del pago
         self.logger.info(f" Eliminando registros viejos del pago {numero_pago}...")
         registros_eliminados = self.eliminar_registros_pago(pago_id)
-        self.stats['registros_eliminados'] += registros_eliminados
+        self.sumar_stat('registros_eliminados', registros_eliminados)
         
         # VERIFICACIÓN POST-ELIMINACIÓN
         self.logger.info(f" VERIFICACIÓN POST-ELIMINACIÓN:")
@@ -292,109 +493,71 @@ class SincronizadorAlegra:
         if len(registros_restantes) > 0:
             self.logger.warning(f" AÚN QUEDAN {len(registros_restantes)} REGISTROS - REINTENTANDO ELIMINACIÓN")
             # Reintentar eliminación
-            for registro in registros_restantes:
-                sharepoint_id = registro.get('id')
-                if self.eliminar_item_sharepoint(sharepoint_id, self.list_name_pagos):
-                    self.logger.info(f"   Eliminado registro restante {sharepoint_id}")
+            resultados = self.eliminar_items_sharepoint([registro.get('id') for registro in registros_restantes], self.list_name_pagos)
+            for registro, eliminado in zip(registros_restantes, resultados):
+                if eliminado:
+                    self.logger.info(f"   Eliminado registro restante {registro.get('id')}")
                     registros_eliminados += 1
         
         # PASO 5: CREAR registros nuevos del pago
         self.logger.info(f" Creando registros nuevos del pago {numero_pago}...")
         pagos_unificados = self.procesar_pago_alegra_unificado(pago_alegra)
         
-        registros_creados = 0
-        for pago_data in pagos_unificados:
-            if self.crear_pago_sharepoint(pago_data):
-                registros_creados += 1
+        registros_creados = self.crear_pagos_sharepoint(pagos_unificados)
         
         if registros_creados > 0:
-            self.stats['pagos_recreados'] += 1
+            self.sumar_stat('pagos_recreados')
             self.logger.info(f" Pago recreado: {registros_eliminados} eliminados → {registros_creados} creados")
             
             # VERIFICACIÓN FINAL
             self.logger.info(f" VERIFICACIÓN FINAL:")
             self.diagnosticar_pago(pago_id)
             
-            # PASO 6: RECREAR facturas afectadas
-            for factura_id in facturas_a_recrear:
-                if factura_id and factura_id.strip():
-                    self.recrear_factura_completa(factura_id)
+            # PASO 6: RECREAR facturas afectadas (son independientes entre sí)
+            facturas_validas = [factura_id for factura_id in facturas_a_recrear if factura_id and factura_id.strip()]
+            if facturas_validas:
+                with ThreadPoolExecutor(max_workers=min(FACTURAS_EN_PARALELO, len(facturas_validas))) as executor:
+                    futures = {
+                        executor.submit(self.recrear_factura_con_lock, factura_id): factura_id
+                        for factura_id in facturas_validas
+                    }
+                    
+                    for future in as_completed(futures):
+                        try:
+                            future.result()
+                        except Exception as e:
+                            self.logger.error(f"Error recreando factura {futures[future]}: {str(e)}")
+                            self.sumar_stat('facturas_error')
         else:
-            self.stats['pagos_error'] += 1
+            self.sumar_stat('pagos_error')
             self.logger.error(f" Error recreando pago {numero_pago}")
 
     def eliminar_registros_pago(self, pago_id):
         """Eliminar TODOS los registros de un pago específico en SharePoint"""
         try:
-            token = self.sp_connector.get_azure_token()
-            site_id = self.sp_connector.get_site_id(token, self.site_url)
-            list_id = self.sp_connector.get_list_id(token, site_id, self.list_name_pagos)
+            # Buscar TODOS los registros con este pago_id
+            registros_pago = self.obtener_registros_por_titulo(self.list_name_pagos, pago_id)
             
-            if not list_id:
-                return 0
-            
-            # Buscar TODOS los registros con este pago_id - SIN FILTRO para obtener TODO
-            url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items?$expand=fields"
+            self.logger.info(" Encontrados %s registros del pago %s para eliminar", len(registros_pago), pago_id)
             
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/json"
-            }
-            
-            all_items = []
-            next_url = url
-            
-            # Obtener TODOS los registros con paginación
-            while next_url:
-                response = requests.get(next_url, headers=headers)
-                if response.status_code == 200:
-                    data = response.json()
-                    all_items.extend(data.get('value', []))
-                    next_url = data.get('@odata.nextLink')
-                else:
-                    self.logger.error(f"Error obteniendo registros: {response.status_code}")
-                    break
-            
-            # Filtrar en Python los registros que corresponden a este pago_id
-            registros_pago = []
-            for item in all_items:
+            for item in registros_pago:
+                # Información del registro que se va a eliminar
                 fields = item.get('fields', {})
-                title = fields.get('Title', '')
-                if str(title) == str(pago_id):
-                    registros_pago.append(item)
-            
-            self.logger.info(f" Encontrados {len(registros_pago)} registros del pago {pago_id} para eliminar")
+                cliente_actual = fields.get('Nombre_x0020_Cliente', 'SIN CLIENTE')
+                numero_pago = fields.get('Numero_x0020_Pago', 'N/A')
+                
+                self.logger.info("   Eliminando registro ID %s: %s - Cliente: %s", item.get('id'), numero_pago, cliente_actual)
             
             eliminados = 0
-            for item in registros_pago:
-                try:
-                    item_id = item.get('id')
-                    sharepoint_id = item.get('id')
-                    
-                    # Información del registro que se va a eliminar
-                    fields = item.get('fields', {})
-                    cliente_actual = fields.get('Nombre_x0020_Cliente', 'SIN CLIENTE')
-                    numero_pago = fields.get('Numero_x0020_Pago', 'N/A')
-                    
-                    self.logger.info(f"   Eliminando registro ID {sharepoint_id}: {numero_pago} - Cliente: {cliente_actual}")
-                    
-                    if self.eliminar_item_sharepoint(sharepoint_id, self.list_name_pagos):
-                        eliminados += 1
-                        self.logger.info(f"   Eliminado registro {sharepoint_id}")
-                    else:
-                        self.logger.warning(f"   Error eliminando registro {sharepoint_id}")
-                        
-                except Exception as e:
-                    self.logger.error(f"   Error procesando registro: {str(e)}")
-                    continue
-            
-            self.logger.info(f" TOTAL ELIMINADOS: {eliminados} registros del pago {pago_id}")
+            resultados = self.eliminar_items_sharepoint([item.get('id') for item in registros_pago], self.list_name_pagos)
+            for item, eliminado in zip(registros_pago, resultados):
+                if eliminado:
+                    eliminados += 1
+                    self.logger.info("   Eliminado registro %s", item.get('id'))
+                else:
+                    self.logger.warning("   Error eliminando registro %s", item.get('id'))
             
-            # Pausa para asegurar que las eliminaciones se procesen
-            if eliminados > 0:
-                import time
-                time.sleep(2)
-                self.logger.info(" Pausa para asegurar procesamiento de eliminaciones")
+            self.logger.info(" TOTAL ELIMINADOS: %s registros del pago %s", eliminados, pago_id)
             
             return eliminados
                 
@@ -412,7 +575,7 @@ class SincronizadorAlegra:
             
             if not factura_alegra:
                 self.logger.warning(f" No se pudo obtener factura {factura_id} desde Alegra")
-                self.stats['facturas_error'] += 1
+                self.sumar_stat('facturas_error')
                 return
             
             # PASO 2: ELIMINAR TODAS las instancias de la factura y items
@@ -420,7 +583,7 @@ class SincronizadorAlegra:
             
             # Eliminar items primero
             items_eliminados = self.eliminar_items_factura(factura_id)
-            self.stats['items_eliminados'] += items_eliminados
+            self.sumar_stat('items_eliminados', items_eliminados)
             
             # Eliminar TODAS las facturas con este ID
             facturas_eliminadas = self.eliminar_todas_facturas_por_id(factura_id)
@@ -436,63 +599,29 @@ class SincronizadorAlegra:
                 self.logger.info(f" Factura recreada con ID: {nuevo_id_factura}")
                 
                 # PASO 4: CREAR items nuevos
-                items_creados = 0
-                for item_data in items_data:
-                    if self.crear_item_factura_sharepoint(item_data, nuevo_id_factura):
-                        items_creados += 1
+                items_creados = self.crear_items_factura_sharepoint(items_data, nuevo_id_factura)
                 
-                self.stats['facturas_recreadas'] += 1
-                self.stats['items_recreados'] += items_creados
+                self.sumar_stat('facturas_recreadas')
+                self.sumar_stat('items_recreados', items_creados)
                 
                 self.logger.info(f" Factura {factura_id} recreada completamente:")
                 self.logger.info(f"    Eliminados: {facturas_eliminadas} facturas + {items_eliminados} items")
                 self.logger.info(f"    Creados: 1 factura + {items_creados} items")
             else:
                 self.logger.error(f" Error creando nueva factura {factura_id}")
-                self.stats['facturas_error'] += 1
+                self.sumar_stat('facturas_error')
                 
         except Exception as e:
             self.logger.error(f"Error recreando factura {factura_id}: {str(e)}")
-            self.stats['facturas_error'] += 1
+            self.sumar_stat('facturas_error')
 
     def verificar_eliminacion_factura(self, factura_id):
         """Verificar que una factura fue completamente eliminada"""
         try:
             self.logger.info(f" Verificando eliminación completa de factura {factura_id}...")
             
-            token = self.sp_connector.get_azure_token()
-            site_id = self.sp_connector.get_site_id(token, self.site_url)
-            list_id = self.sp_connector.get_list_id(token, site_id, self.list_name_facturas)
-            
-            if not list_id:
-                return False
-            
-            # Buscar si aún existen instancias
-            url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items?$expand=fields"
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/json"
-            }
-            
-            all_facturas = []
-            next_url = url
-            
-            while next_url:
-                response = requests.get(next_url, headers=headers)
-                if response.status_code == 200:
-                    data = response.json()
-                    all_facturas.extend(data.get('value', []))
-                    next_url = data.get('@odata.nextLink')
-                else:
-                    break
-            
             # Contar instancias restantes
-            instancias_restantes = 0
-            for item in all_facturas:
-                fields = item.get('fields', {})
-                title = fields.get('Title', '')
-                if str(title) == str(factura_id):
-                    instancias_restantes += 1
+            instancias_restantes = len(self.obtener_registros_por_titulo(self.list_name_facturas, factura_id))
             
             if instancias_restantes > 0:
                 self.logger.warning(f" AÚN QUEDAN {instancias_restantes} instancias de factura {factura_id}")
@@ -508,79 +637,43 @@ class SincronizadorAlegra:
     def eliminar_todas_facturas_por_id(self, factura_id):
         """Eliminar TODAS las instancias de una factura específica en SharePoint"""
         try:
-            self.logger.info(f" Eliminando TODAS las instancias de factura {factura_id}...")
-            
-            token = self.sp_connector.get_azure_token()
-            site_id = self.sp_connector.get_site_id(token, self.site_url)
-            list_id = self.sp_connector.get_list_id(token, site_id, self.list_name_facturas)
-            
-            if not list_id:
-                return 0
-            
-            # Obtener TODAS las facturas
-            url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items?$expand=fields"
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/json"
-            }
-            
-            all_facturas = []
-            next_url = url
-            
-            while next_url:
-                response = requests.get(next_url, headers=headers)
-                if response.status_code == 200:
-                    data = response.json()
-                    all_facturas.extend(data.get('value', []))
-                    next_url = data.get('@odata.nextLink')
-                else:
-                    break
-            
-            # Filtrar facturas con el ID específico
-            facturas_a_eliminar = []
-            for item in all_facturas:
-                fields = item.get('fields', {})
-                title = fields.get('Title', '')
-                if str(title) == str(factura_id):
-                    facturas_a_eliminar.append(item)
-            
-            self.logger.info(f" Encontradas {len(facturas_a_eliminar)} instancias de factura {factura_id} para eliminar")
+            self.logger.info(" Eliminando TODAS las instancias de factura %s...", factura_id)
             
             eliminadas = 0
-            for i, item in enumerate(facturas_a_eliminar, 1):
-                try:
-                    sharepoint_id = item.get('id')
+            for intento in range(1, MAX_INTENTOS_ELIMINACION + 1):
+                # Filtrar facturas con el ID específico (índice en caché, sin volver a paginar)
+                facturas_a_eliminar = self.obtener_registros_por_titulo(self.list_name_facturas, factura_id)
+                
+                if intento > 1:
+                    if not facturas_a_eliminar:
+                        break
+                    self.logger.warning(" Reintentando eliminación de instancias restantes (intento %s de %s)...", intento, MAX_INTENTOS_ELIMINACION)
+                
+                self.logger.info(" Encontradas %s instancias de factura %s para eliminar", len(facturas_a_eliminar), factura_id)
+                
+                for i, item in enumerate(facturas_a_eliminar, 1):
                     fields = item.get('fields', {})
                     cliente = fields.get('Cliente_x0020_Nombre', 'N/A')
                     total = fields.get('Total', 0)
                     estado = fields.get('Estado', 'N/A')
                     
-                    self.logger.info(f"   Eliminando instancia {i}: ID {sharepoint_id} | Cliente: {cliente} | Total: ${total} | Estado: {estado}")
-                    
-                    if self.eliminar_item_sharepoint(sharepoint_id, self.list_name_facturas):
+                    self.logger.info("   Eliminando instancia %s: ID %s | Cliente: %s | Total: $%s | Estado: %s", i, item.get('id'), cliente, total, estado)
+                
+                resultados = self.eliminar_items_sharepoint([item.get('id') for item in facturas_a_eliminar], self.list_name_facturas)
+                for item, eliminada in zip(facturas_a_eliminar, resultados):
+                    if eliminada:
                         eliminadas += 1
-                        self.logger.info(f"   Eliminada instancia {sharepoint_id}")
+                        self.logger.info("   Eliminada instancia %s", item.get('id'))
                     else:
-                        self.logger.warning(f"   Error eliminando instancia {sharepoint_id}")
-                        
-                except Exception as e:
-                    self.logger.error(f"   Error procesando instancia: {str(e)}")
-                    continue
-            
-            self.logger.info(f" TOTAL FACTURAS ELIMINADAS: {eliminadas}")
-            
-            # Pausa para asegurar procesamiento
-            if eliminadas > 0:
-                import time
-                time.sleep(2)
-                self.logger.info(" Pausa para asegurar procesamiento de eliminaciones")
-            
-            # Verificar que la eliminación fue exitosa
-            if not self.verificar_eliminacion_factura(factura_id):
-                self.logger.warning(" Reintentando eliminación de instancias restantes...")
-                # Reintentar con instancias que pudieron quedar
-                eliminadas_adicionales = self.eliminar_todas_facturas_por_id(factura_id)
-                eliminadas += eliminadas_adicionales
+                        self.logger.warning("   Error eliminando instancia %s", item.get('id'))
+                
+                self.logger.info(" TOTAL FACTURAS ELIMINADAS: %s", eliminadas)
+                
+                # Verificar que la eliminación fue exitosa
+                if self.verificar_eliminacion_factura(factura_id):
+                    break
+            else:
+                self.logger.error(" No se pudieron eliminar todas las instancias de factura %s tras %s intentos", factura_id, MAX_INTENTOS_ELIMINACION)
             
             return eliminadas
                 
@@ -588,8 +681,26 @@ class SincronizadorAlegra:
             self.logger.error(f"Error eliminando facturas: {str(e)}")
             return 0
 
+    def leer_cache_alegra(self, recurso, recurso_id):
+        """Obtener una respuesta de Alegra en caché si no ha expirado"""
+        with self._cache_lock:
+            cached = self._alegra_cache.get((recurso, str(recurso_id)))
+        if cached and time.monotonic() < cached[0]:
+            return cached[1]
+        return None
+
+    def guardar_cache_alegra(self, recurso, recurso_id, data):
+        """Guardar una respuesta de Alegra en caché y devolverla"""
+        with self._cache_lock:
+            self._alegra_cache[(recurso, str(recurso_id))] = (time.monotonic() + ALEGRA_CACHE_TTL, data)
+        return data
+
     def obtener_pago_desde_alegra(self, pago_id):
         """Obtener un pago específico desde la API de Alegra"""
+        cached = self.leer_cache_alegra('payments', pago_id)
+        if cached is not None:
+            return cached
+        
         try:
             url = f"https://api.alegra.com/api/v1/payments/{pago_id}"
             
@@ -598,10 +709,10 @@ class SincronizadorAlegra:
                 "authorization": f"Basic {self.encoded_credentials}"
             }
             
-            response = requests.get(url, headers=headers)
+            response = self.session.get(url, headers=headers)
             
             if response.status_code == 200:
-                return response.json()
+                return self.guardar_cache_alegra('payments', pago_id, json_loads(response.content))
             elif response.status_code == 404:
                 self.logger.warning(f"Pago {pago_id} no encontrado en Alegra")
                 return None
@@ -615,6 +726,10 @@ class SincronizadorAlegra:
 
     def obtener_factura_desde_alegra(self, factura_id):
         """Obtener una factura específica desde la API de Alegra"""
+        cached = self.leer_cache_alegra('invoices', factura_id)
+        if cached is not None:
+            return cached
+        
         try:
             url = f"https://api.alegra.com/api/v1/invoices/{factura_id}"
             
@@ -623,10 +738,10 @@ class SincronizadorAlegra:
                 "authorization": f"Basic {self.encoded_credentials}"
             }
             
-            response = requests.get(url, headers=headers)
+            response = self.session.get(url, headers=headers)
             
             if response.status_code == 200:
-                return response.json()
+                return self.guardar_cache_alegra('invoices', factura_id, json_loads(response.content))
             elif response.status_code == 404:
                 self.logger.warning(f"Factura {factura_id} no encontrada en Alegra")
                 return None
@@ -641,45 +756,11 @@ class SincronizadorAlegra:
     def obtener_factura_sharepoint(self, factura_id):
         """Obtener factura de SharePoint por su ID de Alegra"""
         try:
-            token = self.sp_connector.get_azure_token()
-            site_id = self.sp_connector.get_site_id(token, self.site_url)
-            list_id = self.sp_connector.get_list_id(token, site_id, self.list_name_facturas)
-            
-            if not list_id:
-                return None
-            
-            # Obtener TODAS las facturas sin filtro para buscar en Python
-            url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items?$expand=fields"
-            
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/json"
-            }
-            
-            all_facturas = []
-            next_url = url
-            
-            # Obtener todas las facturas con paginación
-            while next_url:
-                response = requests.get(next_url, headers=headers)
-                if response.status_code == 200:
-                    data = response.json()
-                    all_facturas.extend(data.get('value', []))
-                    next_url = data.get('@odata.nextLink')
-                else:
-                    self.logger.error(f"Error obteniendo facturas: {response.status_code}")
-                    break
-            
             # Buscar factura por Title (que contiene el ID de Alegra)
-            facturas_encontradas = []
-            for item in all_facturas:
-                fields = item.get('fields', {})
-                title = fields.get('Title', '')
-                if str(title) == str(factura_id):
-                    facturas_encontradas.append({
-                        'SharePoint_ID': item.get('id'),
-                        'fields': fields
-                    })
+            facturas_encontradas = [
+                {'SharePoint_ID': item.get('id'), 'fields': item.get('fields', {})}
+                for item in self.obtener_registros_por_titulo(self.list_name_facturas, factura_id)
+            ]
             
             self.logger.info(f" Factura {factura_id}: Encontradas {len(facturas_encontradas)} instancias en SharePoint")
             
@@ -704,72 +785,29 @@ class SincronizadorAlegra:
     def eliminar_items_factura(self, factura_id):
         """Eliminar todos los items de una factura específica"""
         try:
-            self.logger.info(f" Eliminando items de factura {factura_id}...")
-            
-            token = self.sp_connector.get_azure_token()
-            site_id = self.sp_connector.get_site_id(token, self.site_url)
-            list_id = self.sp_connector.get_list_id(token, site_id, self.list_name_items)
-            
-            if not list_id:
-                return 0
+            self.logger.info(" Eliminando items de factura %s...", factura_id)
             
-            # Obtener TODOS los items sin filtro inicial
-            url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items?$expand=fields"
+            # Items que pertenecen a esta factura (por Title)
+            items_factura = self.obtener_registros_por_titulo(self.list_name_items, factura_id)
             
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/json"
-            }
-            
-            all_items = []
-            next_url = url
-            
-            # Obtener todos los items con paginación
-            while next_url:
-                response = requests.get(next_url, headers=headers)
-                if response.status_code == 200:
-                    data = response.json()
-                    all_items.extend(data.get('value', []))
-                    next_url = data.get('@odata.nextLink')
-                else:
-                    break
-            
-            # Filtrar en Python los items que pertenecen a esta factura
-            items_factura = []
-            for item in all_items:
-                fields = item.get('fields', {})
-                title = fields.get('Title', '')
-                # Buscar por Title que contiene el número de factura o ID
-                if str(title) == str(factura_id):
-                    items_factura.append(item)
+            self.logger.info(" Encontrados %s items de factura %s para eliminar", len(items_factura), factura_id)
             
-            self.logger.info(f" Encontrados {len(items_factura)} items de factura {factura_id} para eliminar")
+            if self.logger.isEnabledFor(logging.INFO):
+                for item in items_factura:
+                    nombre_item = item.get('fields', {}).get('Nombre', 'Item sin nombre')
+                    self.logger.info("   Eliminando item: %s (ID: %s)", nombre_item, item.get('id'))
             
             items_eliminados = 0
-            for item in items_factura:
-                try:
-                    item_id = item.get('id')
-                    fields = item.get('fields', {})
-                    nombre_item = fields.get('Nombre', 'Item sin nombre')
-                    
-                    self.logger.info(f"   Eliminando item: {nombre_item} (ID: {item_id})")
-                    
-                    if self.eliminar_item_sharepoint(item_id, self.list_name_items):
-                        items_eliminados += 1
-                        self.logger.info(f"   Item eliminado: {nombre_item}")
-                    else:
-                        self.logger.warning(f"   Error eliminando item: {nombre_item}")
-                        
-                except Exception as e:
-                    self.logger.error(f"   Error procesando item: {str(e)}")
-                    continue
-            
-            self.logger.info(f" TOTAL ITEMS ELIMINADOS: {items_eliminados}")
+            resultados = self.eliminar_items_sharepoint([item.get('id') for item in items_factura], self.list_name_items)
+            for item, eliminado in zip(items_factura, resultados):
+                nombre_item = item.get('fields', {}).get('Nombre', 'Item sin nombre')
+                if eliminado:
+                    items_eliminados += 1
+                    self.logger.info("   Item eliminado: %s", nombre_item)
+                else:
+                    self.logger.warning("   Error eliminando item: %s", nombre_item)
             
-            # Pausa para asegurar procesamiento
-            if items_eliminados > 0:
-                import time
-                time.sleep(1)
+            self.logger.info(" TOTAL ITEMS ELIMINADOS: %s", items_eliminados)
             
             return items_eliminados
                 
@@ -777,39 +815,62 @@ class SincronizadorAlegra:
             self.logger.error(f"Error eliminando items de factura: {str(e)}")
             return 0
 
-    def eliminar_item_sharepoint(self, item_id, list_name):
-        """Eliminar un item específico de SharePoint"""
+    def eliminar_items_sharepoint(self, item_ids, list_name):
+        """
+        Eliminar items de SharePoint usando $batch (hasta 20 por solicitud).
+        
+        Si hay más de un grupo de GRAPH_BATCH_SIZE items, los grupos se envían en paralelo.
+        
+        Returns:
+            Lista de booleanos (True si el item se eliminó), en el mismo orden
+        """
+        if not item_ids:
+            return []
+        
         try:
-            token = self.sp_connector.get_azure_token()
-            site_id = self.sp_connector.get_site_id(token, self.site_url)
-            list_id = self.sp_connector.get_list_id(token, site_id, list_name)
+            token, site_id, list_id = self.obtener_lista_sharepoint(list_name)
             
             if not list_id:
-                return False
+                return [False] * len(item_ids)
             
-            url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items/{item_id}"
-            headers = {
-                "Authorization": f"Bearer {token}"
-            }
+            grupos = [item_ids[k:k + GRAPH_BATCH_SIZE] for k in range(0, len(item_ids), GRAPH_BATCH_SIZE)]
             
-            response = requests.delete(url, headers=headers)
-            
-            return response.status_code == 204
+            if len(grupos) == 1:
+                resultados = self.sp_connector.batch_delete_items(token, site_id, list_id, item_ids)
+            else:
+                with ThreadPoolExecutor(max_workers=min(ELIMINACIONES_EN_PARALELO, len(grupos))) as executor:
+                    resultados_grupos = executor.map(
+                        lambda grupo: self.sp_connector.batch_delete_items(token, site_id, list_id, grupo),
+                        grupos
+                    )
+                    resultados = [eliminado for resultado in resultados_grupos for eliminado in resultado]
+            
+            for item_id, eliminado in zip(item_ids, resultados):
+                if eliminado:
+                    self.descartar_item_cache(list_name, item_id)
+            
+            return resultados
                 
         except Exception as e:
-            self.logger.error(f"Error eliminando item {item_id}: {str(e)}")
-            return False
+            self.logger.error(f"Error eliminando items de {list_name}: {str(e)}")
+            return [False] * len(item_ids)
 
     def procesar_pago_alegra_unificado(self, payment):
         """Procesar un pago de Alegra en estructura unificada"""
         pagos_unificados = []
         
         try:
+            # Objetos anidados del pago (se leen una sola vez)
+            number_template = payment.get('numberTemplate') or {}
+            bank_account = payment.get('bankAccount') or {}
+            client = payment.get('client') or {}
+            cost_center = payment.get('costCenter') or {}
+            
             # Registro base del pago
             pago_base = {
                 'Pago_ID': payment.get('id'),
                 'Fecha': payment.get('date'),
-                'Numero_Pago': self.safe_get_nested(payment, 'numberTemplate', 'fullNumber', default=''),
+                'Numero_Pago': number_template.get('fullNumber') or '',
                 'Numero_Interno': payment.get('number'),
                 'Monto_Total': payment.get('amount', 0),
                 'Tipo_Pago': payment.get('type'),
@@ -819,20 +880,20 @@ class SincronizadorAlegra:
                 'Anotaciones_Pago': payment.get('anotation', ''),
                 
                 # Cuenta bancaria
-                'Cuenta_ID': self.safe_get_nested(payment, 'bankAccount', 'id', default=''),
-                'Cuenta_Nombre': self.safe_get_nested(payment, 'bankAccount', 'name', default=''),
-                'Cuenta_Tipo': self.safe_get_nested(payment, 'bankAccount', 'type', default=''),
+                'Cuenta_ID': bank_account.get('id') or '',
+                'Cuenta_Nombre': bank_account.get('name') or '',
+                'Cuenta_Tipo': bank_account.get('type') or '',
                 
                 # Cliente
-                'Cliente_ID': self.safe_get_nested(payment, 'client', 'id', default=''),
-                'Cliente_Nombre': self.safe_get_nested(payment, 'client', 'name', default=''),
-                'Cliente_Telefono': self.safe_get_nested(payment, 'client', 'phone', default=''),
-                'Cliente_Identificacion': self.safe_get_nested(payment, 'client', 'identification', default=''),
+                'Cliente_ID': client.get('id') or '',
+                'Cliente_Nombre': client.get('name') or '',
+                'Cliente_Telefono': client.get('phone') or '',
+                'Cliente_Identificacion': client.get('identification') or '',
                 
                 # Centro de costo
-                'Centro_Costo_ID': self.safe_get_nested(payment, 'costCenter', 'id', default=''),
-                'Centro_Costo_Codigo': self.safe_get_nested(payment, 'costCenter', 'code', default=''),
-                'Centro_Costo_Nombre': self.safe_get_nested(payment, 'costCenter', 'name', default=''),
+                'Centro_Costo_ID': cost_center.get('id') or '',
+                'Centro_Costo_Codigo': cost_center.get('code') or '',
+                'Centro_Costo_Nombre': cost_center.get('name') or '',
                 
                 # Campos para facturas (vacíos por defecto)
                 'Factura_ID': '',
@@ -867,24 +928,24 @@ class SincronizadorAlegra:
                 if invoices:
                     for invoice in invoices:
                         if invoice is not None:
-                            pago_con_factura = pago_base.copy()
-                            pago_con_factura.update({
+                            pago_con_factura = {
+                                **pago_base,
                                 'Factura_ID': invoice.get('id'),
                                 'Factura_Numero': invoice.get('number'),
-                                'Factura_Fecha': invoice.get('date'),
+                                'Factura_Fecha': normalize_date(invoice.get('date')),
                                 'Factura_Monto_Pagado': invoice.get('amount', 0),
                                 'Factura_Total': invoice.get('total', 0),
                                 'Factura_Saldo': invoice.get('balance', 0),
                                 'Tipo_Registro': 'PAGO_CON_FACTURA'
-                            })
+                            }
                             pagos_unificados.append(pago_con_factura)
                 
                 # Si tiene categorías
                 if categories:
                     for category in categories:
                         if category is not None:
-                            pago_con_categoria = pago_base.copy()
-                            pago_con_categoria.update({
+                            pago_con_categoria = {
+                                **pago_base,
                                 'Categoria_ID': category.get('id'),
                                 'Categoria_Nombre': category.get('name'),
                                 'Categoria_Precio': category.get('price', 0),
@@ -893,7 +954,7 @@ class SincronizadorAlegra:
                                 'Categoria_Observaciones': category.get('observations', ''),
                                 'Categoria_Comportamiento': category.get('behavior', ''),
                                 'Tipo_Registro': 'PAGO_CON_CATEGORIA'
-                            })
+                            }
                             pagos_unificados.append(pago_con_categoria)
             
             return pagos_unificados
@@ -904,11 +965,20 @@ class SincronizadorAlegra:
 
     def procesar_factura_alegra(self, factura_alegra):
         """Procesar datos de factura desde Alegra"""
+        # Objetos anidados de la factura (se leen una sola vez)
+        number_template = factura_alegra.get('numberTemplate') or {}
+        client = factura_alegra.get('client') or {}
+        address = client.get('address') or {}
+        seller = factura_alegra.get('seller') or {}
+        warehouse = factura_alegra.get('warehouse') or {}
+        cost_center = factura_alegra.get('costCenter') or {}
+        stamp = factura_alegra.get('stamp') or {}
+        
         return {
             'ID': factura_alegra.get('id'),
             'Fecha': factura_alegra.get('date'),
             'Fecha_Vencimiento': factura_alegra.get('dueDate'),
-            'Numero_Factura': self.safe_get_nested(factura_alegra, 'numberTemplate', 'fullNumber', default=''),
+            'Numero_Factura': number_template.get('fullNumber') or '',
             'Estado': factura_alegra.get('status'),
             'Subtotal': factura_alegra.get('subtotal', 0),
             'Descuento': factura_alegra.get('discount', 0),
@@ -920,28 +990,28 @@ class SincronizadorAlegra:
             'Forma_Pago': factura_alegra.get('paymentForm', ''),
             
             # Datos del cliente
-            'Cliente_ID': self.safe_get_nested(factura_alegra, 'client', 'id', default=''),
-            'Cliente_Nombre': self.safe_get_nested(factura_alegra, 'client', 'name', default=''),
-            'Cliente_Identificacion': self.safe_get_nested(factura_alegra, 'client', 'identification', default=''),
-            'Cliente_Email': self.safe_get_nested(factura_alegra, 'client', 'email', default=''),
-            'Cliente_Telefono': self.safe_get_nested(factura_alegra, 'client', 'phonePrimary', default=''),
-            'Cliente_Ciudad': self.safe_get_nested(factura_alegra, 'client', 'address', 'city', default=''),
-            'Cliente_Departamento': self.safe_get_nested(factura_alegra, 'client', 'address', 'department', default=''),
-            'Cliente_Direccion': self.safe_get_nested(factura_alegra, 'client', 'address', 'address', default=''),
+            'Cliente_ID': client.get('id') or '',
+            'Cliente_Nombre': client.get('name') or '',
+            'Cliente_Identificacion': client.get('identification') or '',
+            'Cliente_Email': client.get('email') or '',
+            'Cliente_Telefono': client.get('phonePrimary') or '',
+            'Cliente_Ciudad': address.get('city') or '',
+            'Cliente_Departamento': address.get('department') or '',
+            'Cliente_Direccion': address.get('address') or '',
             
             # Datos del vendedor
-            'Vendedor_Nombre': self.safe_get_nested(factura_alegra, 'seller', 'name', default=''),
-            'Vendedor_ID': self.safe_get_nested(factura_alegra, 'seller', 'identification', default=''),
+            'Vendedor_Nombre': seller.get('name') or '',
+            'Vendedor_ID': seller.get('identification') or '',
             
             # Datos adicionales
             'Observaciones': factura_alegra.get('observations', ''),
             'Anotacion': factura_alegra.get('anotation', ''),
-            'Almacen': self.safe_get_nested(factura_alegra, 'warehouse', 'name', default=''),
-            'Centro_Costo': self.safe_get_nested(factura_alegra, 'costCenter', 'name', default=''),
+            'Almacen': warehouse.get('name') or '',
+            'Centro_Costo': cost_center.get('name') or '',
             
             # CUFE
-            'CUFE': self.safe_get_nested(factura_alegra, 'stamp', 'cufe', default=''),
-            'Estado_DIAN': self.safe_get_nested(factura_alegra, 'stamp', 'legalStatus', default=''),
+            'CUFE': stamp.get('cufe') or '',
+            'Estado_DIAN': stamp.get('legalStatus') or '',
             
             # Número de items
             'Cantidad_Items': len(factura_alegra.get('items', [])) if factura_alegra.get('items') else 0,
@@ -949,141 +1019,89 @@ class SincronizadorAlegra:
 
     def procesar_items_factura_alegra(self, factura_alegra):
         """Procesar items de factura desde Alegra"""
-        items_data = []
-        
         factura_id = factura_alegra.get('id')
-        factura_numero = self.safe_get_nested(factura_alegra, 'numberTemplate', 'fullNumber', default='')
-        
-        items = factura_alegra.get('items', [])
-        for item in items:
-            if item is not None:
-                item_data = {
-                    'Factura_ID': factura_id,
-                    'Numero_Factura': factura_numero,
-                    'Item_Nombre': item.get('name', ''),
-                    'Item_Descripcion': item.get('description', ''),
-                    'Item_Precio': item.get('price', 0),
-                    'Item_Cantidad': item.get('quantity', 0),
-                    'Item_Descuento': item.get('discount', 0),
-                    'Item_Total': item.get('total', 0),
-                    'Item_Referencia': item.get('reference', ''),
-                    'Item_Unidad': item.get('unit', ''),
-                }
-                items_data.append(item_data)
+        factura_numero = safe_get_nested(factura_alegra, 'numberTemplate', 'fullNumber', default='')
         
-        return items_data
+        # Lista (no generador): la creación por $batch reintenta los pendientes por índice
+        return [
+            {
+                'Factura_ID': factura_id,
+                'Numero_Factura': factura_numero,
+                'Item_Nombre': item.get('name', ''),
+                'Item_Descripcion': item.get('description', ''),
+                'Item_Precio': item.get('price', 0),
+                'Item_Cantidad': item.get('quantity', 0),
+                'Item_Descuento': item.get('discount', 0),
+                'Item_Total': item.get('total', 0),
+                'Item_Referencia': item.get('reference', ''),
+                'Item_Unidad': item.get('unit', ''),
+            }
+            for item in factura_alegra.get('items') or ()
+            if item is not None
+        ]
 
-    def crear_pago_sharepoint(self, pago_data):
-        """Crear un nuevo registro de pago en SharePoint"""
+    def construir_item_pago(self, pago_data):
+        """Construir el payload de SharePoint para un registro de pago"""
+        fields = {"Title": str(pago_data.get("Pago_ID", ""))}
+        fields.update({columna: pago_data.get(clave, defecto) for columna, clave, defecto in CAMPOS_PAGO_COMPLETO})
+        fields["Observaciones"] = pago_data.get("Observaciones_Pago", "") or ""
+        
+        # Solo agregar fecha de factura si tiene valor válido
+        fecha_factura = pago_data.get("Factura_Fecha")
+        if fecha_factura:
+            fields["Fecha_x0020_Factura"] = fecha_factura
+        
+        return {'fields': fields}
+
+    def crear_pagos_sharepoint(self, pagos_data):
+        """
+        Crear registros de pago en SharePoint usando $batch.
+        
+        Returns:
+            Número de registros creados
+        """
+        if not pagos_data:
+            return 0
+        
         try:
-            token = self.sp_connector.get_azure_token()
-            site_id = self.sp_connector.get_site_id(token, self.site_url)
-            list_id = self.sp_connector.get_list_id(token, site_id, self.list_name_pagos)
+            token, site_id, list_id = self.obtener_lista_sharepoint(self.list_name_pagos)
             
             if not list_id:
-                return False
-            
-            item_data = {
-                'fields': {
-                    "Title": str(pago_data.get("Pago_ID", "")),
-                    "Fecha": pago_data.get("Fecha", ""),
-                    "Numero_x0020_Pago": pago_data.get("Numero_Pago", ""),
-                    "Numero_x0020_Interno": pago_data.get("Numero_Interno", ""),
-                    "Monto_x0020_Total": pago_data.get("Monto_Total", 0),
-                    "Tipo_x0020_Pago": pago_data.get("Tipo_Pago", ""),
-                    "Metodo_x0020_Pago": pago_data.get("Metodo_Pago", ""),
-                    "Estado_x0020_Pago": pago_data.get("Estado_Pago", ""),
-                    "Observaciones": pago_data.get("Observaciones_Pago", "") or "",
-                    "Cuenta_x0020_Nombre": pago_data.get("Cuenta_Nombre", ""),
-                    "ID_x0020_Cuenta": pago_data.get("Cuenta_ID", ""),
-                    "Cuenta_x0020_Tipo": pago_data.get("Cuenta_Tipo", ""),
-                    "ID_x0020_Cliente": pago_data.get("Cliente_ID", ""),
-                    "Nombre_x0020_Cliente": pago_data.get("Cliente_Nombre", ""),
-                    "Identificacion_x0020_Cliente": pago_data.get("Cliente_Identificacion", ""),
-                    "ID_x0020_Factura": pago_data.get("Factura_ID", ""),
-                    "Numero_x0020_Factura": pago_data.get("Factura_Numero", ""),
-                    "Factura_x0020_Monto_x0020_Pagado": pago_data.get("Factura_Monto_Pagado", 0),
-                    "Total_x0020_Factura": pago_data.get("Factura_Total", 0),
-                    "Saldo_x0020_Factura": pago_data.get("Factura_Saldo", 0),
-                    "Nombre_x0020_Categoria": pago_data.get("Categoria_Nombre", ""),
-                    "Precio_x0020_Categoria": pago_data.get("Categoria_Precio", 0),
-                    "Cantidad_x0020_Categoria": pago_data.get("Categoria_Cantidad", 0),
-                    "Total_x0020_Categoria": pago_data.get("Categoria_Total", 0),
-                    "Observaciones_x0020_Categoria": pago_data.get("Categoria_Observaciones", ""),
-                }
-            }
+                return 0
             
-            # Solo agregar fecha de factura si tiene valor válido
-            fecha_factura = pago_data.get("Factura_Fecha")
-            if fecha_factura and str(fecha_factura).strip():
-                item_data['fields']["Fecha_x0020_Factura"] = fecha_factura
+            items_data = [self.construir_item_pago(pago_data) for pago_data in pagos_data]
+            creados = self.sp_connector.batch_create_items(token, site_id, list_id, items_data)
             
-            url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items"
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json"
-            }
+            for item_data, item_id in zip(items_data, creados):
+                if item_id:
+                    self.agregar_item_cache(self.list_name_pagos, {'id': item_id, 'fields': item_data['fields']})
             
-            response = requests.post(url, headers=headers, json=item_data)
-            
-            if response.status_code == 201:
-                return True
-            else:
-                self.logger.error(f"Error creando pago: {response.status_code} - {response.text}")
-                return False
+            return sum(1 for item_id in creados if item_id)
                 
         except Exception as e:
-            self.logger.error(f"Error creando pago en SharePoint: {str(e)}")
-            return False
+            self.logger.error(f"Error creando pagos en SharePoint: {str(e)}")
+            return 0
 
     def crear_factura_sharepoint(self, factura_data):
         """Crear una nueva factura en SharePoint"""
         try:
-            token = self.sp_connector.get_azure_token()
-            site_id = self.sp_connector.get_site_id(token, self.site_url)
-            list_id = self.sp_connector.get_list_id(token, site_id, self.list_name_facturas)
+            token, site_id, list_id = self.obtener_lista_sharepoint(self.list_name_facturas)
             
             if not list_id:
                 return None
             
-            item_data = {
-                'fields': {
-                    "Title": str(factura_data.get("ID", "")),
-                    "Fecha": factura_data.get("Fecha", ""),
-                    "Fecha_x0020_Vencimiento": factura_data.get("Fecha_Vencimiento", ""),
-                    "Numero_x0020_Factura": factura_data.get("Numero_Factura", ""),
-                    "Subtotal": factura_data.get("Subtotal", 0),
-                    "Descuento": factura_data.get("Descuento", 0),
-                    "Impuestos": factura_data.get("Impuestos", 0),
-                    "Total": factura_data.get("Total", 0),
-                    "Total_x0020_Pagado": factura_data.get("Total_Pagado", 0),
-                    "Saldo": factura_data.get("Saldo", 0),
-                    "Cliente_x0020_Nombre": factura_data.get("Cliente_Nombre", ""),
-                    "Estado": factura_data.get("Estado", ""),
-                }
-            }
+            fields = {"Title": str(factura_data.get("ID", ""))}
+            fields.update({columna: factura_data.get(clave, defecto) for columna, clave, defecto in CAMPOS_FACTURA})
+            item_data = {'fields': fields}
             
-            url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items"
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.post(url, headers=headers, json=item_data)
+            url = GRAPH_ITEMS_URL.format(site_id=site_id, list_id=list_id)
+            response = self.session.post(url, headers=json_headers(token), data=json_dumps(item_data))
             
             if response.status_code == 201:
-                created_item = response.json()
-                
-                # Obtener ID del item creado
-                item_id = None
-                if 'id' in created_item:
-                    item_id = created_item['id']
-                elif 'fields' in created_item and 'id' in created_item['fields']:
-                    item_id = created_item['fields']['id']
-                elif 'fields' in created_item and 'ID' in created_item['fields']:
-                    item_id = created_item['fields']['ID']
+                created_item = json_loads(response.content)
+                self.agregar_item_cache(self.list_name_facturas, created_item)
                 
-                return item_id
+                return SharePointConnector.extract_item_id(created_item)
             else:
                 self.logger.error(f"Error creando factura: {response.status_code} - {response.text}")
                 return None
@@ -1092,102 +1110,90 @@ class SincronizadorAlegra:
             self.logger.error(f"Error creando factura en SharePoint: {str(e)}")
             return None
 
-    def crear_item_factura_sharepoint(self, item_data, factura_lookup_id):
-        """Crear un item de factura en SharePoint"""
+    def crear_items_factura_sharepoint(self, items_data, factura_lookup_id):
+        """
+        Crear los items de una factura en SharePoint usando $batch.
+        
+        Returns:
+            Número de items creados
+        """
+        if not items_data:
+            return 0
+        
         try:
-            token = self.sp_connector.get_azure_token()
-            site_id = self.sp_connector.get_site_id(token, self.site_url)
-            list_id = self.sp_connector.get_list_id(token, site_id, self.list_name_items)
+            token, site_id, list_id = self.obtener_lista_sharepoint(self.list_name_items)
             
             if not list_id:
-                return False
-            
-            # Intentar con diferentes variaciones de campo lookup
-            lookup_variations = [
-                "Factura_x0020_de_x0020_VentaLookupId",
-                "Factura_x0020_de_x0020_Venta",
-                "FacturadeVentaLookupId", 
-                "FacturadeVenta"
-            ]
+                return 0
             
-            for lookup_field in lookup_variations:
-                item_fields = {
+            creados = self.sp_connector.batch_create_with_lookup(
+                token, site_id, list_id, items_data,
+                lambda item, lookup_field: {
                     'fields': {
                         lookup_field: str(factura_lookup_id),
-                        "Title": item_data.get("Numero_Factura", ""),
-                        "Nombre": item_data.get("Item_Nombre", ""),
-                        "Precio": item_data.get("Item_Precio", 0),
-                        "Cantidad": item_data.get("Item_Cantidad", 0),
-                        "Descuento": item_data.get("Item_Descuento", 0),
-                        "Total": item_data.get("Item_Total", 0),
+                        **{columna: item.get(clave, defecto) for columna, clave, defecto in CAMPOS_ITEM},
                     }
-                }
-                
-                url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items"
-                headers = {
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json"
-                }
-                
-                response = requests.post(url, headers=headers, json=item_fields)
-                
-                if response.status_code == 201:
-                    return True
+                },
+                FACTURA_LOOKUP_VARIATIONS,
+            )
+            
+            # Los items leídos de Graph no traen el campo lookup ($select), así que
+            # la caché guarda solo las columnas de CAMPOS_ITEM
+            for item, item_id in zip(items_data, creados):
+                if item_id:
+                    self.agregar_item_cache(self.list_name_items, {
+                        'id': item_id,
+                        'fields': {columna: item.get(clave, defecto) for columna, clave, defecto in CAMPOS_ITEM},
+                    })
             
-            self.logger.warning(f"No se pudo crear item con ningún campo lookup")
-            return False
+            pendientes = creados.count(None)
+            if pendientes:
+                self.logger.warning(f"No se pudieron crear {pendientes} items con ningún campo lookup")
+            
+            return len(items_data) - pendientes
                 
         except Exception as e:
-            self.logger.error(f"Error creando item en SharePoint: {str(e)}")
-            return False
-
-    def safe_get_nested(self, obj, *keys, default=''):
-        """Función helper para obtener valores anidados de forma segura"""
-        for key in keys:
-            if isinstance(obj, dict) and key in obj and obj[key] is not None:
-                obj = obj[key]
-            else:
-                return default
-        return obj if obj is not None else default
+            self.logger.error(f"Error creando items en SharePoint: {str(e)}")
+            return 0
 
     def mostrar_resumen_final(self):
         """Mostrar resumen final de la sincronización"""
+        stats = self.stats
+        
         self.logger.info("="*60)
         self.logger.info("RESUMEN FINAL - ESTRATEGIA DELETE + CREATE")
         self.logger.info("="*60)
         self.logger.info(f"PAGOS:")
-        self.logger.info(f"   Revisados: {self.stats['pagos_revisados']}")
-        self.logger.info(f"   Recreados: {self.stats['pagos_recreados']}")
-        self.logger.info(f"   Sin cambios: {self.stats['pagos_sin_cambios']}")
-        self.logger.info(f"   Con errores: {self.stats['pagos_error']}")
+        self.logger.info(f"   Revisados: {stats['pagos_revisados']}")
+        self.logger.info(f"   Recreados: {stats['pagos_recreados']}")
+        self.logger.info(f"   Sin cambios: {stats['pagos_sin_cambios']}")
+        self.logger.info(f"   Con errores: {stats['pagos_error']}")
         
         self.logger.info(f"FACTURAS:")
-        self.logger.info(f"   Recreadas: {self.stats['facturas_recreadas']}")
-        self.logger.info(f"   Con errores: {self.stats['facturas_error']}")
+        self.logger.info(f"   Recreadas: {stats['facturas_recreadas']}")
+        self.logger.info(f"   Con errores: {stats['facturas_error']}")
         
         self.logger.info(f"ITEMS:")
-        self.logger.info(f"   Recreados: {self.stats['items_recreados']}")
-        self.logger.info(f"   Eliminados: {self.stats['items_eliminados']}")
+        self.logger.info(f"   Recreados: {stats['items_recreados']}")
+        self.logger.info(f"   Eliminados: {stats['items_eliminados']}")
         
         self.logger.info(f"TOTALES:")
-        self.logger.info(f"   Registros eliminados: {self.stats['registros_eliminados']}")
+        self.logger.info(f"   Registros eliminados: {stats['registros_eliminados']}")
         
         # Calcular eficiencia
-        total_operaciones = (self.stats['pagos_recreados'] + 
-                           self.stats['facturas_recreadas'] + 
-                           self.stats['pagos_error'] + 
-                           self.stats['facturas_error'])
+        exitosas = stats['pagos_recreados'] + stats['facturas_recreadas']
+        total_operaciones = exitosas + stats['pagos_error'] + stats['facturas_error']
         
         if total_operaciones > 0:
-            eficiencia = ((self.stats['pagos_recreados'] + self.stats['facturas_recreadas']) / total_operaciones) * 100
+            eficiencia = exitosas / total_operaciones * 100
             self.logger.info(f"   Eficiencia: {eficiencia:.1f}%")
         
         # También mostrar en consola
         print(f" Sincronización DELETE+CREATE completada:")
-        print(f"   Pagos recreados: {self.stats['pagos_recreados']}")
-        print(f"   Facturas recreadas: {self.stats['facturas_recreadas']}")
-        print(f"   Items recreados: {self.stats['items_recreados']}")
-        print(f"   Registros eliminados: {self.stats['registros_eliminados']}")
+        print(f"   Pagos recreados: {stats['pagos_recreados']}")
+        print(f"   Facturas recreadas: {stats['facturas_recreadas']}")
+        print(f"   Items recreados: {stats['items_recreados']}")
+        print(f"   Registros eliminados: {stats['registros_eliminados']}")
 
 def main():
     """Función principal para ejecutar el sincronizador"""
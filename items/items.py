@@ -1,15 +1,32 @@
-import requests
 import base64
 import os
 import sys
-import pandas as pd
 import logging
 from datetime import datetime, date, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.sharepoint_connector import SharePointConnector
+from core.sharepoint_connector import SharePointConnector, GRAPH_BATCH_SIZE
+from core.http_session import MAX_WORKERS
+from core.alegra import iter_pages
+
+# Lotes $batch pendientes como máximo antes de esperar a que termine alguno
+MAX_LOTES_EN_VUELO = 2 * MAX_WORKERS
+
+# Cada cuántos lotes subidos se registra el progreso de la subida a nivel INFO
+LOTES_POR_LOG_PROGRESO = 5
+
+# Resultado de procesar_impuestos_item para items sin impuestos (compartido, no modificar)
+IMPUESTOS_VACIOS = {'iva_porcentaje': 0, 'iva_tipo': "", 'otros_impuestos': ""}
+
+# Columnas de la lista de items: (columna SharePoint, clave del item procesado, valor por defecto)
+CAMPOS_ITEM = (
+    ("Title", "Nombre", ""),
+    ("Categoria", "Item_Categoria_Nombre", ""),
+    ("Precio_x0020_Principal", "Precio_Principal", 0),
+)
 
 def setup_logging():
     """Configurar el sistema de logging"""
@@ -75,60 +92,42 @@ def main():
         credentials = f"{username}:{password}"
         encoded_credentials = base64.b64encode(credentials.encode()).decode()
         
-        # Obtener datos de Alegra
+        # La lista destino se resuelve antes de consultar Alegra: si no está
+        # disponible no tiene sentido descargar ni procesar items
+        destino = resolver_lista_sharepoint(site_url, list_name_items, logger)
+        if not destino:
+            return False
+        sp_connector, site_id, list_id = destino
+        
+        # Obtener, procesar y subir items en un solo flujo: cada lote completo se
+        # envía a SharePoint mientras se siguen descargando páginas de Alegra
         logger.info("Iniciando consulta a API de Alegra para items...")
-        items_data = obtener_todos_los_items_alegra(encoded_credentials, logger)
+        resumen = {'total': 0, 'procesados': 0, 'con_error': 0}
+        paginas = iterar_paginas_items_alegra(encoded_credentials, logger)
         
-        if not items_data:
+        logger.info("INICIANDO SUBIDA A SHAREPOINT")
+        success = subir_items_sharepoint(
+            procesar_paginas_items(paginas, resumen, logger), sp_connector, site_id, list_id, logger
+        )
+        
+        if not resumen['total']:
             logger.error("No se pudieron obtener items de Alegra")
             return False
             
-        logger.info(f"Obtenidos {len(items_data)} items de Alegra")
-        
-        # Procesar items
-        items_procesados = []
-        items_con_error = 0
-        
-        for i, item in enumerate(items_data):
-            try:
-                if item is None:
-                    logger.warning(f"Item {i+1} es None, saltando...")
-                    items_con_error += 1
-                    continue
-                
-                # Procesar item
-                item_procesado = procesar_item_alegra(item, logger)
-                if item_procesado:
-                    items_procesados.append(item_procesado)
-                else:
-                    items_con_error += 1
-                    
-            except Exception as e:
-                logger.error(f"Error procesando item {i+1}: {str(e)}")
-                items_con_error += 1
-                continue
-        
-        logger.info(f"Procesamiento completado: {len(items_procesados)} exitosos, {items_con_error} con errores")
-        
-        if not items_procesados:
-            logger.warning("No hay items para subir a SharePoint")
-            return True
-        
-        # Subir a SharePoint
-        logger.info("INICIANDO SUBIDA A SHAREPOINT")
-        success = subir_items_sharepoint(items_procesados, site_url, list_name_items, logger)
+        logger.info(f"Obtenidos {resumen['total']} items de Alegra")
+        logger.info(f"Procesamiento completado: {resumen['procesados']} exitosos, {resumen['con_error']} con errores")
         
         # Resumen final
         logger.info("="*60)
         logger.info("RESUMEN FINAL DEL PROCESO")
         logger.info("="*60)
-        logger.info(f"Items procesados desde Alegra: {len(items_procesados)}")
-        logger.info(f"Items con errores: {items_con_error}")
+        logger.info(f"Items procesados desde Alegra: {resumen['procesados']}")
+        logger.info(f"Items con errores: {resumen['con_error']}")
         logger.info(f"Datos subidos a SharePoint: {'SI' if success else 'NO'}")
         logger.info(f"Archivo de log: {log_file}")
         
         # Solo mostrar en consola el resumen final
-        print(f"Proceso completado. Items: {len(items_procesados)}")
+        print(f"Proceso completado. Items: {resumen['procesados']}")
         print(f"Log guardado en: {log_file}")
         
         return success
@@ -139,77 +138,79 @@ def main():
         print(f"ERROR: {str(e)}. Ver detalles en: {log_file}")
         return False
 
-def obtener_todos_los_items_alegra(encoded_credentials, logger):
-    """Obtener todos los items de la API de Alegra usando paginación"""
-    base_url = "https://api.alegra.com/api/v1/items"
+def iterar_paginas_items_alegra(encoded_credentials, logger):
+    """
+    Recorrer las páginas de items de la API de Alegra.
+    
+    Cada página se entrega apenas llega para que el llamador la procese y la
+    descarte. Si una página falla se registra el error y se termina el recorrido.
+    """
     headers = {
         "accept": "application/json",
         "authorization": f"Basic {encoded_credentials}"
     }
     
-    todos_los_items = []
-    start = 0
-    limit = 30
-    
-    while True:
-        params = {'start': start, 'limit': limit}
+    try:
+        yield from iter_pages("https://api.alegra.com/api/v1/items", headers)
+        logger.info("No hay más items para obtener")
         
-        try:
-            logger.info(f"Obteniendo items {start + 1} - {start + limit}...")
-            response = requests.get(base_url, headers=headers, params=params)
-            
-            if response.status_code == 200:
-                items_pagina = response.json()
-                
-                if not items_pagina or len(items_pagina) == 0:
-                    logger.info("No hay más items para obtener")
-                    break
-                
-                todos_los_items.extend(items_pagina)
-                logger.info(f"Obtenidos {len(items_pagina)} items en esta página")
-                
-                if len(items_pagina) < limit:
-                    logger.info("Última página alcanzada")
-                    break
-                
-                start += limit
-                
-                # Pausa para no sobrecargar la API
-                import time
-                time.sleep(0.5)
+    except Exception as e:
+        logger.error(f"Error consultando API Alegra: {str(e)}")
+
+def procesar_paginas_items(paginas, resumen, logger):
+    """
+    Generar los items procesados de cada página de Alegra.
+    
+    Va contando en resumen los items recibidos ('total'), procesados
+    ('procesados') y con error ('con_error').
+    """
+    for pagina in paginas:
+        for item in pagina:
+            resumen['total'] += 1
+            try:
+                if item is None:
+                    logger.warning(f"Item {resumen['total']} es None, saltando...")
+                    resumen['con_error'] += 1
+                    continue
                 
-            elif response.status_code == 429:
-                logger.warning("Rate limit alcanzado, esperando...")
-                import time
-                time.sleep(2)
+                # Procesar item
+                item_procesado = procesar_item_alegra(item, logger)
+                if item_procesado:
+                    resumen['procesados'] += 1
+                    yield item_procesado
+                else:
+                    resumen['con_error'] += 1
+                    
+            except Exception as e:
+                logger.error(f"Error procesando item {resumen['total']}: {str(e)}")
+                resumen['con_error'] += 1
                 continue
-            else:
-                logger.error(f"Error en API Alegra: {response.status_code} - {response.text}")
-                break
-                
-        except Exception as e:
-            logger.error(f"Error consultando API Alegra: {str(e)}")
-            break
-    
-    return todos_los_items
 
 def procesar_item_alegra(item, logger):
     """Procesar un item de Alegra para prepararlo para SharePoint"""
     try:
+        # Objetos anidados del item (se leen una sola vez); un nivel ausente o
+        # None equivale a vacío
+        categoria = item.get('category') or {}
+        item_categoria = item.get('itemCategory') or {}
+        inventario = item.get('inventory') or {}
+        precios = item.get('price') or []
+        impuestos = item.get('tax') or []
+        
         # Obtener precio principal
         precio_principal = 0
         moneda = ""
         lista_precios = ""
         
-        precios = item.get('price', [])
         if precios:
-            precio_main = next((p for p in precios if p.get('main')), precios[0])
+            # La mayoría de items tiene un solo precio; solo se busca el principal si hay varios
+            precio_main = precios[0] if len(precios) == 1 else next((p for p in precios if p.get('main')), precios[0])
             precio_principal = precio_main.get('price', 0)
             moneda = precio_main.get('currency', {}).get('code', '')
             lista_precios = precio_main.get('name', '')
         
         # Obtener información de impuestos
-        impuestos_info = procesar_impuestos_item(item.get('tax', []))
+        impuestos_info = procesar_impuestos_item(impuestos)
         
         # Datos procesados del item
         item_data = {
@@ -223,13 +224,13 @@ def procesar_item_alegra(item, logger):
             'Clave_Producto': item.get('productKey', ''),
             
             # Categoría
-            'Categoria_ID': safe_get_nested(item, 'category', 'id', default=''),
-            'Categoria_Nombre': safe_get_nested(item, 'category', 'name', default=''),
+            'Categoria_ID': categoria.get('id') or '',
+            'Categoria_Nombre': categoria.get('name') or '',
             
             # Categoría de Item
-            'Item_Categoria_ID': safe_get_nested(item, 'itemCategory', 'id', default=''),
-            'Item_Categoria_Nombre': safe_get_nested(item, 'itemCategory', 'name', default=''),
-            'Item_Categoria_Descripcion': safe_get_nested(item, 'itemCategory', 'description', default=''),
+            'Item_Categoria_ID': item_categoria.get('id') or '',
+            'Item_Categoria_Nombre': item_categoria.get('name') or '',
+            'Item_Categoria_Descripcion': item_categoria.get('description') or '',
             
             # Precio
             'Precio_Principal': precio_principal,
@@ -237,11 +238,11 @@ def procesar_item_alegra(item, logger):
             'Lista_Precios': lista_precios,
             
             # Inventario
-            'Unidad_Medida': safe_get_nested(item, 'inventory', 'unit', default=''),
-            'Cantidad_Inicial': safe_get_nested(item, 'inventory', 'initialQuantity', default=0),
-            'Cantidad_Disponible': safe_get_nested(item, 'inventory', 'availableQuantity', default=0),
-            'Costo_Unitario': safe_get_nested(item, 'inventory', 'unitCost', default=0),
-            'Fecha_Cantidad_Inicial': safe_get_nested(item, 'inventory', 'initialQuantityDate', default=''),
+            'Unidad_Medida': inventario.get('unit') or '',
+            'Cantidad_Inicial': inventario.get('initialQuantity') or 0,
+            'Cantidad_Disponible': inventario.get('availableQuantity') or 0,
+            'Costo_Unitario': inventario.get('unitCost') or 0,
+            'Fecha_Cantidad_Inicial': inventario.get('initialQuantityDate') or '',
             
             # Configuración
             'Escala_Calculo': item.get('calculationScale', 0),
@@ -251,11 +252,11 @@ def procesar_item_alegra(item, logger):
             'IVA_Porcentaje': impuestos_info['iva_porcentaje'],
             'IVA_Tipo': impuestos_info['iva_tipo'],
             'Otros_Impuestos': impuestos_info['otros_impuestos'],
-            'Total_Impuestos': len(item.get('tax', [])),
+            'Total_Impuestos': len(impuestos),
             
             # Contadores
-            'Cantidad_Precios': len(item.get('price', [])),
-            'Cantidad_Campos_Personalizados': len(item.get('customFields', [])),
+            'Cantidad_Precios': len(precios),
+            'Cantidad_Campos_Personalizados': len(item.get('customFields') or []),
         }
         
         return item_data
@@ -266,6 +267,9 @@ def procesar_item_alegra(item, logger):
 
 def procesar_impuestos_item(impuestos):
     """Procesar información de impuestos de un item"""
+    if not impuestos:
+        return IMPUESTOS_VACIOS
+    
     iva_porcentaje = 0
     iva_tipo = ""
     otros_impuestos = []
@@ -288,57 +292,17 @@ def procesar_impuestos_item(impuestos):
         'otros_impuestos': ' | '.join(otros_impuestos)
     }
 
-def safe_get_nested(obj, *keys, default=''):
-    """Función helper para obtener valores anidados de forma segura"""
-    for key in keys:
-        if isinstance(obj, dict) and key in obj and obj[key] is not None:
-            obj = obj[key]
-        else:
-            return default
-    return obj if obj is not None else default
-
-def subir_items_sharepoint(items_procesados, site_url, list_name, logger):
-    """Subir items a SharePoint"""
+def resolver_lista_sharepoint(site_url, list_name, logger):
+    """
+    Resolver el conector y los IDs del sitio y la lista destino (una sola vez
+    para toda la subida).
+    
+    Returns:
+        Tupla (sp_connector, site_id, list_id), o None si la lista no está disponible
+    """
     try:
-        logger.info("Iniciando subida a SharePoint...")
-        
         sp_connector = SharePointConnector()
         
-        success_count = 0
-        error_count = 0
-        
-        for i, item_data in enumerate(items_procesados):
-            try:
-                nombre_item = item_data.get('Nombre', f"Item-{item_data.get('ID_Item')}")
-                logger.info(f"Subiendo item {i + 1}/{len(items_procesados)}: {nombre_item}")
-                
-                item_id = send_item_sharepoint(sp_connector, item_data, site_url, list_name, logger)
-                
-                if item_id:
-                    success_count += 1
-                    logger.info(f"Item {nombre_item} subido con ID: {item_id}")
-                else:
-                    error_count += 1
-                    logger.error(f"Error subiendo item {nombre_item}")
-                    
-            except Exception as e:
-                error_count += 1
-                logger.error(f"Error procesando item {i + 1}: {str(e)}")
-                continue
-        
-        logger.info("RESUMEN DE SUBIDA A SHAREPOINT:")
-        logger.info(f"Items exitosos: {success_count}")
-        logger.info(f"Items con errores: {error_count}")
-        
-        return success_count > 0
-        
-    except Exception as e:
-        logger.error(f"Error durante subida a SharePoint: {str(e)}")
-        return False
-
-def send_item_sharepoint(sp_connector, item_data, site_url, list_name, logger):
-    """Subir un item individual a lista de SharePoint"""
-    try:
         token = sp_connector.get_azure_token()
         site_id = sp_connector.get_site_id(token, site_url)
         list_id = sp_connector.get_list_id(token, site_id, list_name)
@@ -347,49 +311,99 @@ def send_item_sharepoint(sp_connector, item_data, site_url, list_name, logger):
             logger.error(f"No se pudo obtener el ID de la lista {list_name}")
             return None
         
-        # Preparar datos para SharePoint según las columnas de tu lista
-        sharepoint_data = {
-            'fields': {
-                "Title": item_data.get("Nombre", ""),
-                "Categoria": item_data.get("Item_Categoria_Nombre", ""),
-                "Precio_x0020_Principal": item_data.get("Precio_Principal", 0),
-                # Mapear otros campos según las columnas que veo en tu captura:
-                # - Modificado
-                # - Creado  
-                # - Creado por
-                # - Modificado por
-                # Estos campos se llenan automáticamente por SharePoint
-            }
-        }
+        return sp_connector, site_id, list_id
         
-        url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
+    except Exception as e:
+        logger.error(f"Error resolviendo la lista {list_name} en SharePoint: {str(e)}")
+        return None
+
+def subir_items_sharepoint(items_procesados, sp_connector, site_id, list_id, logger):
+    """
+    Subir items a SharePoint.
+    
+    items_procesados puede ser cualquier iterable (por ejemplo el generador de
+    procesar_paginas_items); se consume a medida que se arman los lotes.
+    """
+    try:
+        logger.info("Iniciando subida a SharePoint...")
         
-        response = requests.post(url, headers=headers, json=sharepoint_data)
+        conteo = {'lotes': 0, 'exitosos': 0, 'errores': 0}
+        pendientes = {}
         
-        if response.status_code == 201:
-            created_item = response.json()
-            
-            # Obtener ID del item creado
-            item_id = None
-            if 'id' in created_item:
-                item_id = created_item['id']
-            elif 'fields' in created_item and 'id' in created_item['fields']:
-                item_id = created_item['fields']['id']
-            elif 'fields' in created_item and 'ID' in created_item['fields']:
-                item_id = created_item['fields']['ID']
+        # Subir en lotes de GRAPH_BATCH_SIZE items por solicitud $batch; cada lote
+        # se envía apenas se completa y, con MAX_LOTES_EN_VUELO pendientes, se
+        # espera a que termine alguno antes de seguir leyendo items, así solo los
+        # lotes en vuelo quedan en memoria
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for numero_lote, lote in enumerate(agrupar_en_lotes(items_procesados, GRAPH_BATCH_SIZE), 1):
+                pendientes[executor.submit(subir_lote_items, sp_connector, lote, site_id, list_id)] = (numero_lote, lote)
+                
+                if len(pendientes) >= MAX_LOTES_EN_VUELO:
+                    terminados, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                    for future in terminados:
+                        contabilizar_lote(future, *pendientes.pop(future), conteo, logger)
             
-            return item_id
-        else:
-            logger.error(f"Error HTTP subiendo item: {response.status_code} - {response.text}")
-            return None
+            for future in as_completed(list(pendientes)):
+                contabilizar_lote(future, *pendientes.pop(future), conteo, logger)
+        
+        if not conteo['lotes']:
+            logger.warning("No hay items para subir a SharePoint")
+            return True
+        
+        logger.info("RESUMEN DE SUBIDA A SHAREPOINT:")
+        logger.info(f"Lotes enviados: {conteo['lotes']}")
+        logger.info(f"Items exitosos: {conteo['exitosos']}")
+        logger.info(f"Items con errores: {conteo['errores']}")
+        
+        return conteo['exitosos'] > 0
         
     except Exception as e:
-        logger.error(f"Error subiendo item: {str(e)}")
-        return None
+        logger.error(f"Error durante subida a SharePoint: {str(e)}")
+        return False
+
+def agrupar_en_lotes(items, tamano):
+    """Generar listas de hasta tamano elementos consumiendo items a medida que se piden"""
+    lote = []
+    for item in items:
+        lote.append(item)
+        if len(lote) == tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def contabilizar_lote(future, numero_lote, lote, conteo, logger):
+    """Sumar en conteo el resultado de un lote ya terminado y registrar el progreso"""
+    conteo['lotes'] += 1
+    try:
+        resultados = future.result()
+    except Exception as e:
+        conteo['errores'] += len(lote)
+        logger.error(f"Error procesando lote {numero_lote}: {str(e)}")
+    else:
+        for item_data, item_id in zip(lote, resultados):
+            if item_id:
+                conteo['exitosos'] += 1
+                logger.debug("Item %s subido con ID: %s", item_data.get('Nombre'), item_id)
+            else:
+                conteo['errores'] += 1
+                nombre_item = item_data.get('Nombre', f"Item-{item_data.get('ID_Item')}")
+                logger.error(f"Error subiendo item {nombre_item}")
+    
+    # Progreso agregado en lugar de una línea por item
+    if conteo['lotes'] % LOTES_POR_LOG_PROGRESO == 0:
+        logger.info(f"Progreso: {conteo['lotes']} lotes, {conteo['exitosos']} exitosos, {conteo['errores']} errores")
+
+def subir_lote_items(sp_connector, lote, site_id, list_id):
+    """Subir un lote de items con una solicitud $batch"""
+    items_data = [construir_item_sharepoint(item_data) for item_data in lote]
+    token = sp_connector.get_azure_token()
+    return sp_connector.batch_create_items(token, site_id, list_id, items_data)
+
+def construir_item_sharepoint(item_data):
+    """Construir el payload de SharePoint para un item según las columnas de la lista"""
+    # Modificado, Creado, Creado por y Modificado por los llena SharePoint
+    return {'fields': {columna: item_data.get(clave, defecto) for columna, clave, defecto in CAMPOS_ITEM}}
 
 if __name__ == "__main__":
     success = main()
@@ -1,14 +1,16 @@
 import os
 import sys
 import logging
-import subprocess
+import importlib
+import time
 from datetime import datetime
+from itertools import groupby
+from multiprocessing import Pool, TimeoutError
 from dotenv import load_dotenv
 
 def setup_logging():
     """Configurar logging para el main"""
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
+    os.makedirs('logs', exist_ok=True)
     
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     log_filename = f"logs/main_ingresos_{timestamp}.log"
@@ -24,39 +26,60 @@ def setup_logging():
     
     return log_filename
 
-def ejecutar_script(script_path, nombre_script, logger):
-    """Ejecutar un script individual y capturar su resultado"""
-    logger.info(f"Iniciando ejecución de {nombre_script}...")
+# Tiempo máximo por etapa (30 minutos), como el timeout que tenía cada subprocess
+TIMEOUT_SCRIPT = 1800
+
+def ejecutar_modulo(modulo):
+    """
+    Ejecutar el main() de un módulo de ingresos dentro de un proceso del pool.
+    
+    Se quitan los handlers heredados del proceso principal para que el
+    setup_logging del script configure su propio archivo de log, igual que
+    cuando se ejecuta por separado.
+    """
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    
+    return bool(importlib.import_module(modulo).main())
+
+def ejecutar_etapa(scripts_etapa, logger):
+    """
+    Ejecutar en paralelo los scripts de una etapa, cada uno en su propio proceso.
+    
+    Returns:
+        Diccionario {nombre del script: True/False}
+    """
+    resultados = {}
+    pool = Pool(processes=len(scripts_etapa))
     
     try:
-        # Ejecutar el script como subprocess
-        result = subprocess.run([
-            sys.executable, script_path
-        ], 
-        capture_output=True, 
-        text=True, 
-        timeout=1800  # 30 minutos de timeout
-        )
+        tareas = []
+        for script_config in scripts_etapa:
+            logger.info(f"Iniciando ejecución de {script_config['name']}...")
+            tareas.append((script_config['name'], pool.apply_async(ejecutar_modulo, (script_config['module'],))))
+        pool.close()
         
-        if result.returncode == 0:
-            logger.info(f" {nombre_script} completado exitosamente")
-            if result.stdout:
-                logger.info(f"Output: {result.stdout.strip()}")
-            return True
-        else:
-            logger.error(f" {nombre_script} falló con código: {result.returncode}")
-            if result.stderr:
-                logger.error(f"Error: {result.stderr.strip()}")
-            if result.stdout:
-                logger.info(f"Output: {result.stdout.strip()}")
-            return False
-            
-    except subprocess.TimeoutExpired:
-        logger.error(f" {nombre_script} excedió el tiempo límite (30 min)")
-        return False
-    except Exception as e:
-        logger.error(f" Error ejecutando {nombre_script}: {str(e)}")
-        return False
+        limite = time.monotonic() + TIMEOUT_SCRIPT
+        for nombre_script, tarea in tareas:
+            try:
+                resultados[nombre_script] = tarea.get(timeout=max(0, limite - time.monotonic()))
+                if resultados[nombre_script]:
+                    logger.info(f" {nombre_script} completado exitosamente")
+                else:
+                    logger.error(f" {nombre_script} terminó con errores")
+            except TimeoutError:
+                logger.error(f" {nombre_script} excedió el tiempo límite (30 min)")
+                resultados[nombre_script] = False
+            except Exception as e:
+                logger.error(f" Error ejecutando {nombre_script}: {str(e)}")
+                resultados[nombre_script] = False
+    finally:
+        # Termina los procesos que hayan excedido el tiempo límite
+        pool.terminate()
+        pool.join()
+    
+    return resultados
 
 def main():
     """Función principal que ejecuta todos los scripts de ingresos"""
@@ -73,20 +96,28 @@ def main():
     load_dotenv()
     logger.info("Variables de entorno cargadas")
     
-    # Definir scripts a ejecutar en orden
+    # Definir scripts a ejecutar; los de una misma etapa son independientes y
+    # corren en paralelo, y cada etapa espera a que termine la anterior (el
+    # sincronizador trabaja sobre las facturas y pagos recién subidos)
     scripts_config = [
         {
             'path': 'ingresos/facturas_venta.py',
+            'module': 'ingresos.facturas_venta',
+            'etapa': 1,
             'name': 'Facturas de Venta',
             'description': 'Extrae facturas diarias desde Alegra'
         },
         {
             'path': 'ingresos/pagos_ingresos.py', 
+            'module': 'ingresos.pagos_ingresos',
+            'etapa': 1,
             'name': 'Pagos de Ingresos',
             'description': 'Extrae pagos diarios desde Alegra'
         },
         {
             'path': 'ingresos/sincronizador_alegra_sharepoint.py',
+            'module': 'ingresos.sincronizador_alegra_sharepoint',
+            'etapa': 2,
             'name': 'Sincronizador',
             'description': 'Sincroniza pagos sin cliente asignado'
         }
@@ -100,35 +131,44 @@ def main():
     scripts_exitosos = 0
     scripts_fallidos = 0
     
-    # Ejecutar cada script
-    for i, script_config in enumerate(scripts_config, 1):
-        script_path = script_config['path']
-        script_name = script_config['name']
-        script_desc = script_config['description']
+    # Ejecutar cada etapa
+    for etapa, grupo in groupby(enumerate(scripts_config, 1), key=lambda par: par[1]['etapa']):
+        scripts_etapa = []
         
-        print(f"[{i}/{total_scripts}] Ejecutando: {script_name}")
-        print(f"    Descripción: {script_desc}")
-        
-        logger.info(f"[{i}/{total_scripts}] Iniciando {script_name}")
-        logger.info(f"Archivo: {script_path}")
-        logger.info(f"Descripción: {script_desc}")
+        for i, script_config in grupo:
+            script_path = script_config['path']
+            script_name = script_config['name']
+            script_desc = script_config['description']
+            
+            print(f"[{i}/{total_scripts}] Ejecutando: {script_name}")
+            print(f"    Descripción: {script_desc}")
+            
+            logger.info(f"[{i}/{total_scripts}] Iniciando {script_name} (etapa {etapa})")
+            logger.info(f"Archivo: {script_path}")
+            logger.info(f"Descripción: {script_desc}")
+            
+            # Verificar que el archivo existe
+            if not os.path.exists(script_path):
+                logger.error(f" Archivo no encontrado: {script_path}")
+                print(f"     ERROR: Archivo no encontrado")
+                scripts_fallidos += 1
+                continue
+            
+            scripts_etapa.append(script_config)
         
-        # Verificar que el archivo existe
-        if not os.path.exists(script_path):
-            logger.error(f" Archivo no encontrado: {script_path}")
-            print(f"     ERROR: Archivo no encontrado")
-            scripts_fallidos += 1
+        if not scripts_etapa:
             continue
         
-        # Ejecutar script
-        success = ejecutar_script(script_path, script_name, logger)
+        # Ejecutar scripts de la etapa
+        resultados = ejecutar_etapa(scripts_etapa, logger)
         
-        if success:
-            scripts_exitosos += 1
-            print(f"     Completado exitosamente")
-        else:
-            scripts_fallidos += 1
-            print(f"     Falló - Ver log para detalles")
+        for script_name, success in resultados.items():
+            if success:
+                scripts_exitosos += 1
+                print(f"     {script_name}: completado exitosamente")
+            else:
+                scripts_fallidos += 1
+                print(f"     {script_name}: falló - Ver log para detalles")
         
         print()  # Línea en blanco para separar
         logger.info("-" * 40)
@@ -192,8 +232,8 @@ def mostrar_ayuda():
     print()
     print("Scripts que se ejecutarán:")
     print("  1. facturas_venta.py        - Extrae facturas diarias")
-    print("  2. pagos_ingresos.py        - Extrae pagos diarios") 
-    print("  3. sincronizador_alegra_sharepoint.py - Sincroniza datos")
+    print("  2. pagos_ingresos.py        - Extrae pagos diarios (en paralelo con 1)") 
+    print("  3. sincronizador_alegra_sharepoint.py - Sincroniza datos (al terminar 1 y 2)")
     print()
     print("Requisitos:")
     print("  - Archivo .env configurado")